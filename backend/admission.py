@@ -0,0 +1,164 @@
+"""
+Admission control for LLM-bound chat turns.
+
+At most ADMISSION_MAX_CONCURRENT turns run at once, and at most
+ADMISSION_PER_CHAT (default 1) per chat. Other turns wait in a bounded FIFO
+queue; a waiter whose chat is busy does not block waiters for other chats.
+Requests are shed with ``429 Too Many Requests`` and a ``Retry-After`` hint when
+- the queue already holds ADMISSION_MAX_QUEUE waiters,
+- the estimated wait (from the recent average turn time) exceeds the time left
+  before the request's deadline (ADMISSION_MAX_WAIT_SECONDS), or
+- the deadline passes while still queued.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from time import monotonic
+
+from fastapi import HTTPException
+
+import metrics
+
+queue_depth = metrics.REGISTRY.gauge(
+    "admission_queue_depth", "Chat turns waiting for an LLM slot"
+)
+in_flight = metrics.REGISTRY.gauge("admission_in_flight", "Chat turns holding a slot")
+shed = metrics.REGISTRY.counter("admission_shed_total", "Chat turns rejected with 429")
+wait_time = metrics.REGISTRY.histogram(
+    "admission_wait_seconds", "Time chat turns spent queued before admission"
+)
+
+
+@dataclass
+class _Waiter:
+    chat_id: str
+    future: asyncio.Future = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int,
+        per_chat: int = 1,
+        max_queue: int = 64,
+        max_wait: float = 10.0,
+    ):
+        self.max_concurrent = max_concurrent
+        self.per_chat = per_chat
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.active_by_chat: dict[str, int] = {}
+        self.waiters: deque[_Waiter] = deque()
+        self.avg_turn_seconds = 1.0  # EWMA of admitted turn durations
+
+    def _can_run(self, chat_id: str) -> bool:
+        return (
+            self.active < self.max_concurrent
+            and self.active_by_chat.get(chat_id, 0) < self.per_chat
+        )
+
+    def _acquire(self, chat_id: str) -> None:
+        self.active += 1
+        self.active_by_chat[chat_id] = self.active_by_chat.get(chat_id, 0) + 1
+        in_flight.set(self.active)
+
+    def _release(self, chat_id: str) -> None:
+        self.active -= 1
+        remaining = self.active_by_chat[chat_id] - 1
+        if remaining:
+            self.active_by_chat[chat_id] = remaining
+        else:
+            del self.active_by_chat[chat_id]
+        in_flight.set(self.active)
+        self._grant()
+
+    def _grant(self) -> None:
+        """Hand free slots to the oldest waiters whose chat is not at its cap."""
+        for waiter in list(self.waiters):
+            if self.active >= self.max_concurrent:
+                break
+            if waiter.future.done() or not self._can_run(waiter.chat_id):
+                continue
+            self.waiters.remove(waiter)
+            self._acquire(waiter.chat_id)
+            waiter.future.set_result(None)
+        queue_depth.set(len(self.waiters))
+
+    def estimated_wait(self) -> float:
+        return (len(self.waiters) + 1) * self.avg_turn_seconds / self.max_concurrent
+
+    def _reject(self, reason: str, retry_after: float) -> HTTPException:
+        shed.inc(reason=reason)
+        return HTTPException(
+            status_code=429,
+            detail="Server is busy, please retry",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    @asynccontextmanager
+    async def admit(
+        self, chat_id: str, timeout: float | None = None
+    ) -> AsyncIterator[None]:
+        """Hold a turn slot for `chat_id`, waiting at most `timeout` seconds."""
+        timeout = self.max_wait if timeout is None else timeout
+        queued_at = monotonic()
+        if self._can_run(chat_id) and not self.waiters:
+            self._acquire(chat_id)
+        else:
+            if len(self.waiters) >= self.max_queue:
+                raise self._reject("queue_full", self.estimated_wait())
+            estimate = self.estimated_wait()
+            if estimate > timeout:
+                raise self._reject("deadline", estimate)
+
+            waiter = _Waiter(chat_id)
+            self.waiters.append(waiter)
+            queue_depth.set(len(self.waiters))
+            self._grant()
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            except (TimeoutError, asyncio.CancelledError) as exc:
+                if waiter.future.done():
+                    # Granted just as we gave up: hand the slot back.
+                    self._release(chat_id)
+                else:
+                    waiter.future.cancel()
+                    self.waiters.remove(waiter)
+                    queue_depth.set(len(self.waiters))
+                if isinstance(exc, asyncio.CancelledError):
+                    raise
+                raise self._reject("timeout", self.estimated_wait()) from None
+        wait_time.observe(monotonic() - queued_at)
+
+        started = monotonic()
+        try:
+            yield
+        finally:
+            elapsed = monotonic() - started
+            self.avg_turn_seconds = 0.8 * self.avg_turn_seconds + 0.2 * elapsed
+            self._release(chat_id)
+
+
+_controller: AdmissionController | None = None
+
+
+def get_controller() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController(
+            max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "16")),
+            per_chat=int(os.getenv("ADMISSION_PER_CHAT", "1")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+            max_wait=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10")),
+        )
+    return _controller
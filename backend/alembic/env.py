@@ -27,7 +27,8 @@ target_metadata = Base.metadata
 
 
 def get_url():
-    return "sqlite:///./dev.db"
+    # One database per run; sharded setups migrate each shard with -x url=...
+    return context.get_x_argument(as_dictionary=True).get("url", "sqlite:///./dev.db")
 
 
 def run_migrations_offline() -> None:
@@ -0,0 +1,55 @@
+"""add job
+
+Revision ID: a3c7e9f1b5d2
+Revises: f2b6d8e1a3c5
+Create Date: 2026-10-19
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a3c7e9f1b5d2"
+down_revision: str | None = "f2b6d8e1a3c5"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "job",
+        sa.Column("id", sa.String(length=32), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("chat_id", sa.String(), nullable=False),
+        sa.Column("payload", sa.LargeBinary(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("lease_owner", sa.String(), nullable=True),
+        sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+        sa.Column("result", sa.LargeBinary(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_job_chat_id"), "job", ["chat_id"], unique=False)
+    op.create_index(op.f("ix_job_created_at"), "job", ["created_at"], unique=False)
+    op.create_index(op.f("ix_job_id"), "job", ["id"], unique=False)
+    op.create_index(
+        op.f("ix_job_lease_expires_at"), "job", ["lease_expires_at"], unique=False
+    )
+    op.create_index(op.f("ix_job_status"), "job", ["status"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_job_status"), table_name="job")
+    op.drop_index(op.f("ix_job_lease_expires_at"), table_name="job")
+    op.drop_index(op.f("ix_job_id"), table_name="job")
+    op.drop_index(op.f("ix_job_created_at"), table_name="job")
+    op.drop_index(op.f("ix_job_chat_id"), table_name="job")
+    op.drop_table("job")
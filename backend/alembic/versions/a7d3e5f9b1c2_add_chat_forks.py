@@ -0,0 +1,32 @@
+"""add chat.parent_id and chat.fork_at
+
+Revision ID: a7d3e5f9b1c2
+Revises: c4e8a1d7f3b9
+Create Date: 2026-10-19
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a7d3e5f9b1c2"
+down_revision: str | None = "c4e8a1d7f3b9"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column("chat", sa.Column("parent_id", sa.String(length=32), nullable=True))
+    op.add_column("chat", sa.Column("fork_at", sa.Integer(), nullable=True))
+    op.create_index(op.f("ix_chat_parent_id"), "chat", ["parent_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_chat_parent_id"), table_name="chat")
+    with op.batch_alter_table("chat") as batch_op:
+        batch_op.drop_column("fork_at")
+        batch_op.drop_column("parent_id")
@@ -0,0 +1,39 @@
+"""add outbox_event lease columns
+
+Revision ID: b2f4c6e8a0d1
+Revises: a7d3e5f9b1c2
+Create Date: 2026-10-19
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b2f4c6e8a0d1"
+down_revision: str | None = "a7d3e5f9b1c2"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column("outbox_event", sa.Column("lease_owner", sa.String(), nullable=True))
+    op.add_column(
+        "outbox_event", sa.Column("lease_expires_at", sa.DateTime(), nullable=True)
+    )
+    op.create_index(
+        op.f("ix_outbox_event_lease_expires_at"),
+        "outbox_event",
+        ["lease_expires_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_outbox_event_lease_expires_at"), table_name="outbox_event")
+    with op.batch_alter_table("outbox_event") as batch_op:
+        batch_op.drop_column("lease_expires_at")
+        batch_op.drop_column("lease_owner")
@@ -0,0 +1,98 @@
+"""store chat messages as compressed bytes
+
+Revision ID: c41a7e2b9d10
+Revises: 9b3f1c2d4e6a
+Create Date: 2026-10-19
+
+"""
+
+import json
+import os
+import zlib
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c41a7e2b9d10"
+down_revision: str | None = "9b3f1c2d4e6a"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+CHUNK_SIZE = 500
+ZLIB_TAG = b"z"
+
+chat = sa.table(
+    "chat",
+    sa.column("id", sa.String),
+    sa.column("messages", sa.LargeBinary),
+)
+
+
+def _encode(value) -> bytes:
+    """A copy of `models.encode_json` as of this revision."""
+    raw = json.dumps(value, separators=(",", ":")).encode()
+    if os.getenv("CHAT_MESSAGES_CODEC", "zlib") == "zlib":
+        return ZLIB_TAG + zlib.compress(raw)
+    return raw
+
+
+def _decode(value: bytes | str) -> bytes:
+    """The stored value as plain JSON bytes, decompressed if needed."""
+    if isinstance(value, str):
+        return value.encode()
+    if value[:1] == ZLIB_TAG:
+        return zlib.decompress(value[1:])
+    return bytes(value)
+
+
+def _convert_rows(convert) -> None:
+    """Rewrite chat.messages in id-ordered chunks to keep memory bounded."""
+    conn = op.get_bind()
+    last_id = ""
+    while True:
+        rows = conn.execute(
+            sa.select(chat.c.id, chat.c.messages)
+            .where(chat.c.id > last_id)
+            .order_by(chat.c.id)
+            .limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        updates = [
+            {"b_id": row.id, "b_messages": convert(row.messages)}
+            for row in rows
+            if row.messages is not None
+        ]
+        if updates:
+            conn.execute(
+                chat.update()
+                .where(chat.c.id == sa.bindparam("b_id"))
+                .values(messages=sa.bindparam("b_messages")),
+                updates,
+            )
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("chat") as batch_op:
+        batch_op.alter_column(
+            "messages",
+            type_=sa.LargeBinary(),
+            existing_type=sa.JSON(),
+            postgresql_using="convert_to(messages::text, 'UTF8')",
+        )
+    _convert_rows(lambda value: _encode(json.loads(_decode(value))))
+
+
+def downgrade() -> None:
+    _convert_rows(_decode)
+    with op.batch_alter_table("chat") as batch_op:
+        batch_op.alter_column(
+            "messages",
+            type_=sa.JSON(),
+            existing_type=sa.LargeBinary(),
+            postgresql_using="convert_from(messages, 'UTF8')::json",
+        )
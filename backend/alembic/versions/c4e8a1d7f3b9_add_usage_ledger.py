@@ -0,0 +1,71 @@
+"""add usage ledger
+
+Revision ID: c4e8a1d7f3b9
+Revises: b8d4f2a6c1e3
+Create Date: 2026-10-19
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e8a1d7f3b9"
+down_revision: str | None = "b8d4f2a6c1e3"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+COUNTERS = (
+    "turns",
+    "calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+    "llm_ms",
+    "tool_calls",
+    "template_replies",
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "usage_turn",
+        sa.Column("id", sa.String(length=32), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("chat_id", sa.String(), nullable=False),
+        sa.Column("calls", sa.JSON(), nullable=False),
+        sa.Column("tools", sa.JSON(), nullable=False),
+        sa.Column("reply", sa.String(), nullable=True),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=False),
+        sa.Column("completion_tokens", sa.Integer(), nullable=False),
+        sa.Column("cached_tokens", sa.Integer(), nullable=False),
+        sa.Column("llm_ms", sa.Integer(), nullable=False),
+        sa.Column("total_ms", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_usage_turn_id"), "usage_turn", ["id"], unique=False)
+    op.create_index(
+        op.f("ix_usage_turn_created_at"), "usage_turn", ["created_at"], unique=False
+    )
+    op.create_index(
+        op.f("ix_usage_turn_chat_id"), "usage_turn", ["chat_id"], unique=False
+    )
+    op.create_table(
+        "usage_rollup",
+        sa.Column("day", sa.String(length=10), nullable=False),
+        sa.Column("dimension", sa.String(length=16), nullable=False),
+        sa.Column("key", sa.String(length=255), nullable=False),
+        *(sa.Column(name, sa.Integer(), nullable=False) for name in COUNTERS),
+        sa.PrimaryKeyConstraint("day", "dimension", "key"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("usage_rollup")
+    op.drop_index(op.f("ix_usage_turn_chat_id"), table_name="usage_turn")
+    op.drop_index(op.f("ix_usage_turn_created_at"), table_name="usage_turn")
+    op.drop_index(op.f("ix_usage_turn_id"), table_name="usage_turn")
+    op.drop_table("usage_turn")
@@ -0,0 +1,30 @@
+"""unique audit_revision version per entity
+
+Revision ID: c9e1a3b5d7f2
+Revises: b2f4c6e8a0d1
+Create Date: 2026-10-19
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c9e1a3b5d7f2"
+down_revision: str | None = "b2f4c6e8a0d1"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_audit_revision_entity_version",
+        "audit_revision",
+        ["entity_type", "entity_id", "version"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_audit_revision_entity_version", table_name="audit_revision")
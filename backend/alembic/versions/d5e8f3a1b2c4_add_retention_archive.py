@@ -0,0 +1,69 @@
+"""add chat.updated_at and archive_entry
+
+Revision ID: d5e8f3a1b2c4
+Revises: c41a7e2b9d10
+Create Date: 2026-10-19
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d5e8f3a1b2c4"
+down_revision: str | None = "c41a7e2b9d10"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column("chat", sa.Column("updated_at", sa.DateTime(), nullable=True))
+    op.create_index(op.f("ix_chat_updated_at"), "chat", ["updated_at"], unique=False)
+
+    op.create_table(
+        "archive_entry",
+        sa.Column("id", sa.String(length=32), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("record_id", sa.String(), nullable=False),
+        sa.Column("segment", sa.String(), nullable=False),
+        sa.Column("byte_offset", sa.Integer(), nullable=False),
+        sa.Column("byte_length", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_archive_entry_created_at"),
+        "archive_entry",
+        ["created_at"],
+        unique=False,
+    )
+    op.create_index(op.f("ix_archive_entry_id"), "archive_entry", ["id"], unique=False)
+    op.create_index(
+        op.f("ix_archive_entry_key"), "archive_entry", ["key"], unique=False
+    )
+    op.create_index(
+        op.f("ix_archive_entry_kind"), "archive_entry", ["kind"], unique=False
+    )
+    op.create_index(
+        op.f("ix_archive_entry_record_id"),
+        "archive_entry",
+        ["record_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_archive_entry_record_id"), table_name="archive_entry")
+    op.drop_index(op.f("ix_archive_entry_kind"), table_name="archive_entry")
+    op.drop_index(op.f("ix_archive_entry_key"), table_name="archive_entry")
+    op.drop_index(op.f("ix_archive_entry_id"), table_name="archive_entry")
+    op.drop_index(op.f("ix_archive_entry_created_at"), table_name="archive_entry")
+    op.drop_table("archive_entry")
+
+    op.drop_index(op.f("ix_chat_updated_at"), table_name="chat")
+    with op.batch_alter_table("chat") as batch_op:
+        batch_op.drop_column("updated_at")
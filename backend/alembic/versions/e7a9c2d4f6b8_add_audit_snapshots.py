@@ -0,0 +1,95 @@
+"""add audit revision versions, snapshots and parent ids
+
+Revision ID: e7a9c2d4f6b8
+Revises: d5e8f3a1b2c4
+Create Date: 2026-10-19
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e7a9c2d4f6b8"
+down_revision: str | None = "d5e8f3a1b2c4"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column("audit_revision", sa.Column("version", sa.Integer(), nullable=True))
+    op.add_column("audit_revision", sa.Column("snapshot", sa.JSON(), nullable=True))
+    op.add_column("audit_revision", sa.Column("parent_id", sa.String(), nullable=True))
+    op.create_index(
+        op.f("ix_audit_revision_version"), "audit_revision", ["version"], unique=False
+    )
+    op.create_index(
+        op.f("ix_audit_revision_parent_id"),
+        "audit_revision",
+        ["parent_id"],
+        unique=False,
+    )
+
+    # Number existing revisions per entity in creation order. Existing rows get no
+    # snapshot, so point-in-time reads replay them from the create revision.
+    op.execute(
+        """
+        UPDATE audit_revision SET version = (
+            SELECT COUNT(*) FROM audit_revision AS earlier
+            WHERE earlier.entity_type = audit_revision.entity_type
+              AND earlier.entity_id = audit_revision.entity_id
+              AND (earlier.created_at < audit_revision.created_at
+                   OR (earlier.created_at = audit_revision.created_at
+                       AND earlier.id <= audit_revision.id))
+        )
+        """
+    )
+    # Forms that still exist carry their chat id; deleted ones keep it in the
+    # delete revision's changes.
+    op.execute(
+        """
+        UPDATE audit_revision SET parent_id = (
+            SELECT chat_id FROM form_submission
+            WHERE form_submission.id = audit_revision.entity_id
+        )
+        WHERE entity_type = 'form_submission'
+        """
+    )
+    # Deleted forms: the chat the form was in at each revision, from the latest
+    # chat_id change up to it (the new value, or the old one for a delete).
+    # audit_change values are JSON-encoded.
+    if op.get_bind().dialect.name == "postgresql":
+        new, old = "ch.new_value #>> '{}'", "ch.old_value #>> '{}'"
+    else:
+        new = "json_extract(ch.new_value, '$')"
+        old = "json_extract(ch.old_value, '$')"
+    op.execute(
+        f"""
+        UPDATE audit_revision SET parent_id = (
+            SELECT COALESCE({new}, {old})
+            FROM audit_change AS ch
+            JOIN audit_revision AS rev ON rev.id = ch.revision_id
+            WHERE rev.entity_type = audit_revision.entity_type
+              AND rev.entity_id = audit_revision.entity_id
+              AND ch.field = 'chat_id'
+              AND (rev.created_at < audit_revision.created_at
+                   OR (rev.created_at = audit_revision.created_at
+                       AND rev.id <= audit_revision.id))
+            ORDER BY rev.created_at DESC, rev.id DESC
+            LIMIT 1
+        )
+        WHERE entity_type = 'form_submission' AND parent_id IS NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_audit_revision_parent_id"), table_name="audit_revision")
+    op.drop_index(op.f("ix_audit_revision_version"), table_name="audit_revision")
+    with op.batch_alter_table("audit_revision") as batch_op:
+        batch_op.drop_column("parent_id")
+        batch_op.drop_column("snapshot")
+        batch_op.drop_column("version")
@@ -0,0 +1,66 @@
+"""add outbox_event
+
+Revision ID: f2b6d8e1a3c5
+Revises: e7a9c2d4f6b8
+Create Date: 2026-10-19
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f2b6d8e1a3c5"
+down_revision: str | None = "e7a9c2d4f6b8"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "outbox_event",
+        sa.Column("id", sa.String(length=32), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("aggregate_type", sa.String(), nullable=False),
+        sa.Column("aggregate_id", sa.String(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=True),
+        sa.Column("event_type", sa.String(), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.Column("delivered_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_outbox_event_aggregate_id"),
+        "outbox_event",
+        ["aggregate_id"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_outbox_event_created_at"), "outbox_event", ["created_at"], unique=False
+    )
+    op.create_index(op.f("ix_outbox_event_id"), "outbox_event", ["id"], unique=False)
+    op.create_index(
+        op.f("ix_outbox_event_next_attempt_at"),
+        "outbox_event",
+        ["next_attempt_at"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_outbox_event_status"), "outbox_event", ["status"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_outbox_event_status"), table_name="outbox_event")
+    op.drop_index(op.f("ix_outbox_event_next_attempt_at"), table_name="outbox_event")
+    op.drop_index(op.f("ix_outbox_event_id"), table_name="outbox_event")
+    op.drop_index(op.f("ix_outbox_event_created_at"), table_name="outbox_event")
+    op.drop_index(op.f("ix_outbox_event_aggregate_id"), table_name="outbox_event")
+    op.drop_table("outbox_event")
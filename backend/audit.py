@@ -2,22 +2,39 @@
 
 from __future__ import annotations
 
+import os
+import secrets
 from collections.abc import Iterable
-from datetime import UTC, datetime
+from datetime import datetime
 from typing import Any
 
+from sqlalchemy import event, func, insert, inspect, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 
-from models import AuditChange, AuditRevision
+import database
+import events
+import outbox
+import retention
+from models import AuditChange, AuditRevision, utcnow
 
+# Models whose rows `track`ed sessions audit, by table, with the fields their
+# revisions record (in change order).
+AUDITED_FIELDS: dict[str, tuple[str, ...]] = {
+    "form_submission": ("name", "email", "phone_number", "status", "chat_id"),
+}
+# Tries at writing a revision whose version a concurrent writer keeps taking.
+VERSION_ATTEMPTS = 5
 
-async def log_revision(
-    db: AsyncSession,
+
+def get_snapshot_every() -> int:
+    return int(os.getenv("AUDIT_SNAPSHOT_EVERY", "10"))
+
+
+def track(
+    db: AsyncSession | Session,
     *,
-    entity_type: str,
-    entity_id: str,
-    event_type: str,
-    changes: Iterable[dict[str, Any]],
     source: str | None = None,
     actor_type: str | None = None,
     actor_id: str | None = None,
@@ -25,34 +42,338 @@ async def log_revision(
     request_id: str | None = None,
 ) -> None:
     """
-    Best-effort audit logging.
-    This intentionally commits in its own transaction to keep main logic simple.
-    """
-    now = datetime.now(UTC).replace(tzinfo=None)
-
-    revision = AuditRevision(
-        created_at=now,
-        entity_type=entity_type,
-        entity_id=entity_id,
-        event_type=event_type,
-        source=source,
-        actor_type=actor_type,
-        actor_id=actor_id,
-        reason=reason,
-        request_id=request_id,
-    )
-    db.add(revision)
-    await db.flush()  # assigns revision.id
-
-    for ch in changes:
-        db.add(
-            AuditChange(
-                created_at=now,
-                revision_id=revision.id,
-                field=ch["field"],
-                old_value=ch.get("old_value"),
-                new_value=ch.get("new_value"),
+    Audit every later flush of this session: each audited row it inserts,
+    updates or deletes gets a revision, its changes and an outbox event, written
+    in the same flush from the attribute history (see `_capture`).
+    """
+    db.info["audit"] = {
+        "source": source,
+        "actor_type": actor_type,
+        "actor_id": actor_id,
+        "reason": reason,
+        "request_id": request_id,
+    }
+
+
+def _changes(instance: Any, event_type: str) -> list[dict[str, Any]]:
+    fields = AUDITED_FIELDS[instance.__tablename__]
+    if event_type == "create":
+        return [
+            {"field": f, "old_value": None, "new_value": getattr(instance, f)}
+            for f in fields
+        ]
+    if event_type == "delete":
+        return [
+            {"field": f, "old_value": getattr(instance, f), "new_value": None}
+            for f in fields
+        ]
+    changes = []
+    attrs = inspect(instance).attrs
+    for f in fields:
+        history = attrs[f].history
+        if history.has_changes():
+            changes.append(
+                {
+                    "field": f,
+                    "old_value": history.deleted[0] if history.deleted else None,
+                    "new_value": history.added[0] if history.added else None,
+                }
             )
+    return changes
+
+
+def _last_versions(
+    session: Session, entity_type: str, entity_ids: list[str]
+) -> dict[str, int]:
+    if not entity_ids:
+        return {}
+    rows = session.execute(
+        select(AuditRevision.entity_id, func.max(AuditRevision.version))
+        .where(
+            AuditRevision.entity_type == entity_type,
+            AuditRevision.entity_id.in_(entity_ids),
+        )
+        .group_by(AuditRevision.entity_id)
+    )
+    # Grouped per entity, so fanned-out shards never return a row for the same one.
+    return {entity_id: version or 0 for entity_id, version in rows}
+
+
+@event.listens_for(Session, "before_flush")
+def _capture(session: Session, flush_context, instances) -> None:
+    """Note the audited rows this flush writes; `_record` adds their revisions."""
+    context = session.info.get("audit")
+    if context is None:
+        return
+    pending = session.info.setdefault("audit_pending", [])
+    for event_type, instances in (
+        ("create", session.new),
+        ("update", session.dirty),
+        ("delete", session.deleted),
+    ):
+        for instance in instances:
+            if getattr(instance, "__tablename__", None) not in AUDITED_FIELDS:
+                continue
+            if event_type == "create" and instance.id is None:
+                instance.id = secrets.token_urlsafe()  # the column default, early
+            changes = _changes(instance, event_type)
+            if changes:
+                pending.append((instance, event_type, changes))
+
+
+def _revision_rows(
+    pending: list, context: dict[str, Any], now: datetime
+) -> list[tuple[dict[str, Any], list[dict[str, Any]]]]:
+    """Revision rows (versions still unset) and their change rows, per instance."""
+    rows = []
+    for instance, event_type, changes in pending:
+        revision = {
+            "id": secrets.token_urlsafe(),
+            "created_at": now,
+            "entity_type": instance.__tablename__,
+            "entity_id": instance.id,
+            "event_type": event_type,
+            "parent_id": instance.chat_id,
+            **context,
+        }
+        change_rows = [
+            {
+                "id": secrets.token_urlsafe(),
+                "created_at": now,
+                "revision_id": revision["id"],
+                **ch,
+            }
+            for ch in changes
+        ]
+        rows.append((revision, change_rows))
+    return rows
+
+
+def _number(session: Session, pending: list, rows: list, now: datetime) -> None:
+    """
+    Give each revision the version after its entity's latest one, read after the
+    flush wrote the audited rows (so updates and deletes hold their row locks),
+    with one lookup per audited model; and a snapshot where one is due.
+    """
+    versions: dict[tuple[str, str], int] = {}
+    for entity_type in {instance.__tablename__ for instance, _, _ in pending}:
+        ids = [
+            instance.id
+            for instance, event_type, _ in pending
+            if event_type != "create" and instance.__tablename__ == entity_type
+        ]
+        for entity_id, version in _last_versions(session, entity_type, ids).items():
+            versions[entity_type, entity_id] = version
+
+    for (instance, event_type, _), (revision, _) in zip(pending, rows, strict=True):
+        entity_type = instance.__tablename__
+        revision["version"] = version = versions.get((entity_type, instance.id), 0) + 1
+        revision["snapshot"] = None
+        if event_type == "create" or (
+            event_type == "update" and version % get_snapshot_every() == 0
+        ):
+            created_at = instance.created_at or now
+            revision["snapshot"] = {
+                "created_at": created_at.isoformat(),
+                **{f: getattr(instance, f) for f in AUDITED_FIELDS[entity_type]},
+            }
+
+
+@event.listens_for(Session, "after_flush")
+def _record(session: Session, flush_context) -> None:
+    """
+    Write the revisions and changes of the whole flush with one multi-row insert
+    per table and shard, under a savepoint; when a concurrent writer took one of
+    the versions first, the shard's versions are read again and the insert
+    retried.
+    """
+    pending = session.info.pop("audit_pending", None)
+    if not pending:
+        return
+    context = session.info["audit"]
+    now = utcnow()
+    rows = _revision_rows(pending, context, now)
+
+    shards: dict[str, list[int]] = {}
+    for i, (instance, _, _) in enumerate(pending):
+        shards.setdefault(database.shard_for(instance.chat_id), []).append(i)
+    for shard_id, indexes in shards.items():
+        shard_pending = [pending[i] for i in indexes]
+        shard_rows = [rows[i] for i in indexes]
+        connection = session.connection(bind_arguments={"shard_id": shard_id})
+        attempts = 1
+        while True:
+            _number(session, shard_pending, shard_rows, now)
+            try:
+                with connection.begin_nested():
+                    connection.execute(
+                        insert(AuditRevision.__table__),
+                        [revision for revision, _ in shard_rows],
+                    )
+                    connection.execute(
+                        insert(AuditChange.__table__),
+                        [change for _, changes in shard_rows for change in changes],
+                    )
+                break
+            except IntegrityError:
+                if attempts >= VERSION_ATTEMPTS:
+                    raise
+                attempts += 1
+
+    notify = session.info.setdefault("audit_notify", set())
+    for (instance, event_type, changes), (revision, _) in zip(
+        pending, rows, strict=True
+    ):
+        # Written by the next flush, which commit() runs before committing.
+        outbox.enqueue(
+            session,
+            aggregate_type=instance.__tablename__,
+            aggregate_id=instance.id,
+            event_type=event_type,
+            version=revision["version"],
+            now=now,
+            payload={
+                "revision_id": revision["id"],
+                "parent_id": instance.chat_id,
+                "source": context["source"],
+                "changes": changes,
+            },
         )
+        notify.add(instance.chat_id)
+
 
-    await db.commit()
+@event.listens_for(Session, "after_commit")
+def _notify(session: Session) -> None:
+    for chat_id in session.info.pop("audit_notify", ()):
+        events.notify(chat_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session: Session) -> None:
+    session.info.pop("audit_notify", None)
+    session.info.pop("audit_pending", None)
+
+
+def _apply(state: dict[str, Any], changes: Iterable[dict[str, Any]]) -> dict:
+    return {**state, **{ch["field"]: ch.get("new_value") for ch in changes}}
+
+
+def _replay(revisions: Iterable[AuditRevision | dict]) -> dict[str, Any] | None:
+    """Fold version-ordered revisions (ORM rows or archived records) into state."""
+    state: dict[str, Any] | None = None
+    for rev in revisions:
+        if isinstance(rev, AuditRevision):
+            rev = {
+                "event_type": rev.event_type,
+                "created_at": rev.created_at.isoformat(),
+                "snapshot": rev.snapshot,
+                "changes": [
+                    {"field": ch.field, "new_value": ch.new_value} for ch in rev.changes
+                ],
+            }
+        if rev.get("snapshot") is not None:
+            state = dict(rev["snapshot"])
+        elif rev["event_type"] == "delete":
+            state = None
+        elif rev["event_type"] == "create":
+            state = _apply({"created_at": rev["created_at"]}, rev["changes"])
+        else:
+            state = _apply(state or {}, rev["changes"])
+    return state
+
+
+async def state_as_of(
+    db: AsyncSession,
+    *,
+    entity_type: str,
+    entity_id: str,
+    as_of: datetime | None = None,
+) -> dict[str, Any] | None:
+    """
+    Rebuild an entity's fields at `as_of` (default: now) from the nearest snapshot
+    plus at most AUDIT_SNAPSHOT_EVERY - 1 later revisions.
+    Returns None if the entity did not exist (or was deleted) at that time.
+    """
+    filters = [
+        AuditRevision.entity_type == entity_type,
+        AuditRevision.entity_id == entity_id,
+    ]
+    if as_of is not None:
+        filters.append(AuditRevision.created_at <= as_of)
+
+    base_version = await db.scalar(
+        select(AuditRevision.version)
+        .where(
+            *filters,
+            AuditRevision.snapshot.is_not(None),
+            AuditRevision.version.is_not(None),
+        )
+        .order_by(AuditRevision.version.desc())
+        .limit(1)
+    )
+    statement = (
+        select(AuditRevision)
+        .options(selectinload(AuditRevision.changes))
+        .where(*filters, AuditRevision.version >= (base_version or 0))
+        .order_by(AuditRevision.version)
+    )
+    revisions = list((await db.scalars(statement)).all())
+
+    if base_version is None and (not revisions or revisions[0].version != 1):
+        # The start of the chain has been moved to the archive by retention.
+        archived = [
+            rev
+            for rev in await retention.load_archived_revisions(db, entity_id)
+            if rev["entity_type"] == entity_type
+            and (as_of is None or datetime.fromisoformat(rev["created_at"]) <= as_of)
+        ]
+        archived.sort(key=lambda rev: rev.get("version") or 0)
+        return _replay([*archived, *revisions])
+    return _replay(revisions)
+
+
+async def states_as_of_for_parent(
+    db: AsyncSession,
+    *,
+    entity_type: str,
+    parent_id: str,
+    as_of: datetime,
+) -> dict[str, dict[str, Any]]:
+    """Bulk `state_as_of` for every entity owned by `parent_id` (e.g. a chat)."""
+    filters = [
+        AuditRevision.entity_type == entity_type,
+        AuditRevision.parent_id == parent_id,
+        AuditRevision.created_at <= as_of,
+    ]
+    base = (
+        select(
+            AuditRevision.entity_id,
+            func.max(AuditRevision.version).label("version"),
+        )
+        .where(*filters, AuditRevision.snapshot.is_not(None))
+        .group_by(AuditRevision.entity_id)
+        .subquery()
+    )
+    statement = (
+        select(AuditRevision)
+        .options(selectinload(AuditRevision.changes))
+        .outerjoin(base, base.c.entity_id == AuditRevision.entity_id)
+        .where(*filters, AuditRevision.version >= func.coalesce(base.c.version, 0))
+        .order_by(AuditRevision.entity_id, AuditRevision.version)
+    )
+    by_entity: dict[str, list[AuditRevision]] = {}
+    for rev in (await db.scalars(statement)).all():
+        by_entity.setdefault(rev.entity_id, []).append(rev)
+
+    states = {}
+    for entity_id, revisions in by_entity.items():
+        if revisions[0].snapshot is None and revisions[0].version != 1:
+            # Partly archived chain: fall back to the per-entity path.
+            state = await state_as_of(
+                db, entity_type=entity_type, entity_id=entity_id, as_of=as_of
+            )
+        else:
+            state = _replay(revisions)
+        if state is not None:
+            states[entity_id] = state
+    return states
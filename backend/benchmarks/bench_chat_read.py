@@ -0,0 +1,86 @@
+"""
+Cost of rendering `GET /chat/{chat_id}` by transcript size: loading the chat
+through the ORM and re-encoding it with `schemas.Chat` (``validated``) against
+splicing the stored JSON into the response (``raw``, what the endpoint does).
+Both paths include the query; allocations are tracemalloc peaks per read.
+
+Usage: python -m benchmarks.bench_chat_read [--turns 10 100 1000 5000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+
+import crud
+import database
+import main
+import schemas
+from benchmarks.transcripts import make_transcript
+from models import Base
+
+
+async def _validated(chat_id: str) -> bytes:
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        chat = await crud.chat.get(db, id=chat_id)
+        return main._render_json(schemas.Chat, chat)
+
+
+async def _raw(chat_id: str) -> bytes:
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        return main._render_raw_chat(await crud.chat.get_raw(db, id=chat_id))
+
+
+async def _measure(read, chat_id: str, number: int) -> dict:
+    timings = []
+    for _ in range(number):
+        start = perf_counter()
+        await read(chat_id)
+        timings.append(perf_counter() - start)
+    tracemalloc.start()
+    await read(chat_id)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "p50_us": round(statistics.median(timings) * 1e6, 1),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+async def bench(turns: int, number: int) -> dict:
+    messages = make_transcript(turns)
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        chat = await crud.chat.create(db, obj_in=schemas.ChatCreate(messages=messages))
+    assert json.loads(await _raw(chat.id)) == json.loads(await _validated(chat.id))
+    return {
+        "turns": turns,
+        "json_kb": round(len(json.dumps(messages)) / 1024, 1),
+        "validated": await _measure(_validated, chat.id, number),
+        "raw": await _measure(_raw, chat.id, number),
+    }
+
+
+async def run(turns: list[int], number: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        database.init_engine(f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}")
+        async with database.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            for n in turns:
+                print(json.dumps(await bench(n, max(5, number // max(1, n // 10)))))
+        finally:
+            await database.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.turns, args.number))
@@ -0,0 +1,51 @@
+"""
+Compression ratio and encode/decode cost of `models.CompressedJSON`.
+
+Usage: python -m benchmarks.bench_compression [--turns 10 100 1000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import timeit
+
+from benchmarks.transcripts import make_transcript
+from models import CompressedJSON
+
+
+def bench(turns: int, number: int) -> dict:
+    messages = make_transcript(turns)
+    codec = CompressedJSON()
+    plain = json.dumps(messages).encode()
+    stored = codec.process_bind_param(messages, None)
+
+    encode = timeit.timeit(
+        lambda: codec.process_bind_param(messages, None), number=number
+    )
+    decode = timeit.timeit(
+        lambda: codec.process_result_value(stored, None), number=number
+    )
+    baseline_decode = timeit.timeit(lambda: json.loads(plain), number=number)
+    return {
+        "turns": turns,
+        "json_bytes": len(plain),
+        "stored_bytes": len(stored),
+        "ratio": round(len(plain) / len(stored), 2),
+        "encode_us": round(encode / number * 1e6, 1),
+        "decode_us": round(decode / number * 1e6, 1),
+        "json_loads_us": round(baseline_decode / number * 1e6, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    for turns in args.turns:
+        print(json.dumps(bench(turns, max(1, args.number // max(1, turns // 10)))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Storage and write cost of chat forks, shared (`forks`) against copied.
+
+Each tree starts from a chat of ``--turns`` turns. Every level forks the tip of
+the level above, saves one more turn on it and leaves ``--width - 1`` retries of
+that turn as siblings, ``--depths`` levels deep. ``copied`` builds the same tree
+the way a client would without forks: a new chat with a copy of the history,
+then the turn. Reported per depth: stored ``messages`` bytes, time per
+fork plus saved turn, and the time to read the deepest chat's history.
+
+Usage: python -m benchmarks.bench_forks [--depths 1 10 50 200] [--width 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from sqlalchemy import delete, func, select
+
+import crud
+import database
+import forks
+import schemas
+from benchmarks.transcripts import make_transcript
+from models import Base, Chat
+
+
+async def _stored_bytes() -> int:
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        return await db.scalar(select(func.sum(func.length(Chat.messages))))
+
+
+async def _shared_turn(parent_id: str, messages: list) -> str:
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        chat, _ = await forks.fork(db, parent_id)
+        update = schemas.ChatUpdate(messages=messages)
+        await crud.chat.update(db, db_obj=chat, obj_in=update)
+        return chat.id
+
+
+async def _copied_turn(parent_id: str, messages: list) -> str:
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        parent = await crud.chat.get(db, id=parent_id)
+        create = schemas.ChatCreate(messages=await forks.history(db, parent))
+        chat = await crud.chat.create(db, obj_in=create)
+        update = schemas.ChatUpdate(messages=messages)
+        await crud.chat.update(db, db_obj=chat, obj_in=update)
+        return chat.id
+
+
+async def _read(chat_id: str) -> tuple[float, list]:
+    start = perf_counter()
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        messages = await forks.history(db, await crud.chat.get(db, id=chat_id))
+    return perf_counter() - start, messages
+
+
+async def _tree(turn, depth: int, width: int, base: list, extra: list) -> dict:
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        await db.execute(delete(Chat))
+        await db.commit()
+        create = schemas.ChatCreate(messages=base)
+        tip = (await crud.chat.create(db, obj_in=create)).id
+
+    messages, writes, spent = base, 0, 0.0
+    for _ in range(depth):
+        messages = messages + extra
+        start = perf_counter()
+        for _ in range(width - 1):
+            await turn(tip, messages)  # retries nobody continues
+        tip = await turn(tip, messages)
+        spent += perf_counter() - start
+        writes += width
+
+    seconds, history = await _read(tip)
+    assert history == messages
+    return {
+        "stored_kb": round(await _stored_bytes() / 1024, 1),
+        "write_ms": round(spent / writes * 1000, 2),
+        "read_ms": round(seconds * 1000, 2),
+    }
+
+
+async def run(depths: list[int], width: int, turns: int) -> None:
+    base = make_transcript(turns)
+    extra = make_transcript(1, seed=1)
+    with tempfile.TemporaryDirectory() as tmp:
+        database.init_engine(f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}")
+        async with database.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            for depth in depths:
+                result = {"depth": depth, "chats": 1 + depth * width}
+                for name, turn in (("shared", _shared_turn), ("copied", _copied_turn)):
+                    result[name] = await _tree(turn, depth, width, base, extra)
+                print(json.dumps(result))
+        finally:
+            await database.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--depths", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--width", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.depths, args.width, args.turns))
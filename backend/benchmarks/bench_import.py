@@ -0,0 +1,97 @@
+"""
+Throughput of `importer.import_forms` on a fresh SQLite file: forms per second
+for a CSV and an NDJSON body, fed in 64 KiB chunks as an upload would arrive.
+Every form also writes a create revision, one change per field and an outbox
+event; ``rows_per_second`` counts those rows too. The target is tens of
+thousands of forms per second, so read ``forms_per_second`` against it (about
+5,000 today, see `importer`).
+
+Usage: python -m benchmarks.bench_import [--rows 50000] [--chunk-size 2000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import func, select
+
+import database
+import importer
+from models import Base, Chat, utcnow
+
+READ_SIZE = 64 * 1024
+
+
+def make_body(fmt: str, rows: int, chat_id: str) -> bytes:
+    if fmt == "csv":
+        header = "name,email,phone_number,status,chat_id\n"
+        return (
+            header + f"Jane Doe,jane@example.com,555-0100,1,{chat_id}\n" * rows
+        ).encode()
+    row = {
+        "name": "Jane Doe",
+        "email": "jane@example.com",
+        "phone_number": "555-0100",
+        "status": 1,
+        "chat_id": chat_id,
+    }
+    return ((json.dumps(row) + "\n") * rows).encode()
+
+
+async def bench(fmt: str, rows: int, chunk_size: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        database.init_engine(f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}")
+        async with database.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with database.SessionLocal() as db:
+                chat = Chat(created_at=utcnow(), messages=[])
+                db.add(chat)
+                await db.commit()
+                body = make_body(fmt, rows, chat.id)
+
+                async def upload():
+                    for start in range(0, len(body), READ_SIZE):
+                        yield body[start : start + READ_SIZE]
+
+                started = time.perf_counter()
+                report = await importer.import_forms(
+                    db, upload(), fmt, chunk_size=chunk_size
+                )
+                elapsed = time.perf_counter() - started
+                written = 0
+                for table in importer.TABLES:
+                    count = select(func.count()).select_from(table)
+                    written += sum((await db.execute(count)).scalars())
+        finally:
+            await database.dispose()
+    return {
+        "format": fmt,
+        "rows": rows,
+        "imported": report.imported,
+        "seconds": round(elapsed, 2),
+        "forms_per_second": round(report.imported / elapsed),
+        "rows_written": written,
+        "rows_per_second": round(written / elapsed),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = [
+        asyncio.run(bench(fmt, args.rows, args.chunk_size)) for fmt in ("csv", "ndjson")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
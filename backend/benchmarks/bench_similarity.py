@@ -0,0 +1,76 @@
+"""
+Cost of the similar-chat index: indexing synthetic transcripts, and top-k searches
+over an index of `--chats` rows (filled with random unit vectors past the indexed
+transcripts, so a 1M-row index builds in seconds).
+
+Usage: python -m benchmarks.bench_similarity [--chats 1000000] [--dim 256] [--k 10]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import similarity
+from benchmarks.transcripts import make_transcript
+
+INDEXED = 2000
+SEARCHES = 50
+
+
+def bench(chats: int, dim: int, k: int) -> dict:
+    transcripts = [make_transcript(8, seed=i) for i in range(INDEXED)]
+    with tempfile.TemporaryDirectory() as tmp:
+        index = similarity.Index.create(Path(tmp), dim)
+        started = time.perf_counter()
+        for i, messages in enumerate(transcripts):
+            index.upsert(f"chat-{i}", messages)
+        index.publish()
+        indexing = (time.perf_counter() - started) / INDEXED
+
+        # Pad with random unit rows up to the requested size.
+        rng = np.random.default_rng(0)
+        while index.count < chats:
+            if index.count == len(index.ids):
+                index._grow()
+            end = min(chats, len(index.ids), index.count + 2**18)
+            rows = rng.standard_normal((end - index.count, dim), dtype=np.float32)
+            rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+            index.vectors[index.count : end] = rows
+            index.ids[index.count : end] = b"random"
+            index.meta["count"] = end
+        index.publish()
+
+        reader = similarity.Index.open(Path(tmp))
+        reader.vectors[: reader.count].sum()  # fault the pages in, as a warm API
+        timings = []
+        for i in range(SEARCHES):
+            started = time.perf_counter()
+            reader.similar(transcripts[i], k, exclude=f"chat-{i}")
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "chats": chats,
+        "dim": dim,
+        "index_ms_per_chat": round(indexing * 1000, 3),
+        "search_ms_p50": round(timings[len(timings) // 2] * 1000, 1),
+        "search_ms_p95": round(timings[int(len(timings) * 0.95)] * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(bench(args.chats, args.dim, args.k), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Cold-start cost of the backend: `import main` in a fresh interpreter, and the time
+from spawning uvicorn until the first request is answered (this includes the
+lifespan pre-warm of the DB pool and of the LLM connection, against the fake
+completions server).
+
+Usage: python -m benchmarks.bench_startup [--runs 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from sqlalchemy import create_engine
+
+from benchmarks.loadtest import BACKEND_DIR, _free_port, _spawn
+from models import Base
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+)
+
+
+def time_import() -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def time_first_request(db_path: Path, llm_url: str, timeout: float = 30) -> float:
+    port = _free_port()
+    started = time.perf_counter()
+    proc = _spawn(
+        ["-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        {
+            "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_BASE_URL": llm_url,
+        },
+    )
+    try:
+        with httpx.Client() as client:
+            while True:
+                try:
+                    client.get(f"http://127.0.0.1:{port}/").raise_for_status()
+                    return time.perf_counter() - started
+                except httpx.TransportError:
+                    if time.perf_counter() - started > timeout:
+                        raise
+                    time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(engine)
+        engine.dispose()
+
+        llm_port = _free_port()
+        llm = _spawn(["-m", "benchmarks.fake_llm", "--port", str(llm_port)], {})
+        try:
+            llm_url = f"http://127.0.0.1:{llm_port}/v1"
+            imports = [time_import() for _ in range(args.runs)]
+            first = [time_first_request(db_path, llm_url) for _ in range(args.runs)]
+        finally:
+            llm.terminate()
+            llm.wait()
+
+    report = {
+        name: {
+            "median_ms": round(statistics.median(samples) * 1000, 1),
+            "max_ms": round(max(samples) * 1000, 1),
+        }
+        for name, samples in (("import_main", imports), ("first_request", first))
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
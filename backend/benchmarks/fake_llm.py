@@ -0,0 +1,153 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Replies are scripted from the conversation so runs are reproducible:
+- a user message containing "create", "update" or "delete" gets the matching
+  interest form tool call (update/delete target the last form id seen in a tool
+  response);
+- anything else, including tool results, gets a short text reply.
+
+Usage: python -m benchmarks.fake_llm --port 8100 [--latency 0.05]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+_FORM_ID = re.compile(r"ID: ([\w-]+)|Form ([\w-]+) (?:updated|deleted)")
+
+
+def _last_form_id(messages: list[dict]) -> str | None:
+    for message in reversed(messages):
+        if message.get("role") == "tool":
+            match = _FORM_ID.search(message.get("content") or "")
+            if match:
+                return match.group(1) or match.group(2)
+    return None
+
+
+def scripted_reply(messages: list[dict]) -> dict:
+    """Return the assistant message the fake model answers with."""
+    last = messages[-1] if messages else {}
+    content = (last.get("content") or "").lower() if last.get("role") == "user" else ""
+
+    call = None
+    if "create" in content:
+        call = (
+            "submit_interest_form",
+            {"name": "Ada Lovelace", "email": "ada@example.com", "phone_number": "1"},
+        )
+    elif "update" in content or "delete" in content:
+        name = "update_interest_form" if "update" in content else "delete_interest_form"
+        args = {"form_id": _last_form_id(messages) or "missing"}
+        if name == "update_interest_form":
+            args["status"] = 2
+        call = (name, args)
+
+    if call is None:
+        return {"role": "assistant", "content": "Done! Anything else?"}
+    return {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [
+            {
+                "id": f"call_{secrets.token_hex(8)}",
+                "type": "function",
+                "function": {"name": call[0], "arguments": json.dumps(call[1])},
+            }
+        ],
+    }
+
+
+def create_app(latency: float = 0.0, reply=scripted_reply) -> FastAPI:
+    """
+    Build the fake API. `latency` seconds are added to every completion; set
+    ``app.state.fail_status`` to answer every completion with that HTTP error.
+    """
+    app = FastAPI()
+    app.state.latency = latency
+    app.state.fail_status = None
+    app.state.calls = 0
+
+    @app.get("/v1/models")
+    async def models():
+        return {
+            "object": "list",
+            "data": [{"id": "gpt-4o-mini", "object": "model", "created": 0}],
+        }
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        if app.state.latency:
+            await asyncio.sleep(app.state.latency)
+        if app.state.fail_status:
+            return JSONResponse(
+                {"error": {"message": "injected failure", "type": "server_error"}},
+                status_code=app.state.fail_status,
+            )
+        message = reply(body["messages"])
+        return {
+            "id": f"chatcmpl-{secrets.token_hex(8)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls"
+                    if message.get("tool_calls")
+                    else "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 100,
+                "completion_tokens": 20,
+                "total_tokens": 120,
+                "prompt_tokens_details": {"cached_tokens": 64},
+            },
+        }
+
+    return app
+
+
+@contextmanager
+def serve(app: FastAPI, host: str = "127.0.0.1"):
+    """Run `app` on a free port in a background thread; yields its base URL."""
+    server = uvicorn.Server(
+        uvicorn.Config(app, host=host, port=0, log_level="warning", lifespan="off")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://{host}:{port}/v1"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(args.latency), host=args.host, port=args.port, log_level="warning"
+    )
@@ -0,0 +1,335 @@
+"""
+Load test for the backend against a scripted fake LLM.
+
+For every dataset size the script seeds a fresh SQLite database (N form
+submissions, N/5 chats, one create revision per form), starts the real app with
+uvicorn and the fake completions server in subprocesses, drives every scenario
+with concurrent clients and reports p50/p99 latency and throughput as JSON.
+
+Results are compared with baseline.json; a regression beyond the tolerance, or a
+size or scenario the baseline has no entry for, fails the run.
+
+Usage:
+    python -m benchmarks.loadtest [--sizes 1000 100000 1000000]
+    python -m benchmarks.loadtest --sizes 1000 --write-baseline  # refresh a size
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+from sqlalchemy import create_engine, insert
+
+from benchmarks.transcripts import make_transcript
+from models import AuditChange, AuditRevision, Base, Chat, FormSubmission, utcnow
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+BASELINE = Path(__file__).with_name("baseline.json")
+SEED_BATCH = 10_000
+SIZES = [1000, 100_000, 1_000_000]
+
+
+@dataclass
+class Dataset:
+    chat_ids: list[str] = field(default_factory=list)
+    forms: list[tuple[str, str]] = field(default_factory=list)  # (form id, chat id)
+
+
+def seed(db_path: Path, rows: int) -> Dataset:
+    """Bulk-load `rows` forms (and their chats and audit rows) with the sync driver."""
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    now = utcnow()
+    messages = make_transcript(4)
+    dataset = Dataset()
+
+    with engine.begin() as conn:
+        chats = max(1, rows // 5)
+        for start in range(0, chats, SEED_BATCH):
+            batch = [
+                {"id": secrets.token_urlsafe(), "created_at": now, "messages": messages}
+                for _ in range(min(SEED_BATCH, chats - start))
+            ]
+            conn.execute(insert(Chat), batch)
+            dataset.chat_ids += [row["id"] for row in batch]
+
+        for start in range(0, rows, SEED_BATCH):
+            forms, revisions, changes = [], [], []
+            for i in range(start, min(rows, start + SEED_BATCH)):
+                form = {
+                    "id": secrets.token_urlsafe(),
+                    "created_at": now,
+                    "chat_id": dataset.chat_ids[i % chats],
+                    "name": f"Lead {i}",
+                    "email": f"lead{i}@example.com",
+                    "phone_number": f"555-{i:07d}",
+                    "status": i % 3 + 1,
+                }
+                forms.append(form)
+                revision_id = secrets.token_urlsafe()
+                fields = {k: form[k] for k in ("name", "email", "phone_number")}
+                fields.update(status=form["status"], chat_id=form["chat_id"])
+                revisions.append(
+                    {
+                        "id": revision_id,
+                        "created_at": now,
+                        "entity_type": "form_submission",
+                        "entity_id": form["id"],
+                        "event_type": "create",
+                        "source": "seed",
+                        "version": 1,
+                        "snapshot": {**fields, "created_at": now.isoformat()},
+                        "parent_id": form["chat_id"],
+                    }
+                )
+                changes += [
+                    {
+                        "id": secrets.token_urlsafe(),
+                        "created_at": now,
+                        "revision_id": revision_id,
+                        "field": name,
+                        "old_value": None,
+                        "new_value": value,
+                    }
+                    for name, value in fields.items()
+                ]
+            conn.execute(insert(FormSubmission), forms)
+            conn.execute(insert(AuditRevision), revisions)
+            conn.execute(insert(AuditChange), changes)
+            dataset.forms += [(form["id"], form["chat_id"]) for form in forms]
+    engine.dispose()
+    return dataset
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _spawn(args: list[str], env: dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, *args], cwd=BACKEND_DIR, env={**os.environ, **env}
+    )
+
+
+async def _wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+def _history(form_id: str, ask: str) -> list[dict]:
+    """A chat whose last tool result names `form_id`, ending with `ask`."""
+    call = {"name": "submit_interest_form", "arguments": "{}"}
+    return [
+        {"role": "user", "content": "hi, please create my form"},
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": "call_0", "type": "function", "function": call}],
+        },
+        {
+            "role": "tool",
+            "tool_call_id": "call_0",
+            "name": call["name"],
+            "content": f"Success! Form submitted with ID: {form_id}",
+        },
+        {"role": "assistant", "content": "Thanks, you're all set!"},
+        {"role": "user", "content": ask},
+    ]
+
+
+Scenario = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def scenarios(data: Dataset, rng: random.Random) -> dict[str, Scenario]:
+    def chat(i: int) -> str:
+        return data.chat_ids[i % len(data.chat_ids)]
+
+    def form(i: int) -> tuple[str, str]:
+        return data.forms[i % len(data.forms)]
+
+    deletable = list(data.forms)
+    rng.shuffle(deletable)
+
+    def turn(ask: str, pick: Callable[[int], tuple[str, str]]) -> Scenario:
+        async def run(client: httpx.AsyncClient, i: int) -> httpx.Response:
+            form_id, chat_id = pick(i)
+            return await client.put(
+                f"/chat/{chat_id}", json={"messages": _history(form_id, ask)}
+            )
+
+        return run
+
+    return {
+        "chat_turn_create": lambda c, i: c.put(
+            f"/chat/{chat(i)}",
+            json={"messages": [{"role": "user", "content": "create my form"}]},
+        ),
+        "chat_turn_update": turn("update it", form),
+        "form_get": lambda c, i: c.get(f"/forms/{form(i)[0]}"),
+        "form_update": lambda c, i: c.put(
+            f"/forms/{form(i)[0]}", json={"status": i % 3 + 1}
+        ),
+        "form_history": lambda c, i: c.get(f"/forms/{form(i)[0]}/history"),
+        "chat_get": lambda c, i: c.get(f"/chat/{chat(i)}"),
+        "chat_forms": lambda c, i: c.get(f"/chat/{chat(i)}/forms"),
+        "chat_list": lambda c, i: c.get("/chat"),
+        # Last, since it removes forms the other scenarios read.
+        "chat_turn_delete": turn("delete it", lambda i: deletable.pop()),
+    }
+
+
+async def drive(
+    base_url: str, scenario: Scenario, requests: int, concurrency: int
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            resp = await scenario(client, i)
+            latencies.append(time.perf_counter() - start)
+            errors += resp.status_code >= 400
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+async def run_size(rows: int, requests: int, concurrency: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+        print(f"seeding {rows} rows...", file=sys.stderr)
+        data = seed(db_path, rows)
+
+        llm_port, app_port = _free_port(), _free_port()
+        llm = _spawn(["-m", "benchmarks.fake_llm", "--port", str(llm_port)], {})
+        app = _spawn(
+            [
+                "-m",
+                "uvicorn",
+                "main:app",
+                "--port",
+                str(app_port),
+                "--log-level",
+                "warning",
+            ],
+            {
+                "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+                "OPENAI_API_KEY": "bench",
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+            },
+        )
+        base_url = f"http://127.0.0.1:{app_port}"
+        try:
+            await _wait_ready(f"http://127.0.0.1:{llm_port}/docs")
+            await _wait_ready(base_url)
+            results = {}
+            rng = random.Random(rows)
+            for name, scenario in scenarios(data, rng).items():
+                count = min(requests, len(data.forms)) if "delete" in name else requests
+                results[name] = await drive(base_url, scenario, count, concurrency)
+                print(f"{rows} {name}: {results[name]}", file=sys.stderr)
+            return results
+        finally:
+            for proc in (app, llm):
+                proc.terminate()
+                proc.wait()
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Regressions beyond `tolerance` in p99 latency or throughput, and results that
+    have no baseline to compare with.
+    """
+    regressions = []
+    for size, by_scenario in results.items():
+        for name, current in by_scenario.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                regressions.append(f"{size}/{name}: no baseline")
+                continue
+            if current["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{size}/{name}: p99 {base['p99_ms']} -> {current['p99_ms']} ms"
+                )
+            if current["rps"] < base["rps"] * (1 - tolerance):
+                regressions.append(
+                    f"{size}/{name}: rps {base['rps']} -> {current['rps']}"
+                )
+    return regressions
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--write-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = {
+        str(rows): await run_size(rows, args.requests, args.concurrency)
+        for rows in args.sizes
+    }
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output + "\n")
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if args.write_baseline:
+        # Only the sizes that were run are replaced.
+        baseline = dict(
+            sorted({**baseline, **results}.items(), key=lambda i: int(i[0]))
+        )
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
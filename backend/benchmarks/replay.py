@@ -0,0 +1,274 @@
+"""
+Replay captured traffic (see `capture`) against a fresh instance of this build.
+
+The app runs with uvicorn on an empty SQLite database, talking to the fake LLM
+server, which answers each turn with the completions recorded for it (the
+record id is in the sanitized text of the turn's last user message) and falls
+back to `fake_llm.scripted_reply` once those run out. Requests are sent at their
+recorded offsets divided by ``--time-scale``; a request that names an id waits
+for the earlier requests that used or returned it. Ids are translated to the
+ones the replay created by pairing the ids in recorded and replayed responses
+by position. Chats that already existed when the capture started are created
+empty on first use; their forms did not exist and answer 404. Imports and
+other requests recorded without a body are skipped.
+
+The report has per-route latency percentiles and status counts, the requests
+whose status differs from the recording, and every request's status so two
+reports can be compared with ``--compare``.
+
+Usage:
+    python -m benchmarks.replay captures/*.ndjson.gz --time-scale 10 \\
+        --output before.json
+    python -m benchmarks.replay captures/*.ndjson.gz --compare before.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+import httpx
+from sqlalchemy import create_engine
+
+import capture
+from benchmarks import fake_llm
+from benchmarks.loadtest import _free_port, _spawn, _wait_ready
+from models import Base
+
+CHAT_PATH = re.compile(r"^/chat/([A-Za-z0-9_-]{43})(/|$)")
+
+
+def load(paths: Iterable[Path]) -> list[dict[str, Any]]:
+    """Records from capture files, in arrival order."""
+    records = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as lines:
+            records += [json.loads(line) for line in lines if line.strip()]
+    return sorted(records, key=lambda record: record["t"])
+
+
+def _quantile(ordered: list[float], q: float) -> float:
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+
+class Replay:
+    def __init__(self, records: list[dict[str, Any]]):
+        self.records = [r for r in records if "body_bytes" not in r]
+        self.skipped = len(records) - len(self.records)
+        self.ids: dict[str, str] = {}  # recorded id -> replayed id
+        self.completions = {r["r"]: deque(r["llm"]) for r in self.records}
+        self.results: dict[str, dict[str, Any]] = {}
+
+    def rewrite(self, value: Any) -> Any:
+        """`value` with every recorded id replaced by its replayed counterpart."""
+        if isinstance(value, str):
+            return capture.ID.sub(lambda m: self.ids.get(m[0], m[0]), value)
+        if isinstance(value, list):
+            return [self.rewrite(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.rewrite(item) for key, item in value.items()}
+        return value
+
+    def reply(self, messages: list[dict]) -> dict:
+        """The fake LLM's answer: the next completion recorded for this turn."""
+        users = [m for m in messages if m.get("role") == "user"]
+        record_id = capture.record_id_of(users[-1].get("content") if users else None)
+        recorded = self.completions.get(record_id)
+        if recorded:
+            return self.rewrite(recorded.popleft())
+        return fake_llm.scripted_reply(messages)
+
+    async def _send(self, client: httpx.AsyncClient, record: dict[str, Any]) -> None:
+        path = self.rewrite(record["path"])
+        match = CHAT_PATH.match(record["path"])
+        if match and match[1] not in self.ids:
+            # A chat from before the capture started.
+            resp = await client.post("/chat", json={"messages": []})
+            self.ids[match[1]] = resp.json()["id"]
+            path = self.rewrite(record["path"])
+
+        headers = {"Idempotency-Key": record["key"]} if record.get("key") else {}
+        start = time.perf_counter()
+        resp = await client.request(
+            record["method"],
+            path,
+            params=self.rewrite(record["query"]) or None,
+            json=self.rewrite(record["body"]),
+            headers=headers,
+        )
+        seconds = time.perf_counter() - start
+        replayed = capture.ID.findall(resp.text[: capture.MAX_ID_SCAN])
+        for old, new in zip(record["ids"], replayed, strict=False):
+            self.ids.setdefault(old, new)
+        self.results[record["r"]] = {"status": resp.status_code, "ms": seconds * 1000}
+
+    async def run(self, client: httpx.AsyncClient, time_scale: float = 1.0) -> dict:
+        done: dict[str, asyncio.Event] = {}
+        last_use: dict[str, str] = {}  # id -> the last record that named it
+        tasks = []
+
+        async def send(record: dict[str, Any], after: list[asyncio.Event]) -> None:
+            for event in after:
+                await event.wait()
+            try:
+                await self._send(client, record)
+            except httpx.HTTPError as exc:
+                self.results[record["r"]] = {"status": type(exc).__name__, "ms": 0}
+            finally:
+                done[record["r"]].set()
+
+        loop = asyncio.get_running_loop()
+        origin, started = self.records[0]["t"] if self.records else 0, loop.time()
+        for record in self.records:
+            delay = (record["t"] - origin) / time_scale - (loop.time() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            named = capture.ID.findall(
+                json.dumps([record["path"], record["query"], record["body"]])
+            )
+            after = {last_use[i] for i in named if i in last_use}
+            done[record["r"]] = asyncio.Event()
+            for used in (*named, *record["ids"]):
+                last_use[used] = record["r"]
+            tasks.append(
+                asyncio.create_task(send(record, [done[r] for r in sorted(after)]))
+            )
+        await asyncio.gather(*tasks)
+        return self.report()
+
+    def report(self) -> dict[str, Any]:
+        routes: dict[str, dict[str, Any]] = {}
+        mismatches = []
+        for record in self.records:
+            result = self.results[record["r"]]
+            name = f"{record['method']} {record['route']}"
+            route = routes.setdefault(
+                name, {"latencies": [], "recorded": [], "statuses": Counter()}
+            )
+            route["latencies"].append(result["ms"])
+            route["recorded"].append(record["ms"])
+            route["statuses"][str(result["status"])] += 1
+            if result["status"] != record["status"]:
+                mismatches.append(
+                    {
+                        "r": record["r"],
+                        "route": name,
+                        "recorded": record["status"],
+                        "replayed": result["status"],
+                    }
+                )
+
+        summary = {}
+        for name, route in sorted(routes.items()):
+            latencies, recorded = sorted(route["latencies"]), route["recorded"]
+            summary[name] = {
+                "requests": len(latencies),
+                "p50_ms": _quantile(latencies, 0.5),
+                "p95_ms": _quantile(latencies, 0.95),
+                "p99_ms": _quantile(latencies, 0.99),
+                "recorded_p50_ms": round(statistics.median(recorded), 2),
+                "statuses": dict(route["statuses"]),
+            }
+        return {
+            "requests": len(self.records),
+            "skipped": self.skipped,
+            "routes": summary,
+            "mismatches": mismatches,
+            "statuses": {r: result["status"] for r, result in self.results.items()},
+        }
+
+
+def compare(report: dict, other: dict) -> dict[str, Any]:
+    """Latency and status differences of `report` relative to `other`."""
+    routes = {}
+    for name, current in report["routes"].items():
+        base = other["routes"].get(name)
+        if base is None:
+            continue
+        routes[name] = {
+            q: {"before": base[q], "after": current[q]}
+            for q in ("p50_ms", "p95_ms", "p99_ms")
+        }
+    changed = [
+        {"r": r, "before": other["statuses"][r], "after": status}
+        for r, status in report["statuses"].items()
+        if r in other["statuses"] and other["statuses"][r] != status
+    ]
+    return {"routes": routes, "changed_statuses": changed}
+
+
+async def replay_build(
+    records: list[dict[str, Any]], time_scale: float, latency: float
+) -> dict:
+    """Replay `records` against this build, started on an empty database."""
+    player = Replay(records)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "replay.db"
+        engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(engine)
+        engine.dispose()
+
+        app_port = _free_port()
+        llm_app = fake_llm.create_app(latency, reply=player.reply)
+        with fake_llm.serve(llm_app) as llm_url:
+            app = _spawn(
+                [
+                    "-m",
+                    "uvicorn",
+                    "main:app",
+                    "--port",
+                    str(app_port),
+                    "--log-level",
+                    "warning",
+                ],
+                {
+                    "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+                    "OPENAI_API_KEY": "replay",
+                    "OPENAI_BASE_URL": llm_url,
+                    "CAPTURE_DIR": "",
+                },
+            )
+            base_url = f"http://127.0.0.1:{app_port}"
+            try:
+                await _wait_ready(base_url)
+                async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+                    return await player.run(client, time_scale)
+            finally:
+                app.terminate()
+                app.wait()
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("captures", type=Path, nargs="+")
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    args = parser.parse_args()
+
+    report = await replay_build(load(args.captures), args.time_scale, args.llm_latency)
+    print(json.dumps(report["routes"], indent=2))
+    print(f"{len(report['mismatches'])} status mismatches", file=sys.stderr)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    if args.compare:
+        diff = compare(report, json.loads(args.compare.read_text()))
+        print(json.dumps(diff, indent=2))
+        return 1 if diff["changed_statuses"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,82 @@
+"""Synthetic chat transcripts shaped like what `PUT /chat/{chat_id}` stores."""
+
+from __future__ import annotations
+
+import json
+import random
+import secrets
+
+_NAMES = ["Ada Lovelace", "Grace Hopper", "Alan Turing", "Edsger Dijkstra"]
+_QUESTIONS = [
+    "Hi, I'd like to learn more about your product.",
+    "Can you tell me about pricing for small teams?",
+    "Please change my email, I mistyped it earlier.",
+    "Actually, mark my request as in progress.",
+    "I no longer need this, please delete my form.",
+]
+
+
+def _tool_turn(rng: random.Random, form_id: str) -> list[dict]:
+    name = rng.choice(_NAMES)
+    tool_name, args = rng.choice(
+        [
+            (
+                "submit_interest_form",
+                {
+                    "name": name,
+                    "email": f"{name.split()[0].lower()}@example.com",
+                    "phone_number": f"555-{rng.randint(1000, 9999)}",
+                },
+            ),
+            ("update_interest_form", {"form_id": form_id, "status": 2}),
+            ("delete_interest_form", {"form_id": form_id}),
+        ]
+    )
+    call_id = f"call_{secrets.token_hex(12)}"
+    return [
+        {
+            "content": None,
+            "role": "assistant",
+            "function_call": None,
+            "tool_calls": [
+                {
+                    "id": call_id,
+                    "function": {"arguments": json.dumps(args), "name": tool_name},
+                    "type": "function",
+                }
+            ],
+        },
+        {
+            "tool_call_id": call_id,
+            "role": "tool",
+            "name": tool_name,
+            "content": f"Success! Form {form_id} updated",
+        },
+        {
+            "content": "Thanks! Your interest form has been updated.",
+            "role": "assistant",
+            "function_call": None,
+            "tool_calls": None,
+        },
+    ]
+
+
+def make_transcript(turns: int, seed: int = 0) -> list[dict]:
+    """Build a transcript of `turns` user turns, roughly half of them tool turns."""
+    rng = random.Random(seed)
+    form_id = secrets.token_urlsafe()
+    messages: list[dict] = []
+    for _ in range(turns):
+        messages.append({"role": "user", "content": rng.choice(_QUESTIONS)})
+        if rng.random() < 0.5:
+            messages.extend(_tool_turn(rng, form_id))
+        else:
+            messages.append(
+                {
+                    "content": "Sure! Could you share your name, email and phone?",
+                    "role": "assistant",
+                    "function_call": None,
+                    "tool_calls": None,
+                }
+            )
+    return messages
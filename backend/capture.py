@@ -0,0 +1,285 @@
+"""
+Opt-in capture of production traffic for `benchmarks.replay`.
+
+With CAPTURE_DIR set, requests to the chat, form and job endpoints (a
+CAPTURE_SAMPLE_RATE share of them) are appended to gzipped NDJSON files in that
+directory, one gzip member per CAPTURE_FLUSH_EVERY records and a new file every
+CAPTURE_ROTATE_RECORDS. A record holds the arrival time, method, route, path,
+query, JSON body and Idempotency-Key, the response status, latency and the ids
+found in the response, and the assistant message of every LLM completion the
+request received. Records are compressed and written in a worker thread.
+
+Records are sanitized before they are written: ``name``, ``email`` and
+``phone_number`` values become salted pseudonyms (stable within one process, so
+repeat customers still look alike), and the text of every message (system,
+user, assistant and tool) is replaced by filler of the same length, tagged with
+the record id so the replay's fake LLM can find the completions that belong to
+each turn. Only JSON bodies up to MAX_BODY_BYTES are kept; others (CSV and
+NDJSON imports, which stream) are recorded by size only and never buffered.
+Completions of turns run by ``worker.py`` are not captured.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import secrets
+import threading
+from contextvars import ContextVar
+from pathlib import Path
+from time import perf_counter, time
+from typing import Any
+
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from models import utcnow
+
+PATHS = re.compile(r"^/(chat|forms|jobs)(/|$)")
+SKIPPED = re.compile(r"/events$")  # server-sent event streams never finish
+ID = re.compile(r"(?<![A-Za-z0-9_-])[A-Za-z0-9_-]{43}(?![A-Za-z0-9_-])")
+PII_FIELDS = {"name", "email", "phone_number"}
+FILLER = "redacted "
+MAX_ID_SCAN = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+_salt = secrets.token_bytes(16)
+_completions: ContextVar[list | None] = ContextVar("capture_llm", default=None)
+
+
+def get_capture_dir() -> Path | None:
+    value = os.getenv("CAPTURE_DIR")
+    return Path(value) if value else None
+
+
+def get_sample_rate() -> float:
+    return float(os.getenv("CAPTURE_SAMPLE_RATE", "1"))
+
+
+def get_flush_every() -> int:
+    return int(os.getenv("CAPTURE_FLUSH_EVERY", "100"))
+
+
+def get_rotate_records() -> int:
+    return int(os.getenv("CAPTURE_ROTATE_RECORDS", "100000"))
+
+
+def tag(record_id: str) -> str:
+    return f"[{record_id}] "
+
+
+def record_id_of(text: str | None) -> str | None:
+    """The record id a sanitized message text was tagged with."""
+    match = re.match(r"\[([0-9a-f]+)\] ", text or "")
+    return match.group(1) if match else None
+
+
+def _pseudonym(field: str, value: str) -> str:
+    digest = hashlib.sha256(_salt + value.encode()).hexdigest()
+    if field == "email":
+        return f"user-{digest[:10]}@example.com"
+    if field == "phone_number":
+        return f"555-{int(digest[:8], 16) % 10_000_000:07d}"
+    return f"Customer {digest[:6]}"
+
+
+def _filler(text: str, record_id: str) -> str:
+    prefix = tag(record_id)
+    size = max(len(text) - len(prefix), 0)
+    return prefix + (FILLER * (size // len(FILLER) + 1))[:size]
+
+
+def _names_function(value: dict[str, Any]) -> bool:
+    return "arguments" in value or value.get("role") == "tool"
+
+
+def sanitize(value: Any, record_id: str) -> Any:
+    """A copy of a request body or LLM message with personal data replaced."""
+    if isinstance(value, list):
+        return [sanitize(item, record_id) for item in value]
+    if not isinstance(value, dict):
+        return value
+    # Function calls and tool results carry a function name, not a person's.
+    pii = PII_FIELDS - {"name"} if _names_function(value) else PII_FIELDS
+    clean = {}
+    for key, item in value.items():
+        if key in pii and isinstance(item, str):
+            item = _pseudonym(key, item)
+        elif key == "content" and isinstance(item, str):
+            if "role" in value:
+                item = _filler(item, record_id)
+        elif key == "arguments" and isinstance(item, str):
+            try:
+                item = json.dumps(sanitize(json.loads(item), record_id))
+            except ValueError:
+                item = "{}"
+        else:
+            item = sanitize(item, record_id)
+        clean[key] = item
+    return clean
+
+
+def record_completion(resp: Any) -> None:
+    """Keep the reply of an LLM completion for the request being captured, if any."""
+    completions = _completions.get()
+    if completions is not None:
+        completions.append(resp.choices[0].message.model_dump(exclude_none=True))
+
+
+class Writer:
+    """Appends records to gzipped NDJSON files, one gzip member per flush."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.pending: list[str] = []
+        self.written = 0
+        self.path: Path | None = None
+        self.lock = threading.Lock()  # one batch at a time, in order
+        self.tasks: set[asyncio.Task] = set()
+
+    def add(self, record: dict[str, Any]) -> None:
+        """Queue a record; full batches are written off the event loop."""
+        self.pending.append(json.dumps(record, separators=(",", ":")))
+        if len(self.pending) >= get_flush_every():
+            batch, self.pending = self.pending, []
+            task = asyncio.create_task(asyncio.to_thread(self._write, batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def flush(self) -> None:
+        """Write what is queued now, blocking (at shutdown and in tests)."""
+        batch, self.pending = self.pending, []
+        self._write(batch)
+
+    def _write(self, batch: list[str]) -> None:
+        if not batch:
+            return
+        with self.lock:
+            if self.path is None or self.written >= get_rotate_records():
+                self.directory.mkdir(parents=True, exist_ok=True)
+                stamp = utcnow().strftime("%Y%m%dT%H%M%S")
+                name = f"capture-{stamp}-{os.getpid()}.ndjson.gz"
+                self.path = self.directory / name
+                self.written = 0
+            with gzip.open(self.path, "at", encoding="utf-8") as out:
+                out.write("\n".join(batch) + "\n")
+            self.written += len(batch)
+
+
+_writer: Writer | None = None
+
+
+def flush() -> None:
+    if _writer is not None:
+        _writer.flush()
+
+
+class CaptureMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or _writer is None
+            or not PATHS.match(scope["path"])
+            or SKIPPED.search(scope["path"])
+            or random.random() >= get_sample_rate()
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        record_id = secrets.token_hex(6)
+        chunks: list[bytes] = []
+        size = 0
+        # Streamed uploads (imports) are only measured, never held in memory.
+        keep = _is_json(_header(scope, b"content-type"))
+
+        async def receive_body() -> Message:
+            nonlocal keep, size
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                size += len(body)
+                keep = keep and size <= MAX_BODY_BYTES
+                if keep:
+                    chunks.append(body)
+                else:
+                    chunks.clear()
+            return message
+
+        status, head, scanned = 500, bytearray(), 0
+
+        async def capture_send(message: Message) -> None:
+            nonlocal status, scanned
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and scanned < MAX_ID_SCAN:
+                body = message.get("body", b"")[: MAX_ID_SCAN - scanned]
+                head.extend(body)
+                scanned += len(body)
+            await send(message)
+
+        arrived = time()
+        completions: list = []
+        token = _completions.set(completions)
+        start = perf_counter()
+        try:
+            await self.app(scope, receive_body, capture_send)
+        finally:
+            _completions.reset(token)
+            seconds = perf_counter() - start
+            route = scope.get("route")
+            _writer.add(
+                {
+                    "r": record_id,
+                    "t": round(arrived, 3),
+                    "method": scope["method"],
+                    "route": route.path if route is not None else None,
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    **_body(b"".join(chunks), size, record_id),
+                    "key": _header(scope, b"idempotency-key"),
+                    "status": status,
+                    "ms": round(seconds * 1000, 2),
+                    "ids": ID.findall(head.decode("utf-8", "replace")),
+                    "llm": sanitize(completions, record_id),
+                }
+            )
+
+
+def _header(scope: Scope, name: bytes) -> str | None:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _is_json(content_type: str | None) -> bool:
+    return (content_type or "").split(";")[0].strip().lower() == "application/json"
+
+
+def _body(raw: bytes, size: int, record_id: str) -> dict[str, Any]:
+    if not size:
+        return {"body": None}
+    if raw:
+        try:
+            return {"body": sanitize(json.loads(raw), record_id)}
+        except ValueError:
+            pass
+    return {"body": None, "body_bytes": size}
+
+
+def install(app: FastAPI) -> None:
+    """Register the capture middleware, only if CAPTURE_DIR is set."""
+    global _writer
+    directory = get_capture_dir()
+    if directory is None:
+        return
+    _writer = Writer(directory)
+    app.add_middleware(CaptureMiddleware)
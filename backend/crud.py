@@ -6,9 +6,11 @@ from typing import Any, Generic, TypeVar
 
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import LargeBinary, Row, select, type_coerce
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import database
+import forks
 import schemas
 from models import Base, Chat, FormSubmission
 
@@ -17,6 +19,12 @@ CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
 
+def _sort_key(row: Any, order_by: list) -> tuple:
+    # None sorts first, as it does in an ascending SQLite ORDER BY.
+    values = (getattr(row, column.key) for column in order_by)
+    return tuple((value is not None, value) for value in values)
+
+
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: type[ModelType]):
         """CRUD helpers for SQLAlchemy models."""
@@ -41,14 +49,28 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         filters: list | None = None,
         skip: int = 0,
         limit: int = 100,
+        order_by: list | None = None,
     ) -> list[ModelType]:
-        statement = (
-            select(self.model).filter(*(filters or [])).offset(skip).limit(limit)
-        )
-        result = await db.scalars(statement)
-        return result.all()
-
-    async def create(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
+        """
+        A page of rows, ordered by `order_by` (ascending model attributes).
+        Across shards each shard returns its first `skip + limit` rows and the
+        page is cut from their merge.
+        """
+        statement = select(self.model).filter(*(filters or []))
+        if order_by:
+            statement = statement.order_by(*order_by)
+        if len(database.engines) <= 1:
+            result = await db.scalars(statement.offset(skip).limit(limit))
+            return result.all()
+
+        rows = (await db.scalars(statement.limit(skip + limit))).all()
+        if order_by:
+            rows = sorted(rows, key=lambda row: _sort_key(row, order_by))
+        return rows[skip : skip + limit]
+
+    async def create(
+        self, db: AsyncSession, *, obj_in: CreateSchemaType, commit: bool = True
+    ) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(
             **obj_in_data, created_at=datetime.now(UTC).replace(tzinfo=None)
@@ -56,7 +78,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
         db.add(db_obj)
 
-        await db.commit()
+        await self._save(db, commit)
         await db.refresh(db_obj)
         return db_obj
 
@@ -66,6 +88,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         *,
         db_obj: ModelType,
         obj_in: UpdateSchemaType | dict[str, Any],
+        commit: bool = True,
     ) -> ModelType:
         obj_data = jsonable_encoder(
             db_obj, exclude={"embedding", "vector", "routing_options"}
@@ -78,19 +101,57 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             if field in update_data:
                 setattr(db_obj, field, update_data[field])
         db.add(db_obj)
-        await db.commit()
+        await self._save(db, commit)
         await db.refresh(db_obj)
         return db_obj
 
-    async def remove(self, db: AsyncSession, *, id: str) -> ModelType:
+    async def remove(
+        self, db: AsyncSession, *, id: str, commit: bool = True
+    ) -> ModelType:
         obj = await db.get(self.model, id)
         await db.delete(obj)
-        await db.commit()
+        await self._save(db, commit)
         return obj
 
+    @staticmethod
+    async def _save(db: AsyncSession, commit: bool) -> None:
+        """Commit, or only flush when the caller owns the transaction."""
+        if commit:
+            await db.commit()
+        else:
+            await db.flush()
+
 
 class CRUDChat(CRUDBase[Chat, schemas.ChatCreate, schemas.ChatUpdate]):
-    pass
+    async def get_raw(self, db: AsyncSession, id: str) -> Row | None:
+        """A chat's columns, with the messages as stored instead of parsed."""
+        statement = select(
+            Chat.id,
+            Chat.created_at,
+            Chat.parent_id,
+            Chat.fork_at,
+            type_coerce(Chat.messages, LargeBinary).label("messages"),
+        ).where(Chat.id == id)
+        return (await db.execute(statement)).first()
+
+    async def update(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: Chat,
+        obj_in: schemas.ChatUpdate | dict[str, Any],
+        commit: bool = True,
+    ) -> Chat:
+        """Like `CRUDBase.update`; ``messages`` is the full history (see `forks`)."""
+        if isinstance(obj_in, dict):
+            update_data = dict(obj_in)
+        else:
+            update_data = jsonable_encoder(obj_in, exclude_unset=True)
+        if "messages" in update_data:
+            await forks.save(db, db_obj, update_data.pop("messages"))
+        return await super().update(
+            db, db_obj=db_obj, obj_in=update_data, commit=commit
+        )
 
 
 chat = CRUDChat(Chat)
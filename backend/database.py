@@ -1,35 +1,208 @@
+"""
+Engines and sessions, optionally hash-sharded by chat.
+
+With DATABASE_SHARD_URLS (comma-separated async URLs) every chat lives on one
+shard together with its forms, audit history, outbox events and jobs; otherwise
+DATABASE_URL is the only shard. Sessions are SQLAlchemy ``ShardedSession``s:
+new rows go to the shard of the chat they belong to, statements that filter on
+a chat key (``chat.id``, ``*.chat_id``, ``audit_revision.parent_id``) go to that
+chat's shard, and everything else runs on every shard with the results
+concatenated. Callers that need a global order or limit merge the partial
+results themselves (see `crud.CRUDBase.get_multi` and `exporter`).
+
+Chats are placed by rendezvous hashing on the shard's position in the list, so
+appending a shard only moves about 1/N of the chats; run ``rebalance.py`` with
+writers stopped after changing the list. Migrations run per shard:
+``alembic -x url=sqlite:///./shard1.db upgrade head``.
+"""
+
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import os
+import secrets
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import ORMExecuteState, declarative_base
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
 
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
-from sqlalchemy.orm import declarative_base
+import metrics
 
 
 def get_async_url() -> str:
     return os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./dev.db")
 
 
+def get_shard_urls() -> list[str]:
+    urls = os.getenv("DATABASE_SHARD_URLS", "")
+    return [url.strip() for url in urls.split(",") if url.strip()] or [get_async_url()]
+
+
+def get_warm_connections() -> int:
+    return int(os.getenv("DB_WARM_CONNECTIONS", "4"))
+
+
 Base = declarative_base()
 
-engine = None
+engine = None  # the first shard; single-database setups only ever have this one
+engines: dict[str, AsyncEngine] = {}
 SessionLocal = None
 
+# Columns that hold the id of the chat a row belongs to.
+ROUTING_COLUMNS = {
+    ("chat", "id"),
+    ("form_submission", "chat_id"),
+    ("audit_revision", "parent_id"),
+    ("job", "chat_id"),
+    ("usage_turn", "chat_id"),
+}
+
+
+def shard_for(chat_id: str, shard_ids: list[str] | None = None) -> str:
+    """The shard a chat lives on: the highest hash of (shard, chat) wins."""
+    shard_ids = shard_ids or list(engines)
+    if len(shard_ids) == 1:
+        return shard_ids[0]
+    return max(
+        shard_ids,
+        key=lambda shard: hashlib.blake2b(
+            f"{shard}:{chat_id}".encode(), digest_size=8
+        ).digest(),
+    )
+
+
+def _routing_key(instance: Any) -> str:
+    """The chat id (or, for rows without one, another stable key) to place by."""
+    table = instance.__tablename__
+    if table == "chat":
+        if instance.id is None:
+            instance.id = secrets.token_urlsafe()  # the column default, early
+        return instance.id
+    if table == "audit_change":
+        return _routing_key(instance.revision)
+    if table == "audit_revision":
+        return instance.parent_id or instance.entity_id
+    if table == "outbox_event":
+        return (instance.payload or {}).get("parent_id") or instance.aggregate_id
+    if table == "archive_entry":
+        return instance.key
+    if table == "idempotency_key":
+        return instance.id
+    return instance.chat_id
+
+
+def _shard_chooser(mapper, instance, clause=None, **kw) -> str:
+    if instance is not None:
+        return shard_for(_routing_key(instance))
+    # No row to place (e.g. Session.get_bind(Model)): any shard has the schema.
+    return next(iter(engines))
+
 
-def init_engine(async_url: str | None = None) -> None:
+def _identity_chooser(mapper, primary_key, **kw) -> list[str]:
+    if mapper.local_table.name == "chat":
+        return [shard_for(primary_key[0])]
+    return list(engines)
+
+
+def _criteria(clause) -> list:
+    """The AND-ed terms of a WHERE clause."""
+    if clause is None:
+        return []
+    if isinstance(clause, BooleanClauseList) and clause.operator is operators.and_:
+        return [term for sub in clause.clauses for term in _criteria(sub)]
+    return [clause]
+
+
+def routed_chat_ids(statement) -> set[str] | None:
+    """Chat ids a statement is restricted to, or None if it may touch any chat."""
+    for term in _criteria(getattr(statement, "whereclause", None)):
+        if not isinstance(term, BinaryExpression):
+            continue
+        column, value = term.left, term.right
+        table = getattr(getattr(column, "table", None), "name", None)
+        if (table, getattr(column, "name", None)) not in ROUTING_COLUMNS:
+            continue
+        if not isinstance(value, BindParameter) or value.effective_value is None:
+            continue  # compared to another column, or bound at execution time
+        if term.operator is operators.eq:
+            return {value.effective_value}
+        if term.operator is operators.in_op:
+            return set(value.effective_value)
+    return None
+
+
+def shards_for(statement) -> list[str]:
+    """The shards a statement has to run on."""
+    chat_ids = routed_chat_ids(statement)
+    if chat_ids is None or len(engines) == 1:
+        return list(engines)
+    return sorted({shard_for(chat_id) for chat_id in chat_ids}) or [next(iter(engines))]
+
+
+def _execute_chooser(context: ORMExecuteState) -> list[str]:
+    if context.is_insert and len(engines) > 1:
+        raise ValueError("Bulk INSERTs need bind_arguments={'shard_id': ...}")
+    return shards_for(context.statement)
+
+
+def init_engine(async_url: str | None = None, shard_urls: list[str] | None = None):
     """
-    Initialize the global async SQLAlchemy engine/sessionmaker.
+    Initialize the async engines and the sharded sessionmaker.
 
-    Tests can call this to point the app at a temporary DB without reloading modules.
+    The app calls this from its lifespan handler and the CLIs from their entry
+    points, so importing this module stays cheap. Tests can call this to point the
+    app at temporary DBs without reloading modules.
     """
-    global engine, SessionLocal
-    engine = create_async_engine(async_url or get_async_url(), pool_pre_ping=True)
+    global engine, engines, SessionLocal
+    urls = shard_urls or ([async_url] if async_url else get_shard_urls())
+    engines = {
+        str(i): create_async_engine(url, pool_pre_ping=True)
+        for i, url in enumerate(urls)
+    }
+    for shard in engines.values():
+        metrics.instrument_engine(shard.sync_engine)
+    engine = engines["0"]
     SessionLocal = async_sessionmaker(
+        sync_session_class=ShardedSession,
+        shards={shard_id: e.sync_engine for shard_id, e in engines.items()},
+        shard_chooser=_shard_chooser,
+        identity_chooser=_identity_chooser,
+        execute_chooser=_execute_chooser,
         autocommit=False,
         autoflush=False,
-        bind=engine,
         expire_on_commit=False,
     )
 
 
-init_engine()
+async def _warm_up_engine(shard: AsyncEngine, connections: int) -> None:
+    size = getattr(shard.pool, "size", None)
+    count = min(connections, size()) if size is not None else 1
+    opened = [await shard.connect() for _ in range(max(count, 1))]
+    try:
+        await asyncio.gather(*(conn.execute(text("SELECT 1")) for conn in opened))
+    finally:
+        for conn in opened:
+            await conn.close()
+
+
+async def warm_up(connections: int | None = None) -> None:
+    """
+    Open pool connections up front so the first requests do not pay for them.
+    Pools that keep no connections (NullPool, the aiosqlite default for files)
+    just get one ping to check the database is reachable.
+    """
+    connections = get_warm_connections() if connections is None else connections
+    await asyncio.gather(*(_warm_up_engine(e, connections) for e in engines.values()))
+
+
+async def dispose() -> None:
+    global engine, engines, SessionLocal
+    for shard in engines.values():
+        await shard.dispose()
+    engine = SessionLocal = None
+    engines = {}
@@ -0,0 +1,237 @@
+"""
+Server-sent change feed of form submission revisions, per chat.
+
+One `ChatFeed` task per chat reads new `audit_revision` rows and fans them out to
+every open stream of that chat, so the database load does not grow with the
+number of subscribers. The feed is woken right after an audit revision
+commits in this process and otherwise polls every EVENTS_POLL_SECONDS, which
+covers writes made by other processes.
+
+A revision's created_at is taken before its transaction commits, so one can
+commit after a later-stamped revision has already been read. Each read therefore
+re-scans the EVENTS_LAG_SECONDS before the newest revision sent and skips the
+ones it already sent; a transaction that takes longer than that to commit is
+still missed. The SSE event id is the revision id. Reconnecting clients resume
+via the Last-Event-ID header and get the lag window before it again, so they
+should drop ids they have seen; an unknown id replays the chat from the start.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+
+import database
+from models import AuditRevision
+
+PAGE_SIZE = 500
+QUEUE_SIZE = 1000
+HEARTBEAT_SECONDS = 15.0
+
+_feeds: dict[str, ChatFeed] = {}
+
+
+def get_poll_seconds() -> float:
+    return float(os.getenv("EVENTS_POLL_SECONDS", "2"))
+
+
+def get_lag_seconds() -> float:
+    return float(os.getenv("EVENTS_LAG_SECONDS", "10"))
+
+
+def notify(chat_id: str | None) -> None:
+    """Wake the chat's feed, if anyone is listening, after a revision commit."""
+    feed = _feeds.get(chat_id) if chat_id else None
+    if feed is not None:
+        feed.wake.set()
+
+
+def _event(revision: AuditRevision) -> dict[str, Any]:
+    return {
+        "id": revision.id,
+        "event": revision.event_type,
+        "data": {
+            "revision_id": revision.id,
+            "form_id": revision.entity_id,
+            "event_type": revision.event_type,
+            "created_at": revision.created_at,
+            "source": revision.source,
+            "changes": [
+                {
+                    "field": ch.field,
+                    "old_value": ch.old_value,
+                    "new_value": ch.new_value,
+                }
+                for ch in revision.changes
+            ],
+        },
+    }
+
+
+def format_event(event: dict[str, Any]) -> str:
+    data = json.dumps(jsonable_encoder(event["data"]))
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+
+class Window:
+    """Revisions sent at or after `since`, which trails the newest one sent."""
+
+    def __init__(self, since: datetime | None = None):
+        self.since = since  # None: from the chat's first revision
+        self.lag = timedelta(seconds=get_lag_seconds())
+        self.sent: dict[str, datetime] = {}  # in the order sent
+
+    def add(self, event: dict[str, Any]) -> bool:
+        """Record `event` as sent; False if it already was."""
+        revision_id, created_at = event["id"], event["data"]["created_at"]
+        if revision_id in self.sent:
+            return False
+        self.sent[revision_id] = created_at
+        since = created_at - self.lag
+        if self.since is None or since > self.since:
+            self.since = since
+            # Older ids can no longer come back from a re-scan.
+            while next(iter(self.sent.values())) < since:
+                del self.sent[next(iter(self.sent))]
+        return True
+
+
+async def fetch_events(chat_id: str, window: Window) -> list[dict[str, Any]]:
+    """Up to PAGE_SIZE revisions of the chat's forms not yet sent in `window`."""
+    filters = [
+        AuditRevision.entity_type == "form_submission",
+        AuditRevision.parent_id == chat_id,
+        AuditRevision.id.not_in(list(window.sent)),
+    ]
+    if window.since is not None:
+        filters.append(AuditRevision.created_at >= window.since)
+    statement = (
+        select(AuditRevision)
+        .options(selectinload(AuditRevision.changes))
+        .where(*filters)
+        .order_by(AuditRevision.created_at, AuditRevision.id)
+        .limit(PAGE_SIZE)
+    )
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        return [_event(rev) for rev in (await db.scalars(statement)).all()]
+
+
+async def _tail(chat_id: str) -> Window:
+    """A window holding the chat's latest revisions, so only new ones follow."""
+    statement = select(func.max(AuditRevision.created_at)).where(
+        AuditRevision.entity_type == "form_submission",
+        AuditRevision.parent_id == chat_id,
+    )
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        newest = await db.scalar(statement)
+    window = Window()
+    if newest is not None:
+        window.since = newest - window.lag
+        while True:
+            page = await fetch_events(chat_id, window)
+            for event in page:
+                window.add(event)
+            if len(page) < PAGE_SIZE:
+                break
+    return window
+
+
+async def _resume_from(last_event_id: str) -> datetime | None:
+    """Where a stream resuming after `last_event_id` starts; None if unknown."""
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        revision = await db.get(AuditRevision, last_event_id)
+    if revision is None:
+        return None
+    return revision.created_at - timedelta(seconds=get_lag_seconds())
+
+
+class Subscription:
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def close(self) -> None:
+        """Drop what is buffered and end the stream at its next read."""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class ChatFeed:
+    """Single reader of one chat's revisions, shared by all of its subscribers."""
+
+    def __init__(self, chat_id: str):
+        self.chat_id = chat_id
+        self.subscribers: set[Subscription] = set()
+        self.wake = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        try:
+            window = await _tail(self.chat_id)
+            while self.subscribers:
+                try:
+                    await asyncio.wait_for(self.wake.wait(), get_poll_seconds())
+                except TimeoutError:
+                    pass
+                self.wake.clear()
+                events = await fetch_events(self.chat_id, window)
+                for event in events:
+                    if window.add(event):
+                        self.publish(event)
+                if len(events) == PAGE_SIZE:
+                    self.wake.set()
+        finally:
+            if _feeds.get(self.chat_id) is self:
+                del _feeds[self.chat_id]
+
+    def publish(self, event: dict[str, Any]) -> None:
+        for sub in list(self.subscribers):
+            try:
+                sub.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too slow: drop it; the client resumes from its Last-Event-ID.
+                self.subscribers.discard(sub)
+                sub.close()
+
+
+async def stream(chat_id: str, last_event_id: str | None = None) -> AsyncIterator[str]:
+    """SSE text for one client: backlog after `last_event_id`, then live events."""
+    sub = Subscription()
+    feed = _feeds.get(chat_id)
+    if feed is None or feed.task.done():
+        feed = _feeds[chat_id] = ChatFeed(chat_id)
+    feed.subscribers.add(sub)
+
+    try:
+        window = Window()
+        if last_event_id:
+            window.since = await _resume_from(last_event_id)
+            while True:
+                backlog = await fetch_events(chat_id, window)
+                for event in backlog:
+                    if window.add(event):
+                        yield format_event(event)
+                if len(backlog) < PAGE_SIZE:
+                    break
+
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), HEARTBEAT_SECONDS)
+            except TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                return  # overflowed
+            # Live events may repeat the tail of the backlog; skip those.
+            if window.add(event):
+                yield format_event(event)
+    finally:
+        feed.subscribers.discard(sub)
@@ -0,0 +1,162 @@
+"""
+Streaming export of form submissions across chats as CSV or NDJSON.
+
+Rows come from one server-side cursor per shard, fetched EXPORT_BATCH_SIZE at a
+time and merged in creation order; every EXPORT_BATCH_SIZE rows are encoded into
+one chunk of the response, so memory stays flat however many rows match. If the
+client goes away, Starlette cancels the stream and the cursors and session are
+closed on the way out.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import csv
+import heapq
+import io
+import json
+import logging
+import os
+from collections.abc import AsyncIterator
+from datetime import datetime
+
+from sqlalchemy import Row, Select, select
+
+import database
+import metrics
+from models import FormSubmission
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("id", "created_at", "chat_id", "name", "email", "phone_number", "status")
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+exported_rows = metrics.REGISTRY.counter(
+    "form_export_rows_total", "Rows streamed by GET /forms/export"
+)
+aborted = metrics.REGISTRY.counter(
+    "form_export_aborted_total", "Exports cut short by a client disconnect"
+)
+
+
+def get_batch_size() -> int:
+    return int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+
+def build_query(
+    *,
+    status: int | None = None,
+    chat_id: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> Select:
+    statement = select(*(getattr(FormSubmission, c) for c in COLUMNS))
+    if status is not None:
+        statement = statement.where(FormSubmission.status == status)
+    if chat_id is not None:
+        statement = statement.where(FormSubmission.chat_id == chat_id)
+    if created_after is not None:
+        statement = statement.where(FormSubmission.created_at >= created_after)
+    if created_before is not None:
+        statement = statement.where(FormSubmission.created_at < created_before)
+    return statement.order_by(FormSubmission.created_at, FormSubmission.id)
+
+
+def _encode_csv(rows, header: bool = False) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(
+        (row.id, row.created_at.isoformat() if row.created_at else "", *row[2:])
+        for row in rows
+    )
+    return buf.getvalue()
+
+
+def _encode_ndjson(rows) -> str:
+    return "".join(
+        json.dumps(
+            {
+                **row._asdict(),
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+            },
+            separators=(",", ":"),
+        )
+        + "\n"
+        for row in rows
+    )
+
+
+async def _shard_rows(db, statement: Select, shard_id: str) -> AsyncIterator[Row]:
+    result = await db.stream(
+        statement.execution_options(yield_per=get_batch_size()),
+        bind_arguments={"shard_id": shard_id},
+    )
+    try:
+        async for rows in result.partitions():
+            for row in rows:
+                yield row
+    finally:
+        await result.close()
+
+
+def _sort_key(row: Row) -> tuple:
+    # The ORDER BY of `build_query`; NULL timestamps sort first, as in SQLite.
+    return (row.created_at is not None, row.created_at, row.id)
+
+
+async def _merged(streams: list[AsyncIterator[Row]]) -> AsyncIterator[Row]:
+    """K-way merge of per-shard streams that are each ordered by `_sort_key`."""
+    heap = []
+    for i, rows in enumerate(streams):
+        row = await anext(rows, None)
+        if row is not None:
+            heap.append((_sort_key(row), i, row))
+    heapq.heapify(heap)
+    while heap:
+        _, i, row = heap[0]
+        yield row
+        following = await anext(streams[i], None)
+        if following is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (_sort_key(following), i, following))
+
+
+async def stream(fmt: str, statement: Select) -> AsyncIterator[str]:
+    """
+    Response chunks for every row of `statement`, EXPORT_BATCH_SIZE rows each.
+    Each shard is read through its own cursor and the rows are merged in order.
+    """
+    encode = _encode_csv if fmt == "csv" else _encode_ndjson
+    if fmt == "csv":
+        yield _encode_csv([], header=True)
+    batch_size = get_batch_size()
+    count = 0
+    try:
+        async with database.SessionLocal() as db:  # type: ignore[misc]
+            streams = [
+                _shard_rows(db, statement, shard_id)
+                for shard_id in database.shards_for(statement)
+            ]
+            try:
+                batch = []
+                async for row in _merged(streams):
+                    batch.append(row)
+                    if len(batch) == batch_size:
+                        count += len(batch)
+                        exported_rows.inc(len(batch), format=fmt)
+                        yield encode(batch)
+                        batch = []
+                if batch:
+                    count += len(batch)
+                    exported_rows.inc(len(batch), format=fmt)
+                    yield encode(batch)
+            finally:
+                for rows in streams:
+                    await rows.aclose()
+    except (asyncio.CancelledError, GeneratorExit):
+        aborted.inc(format=fmt)
+        logger.info("form export stopped after %d rows", count)
+        raise
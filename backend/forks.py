@@ -0,0 +1,182 @@
+"""
+Copy-on-write chat forks.
+
+``POST /chat/{id}/fork?at=N`` starts a chat from the first N messages of another
+one without copying them: the fork's row points at the chat the messages came
+from (``parent_id``) and how many it shares (``fork_at``), and its ``messages``
+column only holds what was said after that. A fork of a fork that branches
+inside the inherited part points straight at the chat that stored those
+messages, so retries of the same turn do not stack up.
+
+A history is rebuilt from the chat's ancestors, read by one recursive query.
+Forks get ids on their parent's shard so a whole tree is read from one place;
+after ``rebalance.py`` moves chats apart the read continues shard by shard.
+
+Shared prefixes never change under a fork: saving a history that rewrites an
+earlier part of a chat (rather than appending to it) first gives the forks that
+shared the rewritten messages their own copy. Chats with forks are not
+archived by `retention`.
+"""
+
+from __future__ import annotations
+
+import secrets
+from typing import Any
+
+from sqlalchemy import Row, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+from models import Chat, utcnow
+
+
+def view(chat: Chat, messages: list) -> dict[str, Any]:
+    """`chat` as `schemas.Chat` shows it, given its full history."""
+    return {
+        "id": chat.id,
+        "created_at": chat.created_at,
+        "parent_id": chat.parent_id,
+        "fork_at": chat.fork_at,
+        "messages": messages,
+    }
+
+
+def _lineage_statement(chat_id: str):
+    table = Chat.__table__
+    columns = (table.c.id, table.c.parent_id, table.c.fork_at, table.c.messages)
+    lineage = (
+        select(*columns, table.c.created_at, literal(0).label("depth"))
+        .where(table.c.id == chat_id)
+        .cte("lineage", recursive=True)
+    )
+    lineage = lineage.union_all(
+        select(*columns, table.c.created_at, lineage.c.depth + 1).where(
+            table.c.id == lineage.c.parent_id
+        )
+    )
+    return select(lineage).order_by(lineage.c.depth)
+
+
+async def lineage(db: AsyncSession, chat_id: str) -> list[Row]:
+    """
+    The chat and its ancestors, the chat first; empty if it does not exist.
+    Raises LookupError if an ancestor is missing.
+    """
+    rows: list[Row] = []
+    next_id: str | None = chat_id
+    while next_id is not None:
+        found = (
+            await db.execute(
+                _lineage_statement(next_id),
+                bind_arguments={"shard_id": database.shard_for(next_id)},
+            )
+        ).all()
+        if not found:
+            if rows:
+                raise LookupError(f"Chat {rows[-1].id} lost its parent {next_id}")
+            return rows
+        rows += found
+        next_id = found[-1].parent_id
+    return rows
+
+
+def assemble(rows: list[Row], length: int | None = None) -> list:
+    """The first `length` messages (all by default) of the history of `rows[0]`."""
+    parts = []
+    for row in rows:
+        start = row.fork_at or 0
+        own = row.messages or []
+        parts.append(own if length is None else own[: max(length - start, 0)])
+        length = start if length is None else min(length, start)
+        if not length:
+            break
+    return [message for part in reversed(parts) for message in part]
+
+
+async def history(db: AsyncSession, chat: Chat) -> list:
+    """The full message history of a loaded chat."""
+    if chat.parent_id is None:
+        return chat.messages or []
+    inherited = assemble(await lineage(db, chat.parent_id), chat.fork_at)
+    return inherited + (chat.messages or [])
+
+
+def _colocated_id(chat_id: str) -> str:
+    shard = database.shard_for(chat_id)
+    while True:
+        candidate = secrets.token_urlsafe()
+        if database.shard_for(candidate) == shard:
+            return candidate
+
+
+async def fork(
+    db: AsyncSession, chat_id: str, at: int | None = None
+) -> tuple[Chat, list] | None:
+    """
+    Create a fork of the first `at` messages of a chat (all by default); returns
+    it with its history, or None if the chat does not exist. Raises ValueError
+    if `at` is past the end of the history.
+    """
+    rows = await lineage(db, chat_id)
+    if not rows:
+        return None
+    messages = assemble(rows)
+    at = len(messages) if at is None else at
+    if at > len(messages):
+        raise ValueError(f"at must be at most {len(messages)}, the message count")
+
+    # The nearest chat that stored message `at - 1` itself.
+    source = next((row for row in rows if at > (row.fork_at or 0)), None)
+    chat = Chat(created_at=utcnow(), messages=[])
+    if source is not None:
+        chat.id = _colocated_id(source.id)
+        chat.parent_id, chat.fork_at = source.id, at
+    db.add(chat)
+    await db.commit()
+    await db.refresh(chat)
+    return chat, messages[:at]
+
+
+def _common_length(old: list, new: list) -> int:
+    if new[: len(old)] == old:
+        return len(old)  # the usual case: new messages were appended
+    for kept, (before, after) in enumerate(zip(old, new, strict=False)):
+        if before != after:
+            return kept
+    return min(len(old), len(new))
+
+
+async def save(db: AsyncSession, chat: Chat, messages: list) -> None:
+    """
+    Set `chat`'s row up for the full history `messages` (the caller flushes).
+    A fork keeps sharing its prefix while `messages` starts with it and becomes
+    a standalone chat otherwise.
+    """
+    old = await history(db, chat)
+    kept = _common_length(old, messages)
+    if kept < len(old):
+        await _copy_into_forks(db, chat.id, old, kept)
+
+    if chat.parent_id is not None and kept >= chat.fork_at:
+        chat.messages = messages[chat.fork_at :]
+    else:
+        chat.parent_id = chat.fork_at = None
+        chat.messages = messages
+
+
+async def _copy_into_forks(
+    db: AsyncSession, chat_id: str, old: list, kept: int
+) -> None:
+    """Give the forks sharing more than `kept` of `old` their own copy of it."""
+    statement = select(Chat).where(Chat.parent_id == chat_id, Chat.fork_at > kept)
+    for child in (await db.scalars(statement)).all():
+        child.messages = old[: child.fork_at] + (child.messages or [])
+        child.parent_id = child.fork_at = None
+
+
+async def forked(db: AsyncSession, chat_ids: list[str]) -> set[str]:
+    """Which of `chat_ids` have forks, on any shard."""
+    if not chat_ids:
+        return set()
+    statement = select(Chat.parent_id).where(Chat.parent_id.in_(chat_ids)).distinct()
+    return set((await db.scalars(statement)).all())
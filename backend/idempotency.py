@@ -0,0 +1,320 @@
+"""
+``Idempotency-Key`` support for retried mutations.
+
+A ``PUT /chat/{id}``, ``POST /chat/{id}/fork``, ``PUT /forms/{id}`` or
+``DELETE /forms/{id}`` sent with an ``Idempotency-Key`` header runs once. Its
+response is stored for IDEMPOTENCY_TTL_SECONDS, and retries with the same key
+get it back, marked ``Idempotent-Replayed: true``, without running again. A
+retry that arrives while the original is still running waits for it (up to
+IDEMPOTENCY_WAIT_SECONDS, then 409). Reusing a key for a different request is a
+422. 5xx responses are not stored, so those requests can be retried. If the
+original's process dies, its claim lapses after IDEMPOTENCY_LOCK_SECONDS and a
+retry takes it over.
+
+Expired keys are deleted by a background task started from the app lifespan.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from datetime import timedelta
+from time import monotonic
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import database
+import metrics
+from models import IdempotencyKey, utcnow
+
+logger = logging.getLogger(__name__)
+
+HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 0.1
+ROUTES = (
+    ("PUT", re.compile(r"^/chat/[^/]+$")),
+    ("POST", re.compile(r"^/chat/[^/]+/fork$")),
+    ("PUT", re.compile(r"^/forms/[^/]+$")),
+    ("DELETE", re.compile(r"^/forms/[^/]+$")),
+)
+
+requests = metrics.REGISTRY.counter(
+    "idempotency_requests_total", "Requests carrying an Idempotency-Key, by outcome"
+)
+collected = metrics.REGISTRY.counter(
+    "idempotency_keys_collected_total", "Expired idempotency keys deleted"
+)
+
+# Keys whose original request runs in this process; duplicates wait on these
+# instead of polling the database.
+_running: dict[str, asyncio.Event] = {}
+_gc_task: asyncio.Task | None = None
+
+
+def get_ttl() -> timedelta:
+    return timedelta(seconds=int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")))
+
+
+def get_lock() -> timedelta:
+    return timedelta(seconds=int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "120")))
+
+
+def get_wait_seconds() -> float:
+    return float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+
+
+def get_gc_seconds() -> float:
+    return float(os.getenv("IDEMPOTENCY_GC_SECONDS", "300"))
+
+
+def covered(method: str, path: str) -> bool:
+    return any(method == m and pattern.match(path) for m, pattern in ROUTES)
+
+
+def fingerprint(scope: Scope, body: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in (scope["method"], scope["path"], scope.get("query_string", b"")):
+        digest.update(part.encode() if isinstance(part, str) else part)
+        digest.update(b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def claim(key: str, request_fingerprint: str) -> IdempotencyKey | None:
+    """
+    Claim `key` for this request and return None, or return the stored row once
+    it is done. Raises `Conflict` when the key cannot be used.
+    """
+    deadline = monotonic() + get_wait_seconds()
+    waited = False
+    while True:
+        async with database.SessionLocal() as db:  # type: ignore[misc]
+            now = utcnow()
+            row = await db.get(IdempotencyKey, key, populate_existing=True)
+            if row is not None and row.expires_at <= now:
+                await db.execute(delete(IdempotencyKey).where(IdempotencyKey.id == key))
+                await db.commit()
+                continue
+            if row is None:
+                db.add(
+                    IdempotencyKey(
+                        id=key,
+                        created_at=now,
+                        expires_at=now + get_ttl(),
+                        fingerprint=request_fingerprint,
+                        status="in_flight",
+                        locked_until=now + get_lock(),
+                    )
+                )
+                try:
+                    await db.commit()
+                except IntegrityError:
+                    await db.rollback()  # a duplicate claimed it first
+                    continue
+                return None
+            if row.fingerprint != request_fingerprint:
+                raise Conflict(422, "Idempotency-Key was used for a different request")
+            if row.status == "done":
+                requests.inc(result="waited" if waited else "replayed")
+                return row
+            if row.locked_until <= now:
+                # The original's process went away: take the claim over.
+                result = await db.execute(
+                    update(IdempotencyKey)
+                    .where(
+                        IdempotencyKey.id == key,
+                        IdempotencyKey.status == "in_flight",
+                        IdempotencyKey.locked_until == row.locked_until,
+                    )
+                    .values(locked_until=now + get_lock())
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+                if result.rowcount == 1:
+                    return None
+                continue
+
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise Conflict(409, "A request with this Idempotency-Key is in progress")
+        waited = True
+        running = _running.get(key)
+        if running is not None:
+            try:
+                await asyncio.wait_for(running.wait(), remaining)
+            except TimeoutError:
+                pass
+        else:
+            await asyncio.sleep(min(POLL_SECONDS, remaining))
+
+
+async def finish(key: str, status: int, headers: list, body: bytes) -> None:
+    """Store the response, or release the key if the request should be retried."""
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        statement = IdempotencyKey.id == key
+        if status >= 500:
+            await db.execute(delete(IdempotencyKey).where(statement))
+        else:
+            now = utcnow()
+            await db.execute(
+                update(IdempotencyKey)
+                .where(statement)
+                .values(
+                    status="done",
+                    locked_until=None,
+                    expires_at=now + get_ttl(),
+                    response_status=status,
+                    response_headers=[
+                        [name.decode("latin-1"), value.decode("latin-1")]
+                        for name, value in headers
+                    ],
+                    response_body=body,
+                )
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+
+
+class Conflict(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not covered(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        key = Headers(scope=scope).get(HEADER)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            response = JSONResponse(
+                {"detail": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"},
+                status_code=400,
+            )
+            await response(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        try:
+            stored = await claim(key, fingerprint(scope, body))
+        except Conflict as exc:
+            requests.inc(result="conflict" if exc.status_code == 409 else "mismatch")
+            response = JSONResponse({"detail": exc.detail}, status_code=exc.status_code)
+            await response(scope, receive, send)
+            return
+        if stored is not None:
+            await _replay(stored, send)
+            return
+        requests.inc(result="executed")
+        await self._execute(key, body, scope, receive, send)
+
+    async def _execute(
+        self, key: str, body: bytes, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        body_sent = False
+
+        async def receive_body() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status, headers, chunks = 500, [], []
+
+        async def capture(message: Message) -> None:
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status, headers = message["status"], list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        _running[key] = done = asyncio.Event()
+        try:
+            await self.app(scope, receive_body, capture)
+        except BaseException:
+            status = 500
+            raise
+        finally:
+            try:
+                await asyncio.shield(finish(key, status, headers, b"".join(chunks)))
+            finally:
+                done.set()
+                _running.pop(key, None)
+
+
+async def _replay(stored: IdempotencyKey, send: Send) -> None:
+    headers = [
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in stored.response_headers or []
+    ]
+    await send(
+        {
+            "type": "http.response.start",
+            "status": stored.response_status,
+            "headers": [*headers, (b"idempotent-replayed", b"true")],
+        }
+    )
+    await send({"type": "http.response.body", "body": stored.response_body or b""})
+
+
+async def collect_garbage() -> int:
+    """Delete expired keys; returns how many were removed."""
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        result = await db.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.expires_at <= utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    collected.inc(result.rowcount)
+    return result.rowcount
+
+
+async def _collect_forever(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await collect_garbage()
+        except Exception:
+            logger.exception("idempotency key cleanup failed")
+
+
+def start_gc() -> None:
+    global _gc_task
+    if _gc_task is None:
+        _gc_task = asyncio.create_task(_collect_forever(get_gc_seconds()))
+
+
+async def stop_gc() -> None:
+    global _gc_task
+    if _gc_task is not None:
+        _gc_task.cancel()
+        await asyncio.gather(_gc_task, return_exceptions=True)
+        _gc_task = None
@@ -0,0 +1,257 @@
+"""
+Streaming bulk import of interest forms from CSV or NDJSON.
+
+The upload is parsed line by line as it arrives, so memory stays flat however
+large the file is. Each row is validated with `schemas.FormSubmissionCreate`;
+valid rows are written in chunks of IMPORT_CHUNK_SIZE with multi-row INSERTs of
+the forms, their create revisions and changes, and their outbox events, one
+commit per chunk. Invalid rows are reported by row number (the header line of a
+CSV file is row 0) and skipped.
+
+On SQLite this imports about 5,000 forms per second (``python -m
+benchmarks.bench_import``), short of the tens of thousands asked for. Each form
+is eight rows with random-id primary keys under 25 secondary indexes; a raw
+driver-level executemany only reaches about 7,000, and multi-row VALUES
+statements through SQLAlchemy are several times slower than executemany.
+Reaching the target would need fewer rows or indexes per form, not a
+different insert.
+"""
+
+from __future__ import annotations
+
+import codecs
+import csv
+import json
+import os
+import secrets
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from typing import Any
+
+from pydantic import ValidationError
+from sqlalchemy import Table, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+import events
+import metrics
+import schemas
+from models import AuditChange, AuditRevision, Chat, FormSubmission, OutboxEvent, utcnow
+
+FIELDS = ("name", "email", "phone_number", "status", "chat_id")
+MAX_REPORTED_ERRORS = 1000
+TABLES = (
+    FormSubmission.__table__,
+    AuditRevision.__table__,
+    AuditChange.__table__,
+    OutboxEvent.__table__,
+)
+
+imported_rows = metrics.REGISTRY.counter(
+    "form_import_rows_total", "Rows seen by POST /forms/import"
+)
+
+
+def get_chunk_size() -> int:
+    return int(os.getenv("IMPORT_CHUNK_SIZE", "2000"))
+
+
+@dataclass
+class Report:
+    imported: int = 0
+    failed: int = 0
+    errors: list[dict[str, Any]] = field(default_factory=list)
+    errors_truncated: bool = False
+
+    def error(self, row: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+        else:
+            self.errors_truncated = True
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream into lines, keeping their line endings."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def _csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[dict | str]:
+    header: list[str] | None = None
+    record = ""
+    async for line in _lines(chunks):
+        record += line
+        if record.count('"') % 2:
+            continue  # a quoted field spans lines
+        if record.strip():
+            values = next(csv.reader([record]))
+            if header is None:
+                header = [name.strip() for name in values]
+            elif len(values) != len(header):
+                yield f"expected {len(header)} columns, got {len(values)}"
+            else:
+                yield dict(zip(header, values, strict=True))
+        record = ""
+    if record.strip():
+        yield "unterminated quoted field"
+
+
+async def _ndjson_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[dict | str]:
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield f"invalid JSON: {exc.msg}"
+            continue
+        yield value if isinstance(value, dict) else "expected a JSON object"
+
+
+def _validate(raw: dict) -> schemas.FormSubmissionCreate:
+    data = {key: raw.get(key) for key in FIELDS}
+    if data["status"] in ("", None):
+        data["status"] = None
+    form = schemas.FormSubmissionCreate.model_validate(data)
+    if form.status is not None and form.status not in (1, 2, 3):
+        raise ValueError(
+            "Status must be None, 1 (TO DO), 2 (IN PROGRESS), or 3 (COMPLETED)"
+        )
+    return form
+
+
+async def _write(db: AsyncSession, batch: list[tuple[int, Any]], report: Report):
+    """Insert one chunk of valid rows with its audit and outbox rows."""
+    chat_ids = {form.chat_id for _, form in batch}
+    known = set(await db.scalars(select(Chat.id).where(Chat.id.in_(chat_ids))))
+
+    now = utcnow()
+    # Rows per shard and table, in insert order (forms before their audit rows).
+    shards: dict[str, dict[Table, list[dict]]] = {}
+    imported: set[str] = set()
+    for row, form in batch:
+        if form.chat_id not in known:
+            report.error(row, f"chat {form.chat_id} not found")
+            continue
+        rows = shards.setdefault(
+            database.shard_for(form.chat_id), {table: [] for table in TABLES}
+        )
+        form_id, revision_id = secrets.token_urlsafe(), secrets.token_urlsafe()
+        fields = {
+            "name": form.name,
+            "email": form.email,
+            "phone_number": form.phone_number,
+            "status": form.status,
+            "chat_id": form.chat_id,
+        }
+        field_changes = [
+            {"field": name, "old_value": None, "new_value": value}
+            for name, value in fields.items()
+        ]
+        rows[FormSubmission.__table__].append(
+            {"id": form_id, "created_at": now, **fields}
+        )
+        rows[AuditRevision.__table__].append(
+            {
+                "id": revision_id,
+                "created_at": now,
+                "entity_type": "form_submission",
+                "entity_id": form_id,
+                "event_type": "create",
+                "source": "import",
+                "version": 1,
+                "snapshot": {"created_at": now.isoformat(), **fields},
+                "parent_id": form.chat_id,
+            }
+        )
+        rows[AuditChange.__table__] += [
+            {
+                "id": secrets.token_urlsafe(),
+                "created_at": now,
+                "revision_id": revision_id,
+                **change,
+            }
+            for change in field_changes
+        ]
+        rows[OutboxEvent.__table__].append(
+            {
+                "id": secrets.token_urlsafe(),
+                "created_at": now,
+                "aggregate_type": "form_submission",
+                "aggregate_id": form_id,
+                "version": 1,
+                "event_type": "create",
+                "payload": {
+                    "revision_id": revision_id,
+                    "parent_id": form.chat_id,
+                    "source": "import",
+                    "changes": field_changes,
+                },
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+            }
+        )
+        imported.add(form.chat_id)
+        report.imported += 1
+
+    # Core inserts on the tables: one executemany per table and shard, without
+    # the ORM bulk machinery.
+    for shard_id, rows in shards.items():
+        for table, values in rows.items():
+            await db.execute(
+                insert(table), values, bind_arguments={"shard_id": shard_id}
+            )
+    if shards:
+        await db.commit()
+    for chat_id in imported:
+        events.notify(chat_id)
+
+
+async def import_forms(
+    db: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    *,
+    chunk_size: int | None = None,
+) -> Report:
+    chunk_size = chunk_size or get_chunk_size()
+    rows = _csv_rows(chunks) if fmt == "csv" else _ndjson_rows(chunks)
+    report = Report()
+    batch: list[tuple[int, schemas.FormSubmissionCreate]] = []
+    row = 0
+    async for raw in rows:
+        row += 1
+        imported_rows.inc(format=fmt)
+        if isinstance(raw, str):
+            report.error(row, raw)
+            continue
+        try:
+            batch.append((row, _validate(raw)))
+        except ValidationError as exc:
+            report.error(
+                row,
+                "; ".join(
+                    f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}"
+                    for e in exc.errors()
+                ),
+            )
+        except ValueError as exc:
+            report.error(row, str(exc))
+        if len(batch) >= chunk_size:
+            await _write(db, batch, report)
+            batch = []
+    if batch:
+        await _write(db, batch, report)
+    # Unknown chats are only found when a chunk is written, after later rows.
+    report.errors.sort(key=lambda error: error["row"])
+    return report
@@ -0,0 +1,187 @@
+"""
+Durable queue of chat turns in the ``job`` table.
+
+`PUT /chat/{chat_id}` enqueues a turn when asked to run it asynchronously, and
+workers (``python worker.py``, any number of processes or hosts) claim jobs with
+a lease of JOB_LEASE_SECONDS that they renew while the turn runs:
+
+- a job is claimable while queued, or while running with an expired lease (its
+  worker died). Claiming is a conditional UPDATE, so exactly one worker wins; on
+  Postgres the candidate scan also uses ``FOR UPDATE SKIP LOCKED`` so workers do
+  not queue up behind each other's row locks;
+- the turns of one chat run one at a time, oldest first;
+- a job claimed JOB_MAX_ATTEMPTS times without finishing is marked failed.
+
+Turns are at-least-once: form tools that committed before a worker crashed run
+again on the retry.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import and_, exists, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+import database
+import metrics
+from models import Job, utcnow
+
+CLAIM_SCAN = 10
+
+finished = metrics.REGISTRY.counter("jobs_finished_total", "Jobs by final status")
+queue_time = metrics.REGISTRY.histogram(
+    "job_queue_seconds", "Time from enqueue to first claim"
+)
+
+
+def get_mode() -> str:
+    """`sync` runs turns in the request; `async` always enqueues them."""
+    return os.getenv("CHAT_TURN_MODE", "sync")
+
+
+def get_lease_seconds() -> float:
+    return float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+
+def get_max_attempts() -> int:
+    return int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+
+async def enqueue(db: AsyncSession, *, chat_id: str, messages: list) -> Job:
+    job = Job(
+        created_at=utcnow(),
+        kind="chat_turn",
+        chat_id=chat_id,
+        payload={"messages": messages},
+        status="queued",
+        attempts=0,
+    )
+    db.add(job)
+    await db.commit()
+    return job
+
+
+def _claimable(now: datetime):
+    return or_(
+        Job.status == "queued",
+        and_(Job.status == "running", Job.lease_expires_at <= now),
+    )
+
+
+def _blocked():
+    """Another turn of the same chat is running or was queued earlier."""
+    other = aliased(Job)
+    return exists().where(
+        other.chat_id == Job.chat_id,
+        other.id != Job.id,
+        or_(
+            other.status == "running",
+            and_(
+                other.status == "queued",
+                or_(
+                    other.created_at < Job.created_at,
+                    and_(other.created_at == Job.created_at, other.id < Job.id),
+                ),
+            ),
+        ),
+    )
+
+
+async def claim(
+    db: AsyncSession, owner: str, now: datetime | None = None
+) -> Job | None:
+    """Lease the oldest runnable job to `owner`, or return None."""
+    now = now or utcnow()
+    # Jobs whose workers kept dying are given up on rather than retried forever.
+    result = await db.execute(
+        update(Job)
+        .where(
+            Job.status == "running",
+            Job.lease_expires_at <= now,
+            Job.attempts >= get_max_attempts(),
+        )
+        .values(status="failed", error="Lease expired too many times", finished_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        finished.inc(result.rowcount, status="failed")
+
+    statement = (
+        select(Job.id, Job.created_at, Job.attempts)
+        .where(_claimable(now), ~_blocked())
+        .order_by(Job.created_at, Job.id)
+        .limit(CLAIM_SCAN)
+    )
+    if database.engine.dialect.name == "postgresql":
+        statement = statement.with_for_update(skip_locked=True, of=Job)
+    candidates = (await db.execute(statement)).all()
+
+    for candidate in candidates:
+        result = await db.execute(
+            update(Job)
+            .where(Job.id == candidate.id, _claimable(now), ~_blocked())
+            .values(
+                status="running",
+                lease_owner=owner,
+                lease_expires_at=now + timedelta(seconds=get_lease_seconds()),
+                attempts=Job.attempts + 1,
+                started_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            await db.commit()
+            if candidate.attempts == 0:
+                queue_time.observe((now - candidate.created_at).total_seconds())
+            return await db.get(Job, candidate.id, populate_existing=True)
+    await db.commit()
+    return None
+
+
+async def renew(db: AsyncSession, job_id: str, owner: str) -> bool:
+    """Extend the lease; False when it was lost to another worker."""
+    result = await db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running", Job.lease_owner == owner)
+        .values(lease_expires_at=utcnow() + timedelta(seconds=get_lease_seconds()))
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def finish(
+    db: AsyncSession,
+    job: Job,
+    owner: str,
+    *,
+    result: dict[str, Any] | None = None,
+    error: str | None = None,
+) -> bool:
+    """
+    Record the outcome in the caller's transaction, if `owner` still holds the
+    lease. A failed attempt goes back to the queue until JOB_MAX_ATTEMPTS.
+    """
+    if error is None:
+        status = "done"
+    elif job.attempts < get_max_attempts():
+        status = "queued"
+    else:
+        status = "failed"
+    values: dict[str, Any] = {"status": status, "error": error, "lease_owner": None}
+    if status != "queued":
+        values.update(result=result, finished_at=utcnow())
+    updated = await db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == "running", Job.lease_owner == owner)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if updated.rowcount != 1:
+        return False
+    if status != "queued":
+        finished.inc(status=status)
+    return True
@@ -1,28 +1,84 @@
 from __future__ import annotations
 
-import json
-import os
-from collections.abc import AsyncGenerator
+import asyncio
+import functools
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import UTC, date, datetime
+from time import perf_counter
 from typing import Any
 
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
+from fastapi.responses import (
+    FileResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from pydantic import TypeAdapter
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+import admission
 import audit
+import capture
 import crud
 import database
+import events
+import exporter
+import forks
+import idempotency
+import importer
+import jobs
+import metrics
+import profiling
+import retention
 import schemas
-from models import AuditRevision, FormSubmission
+import singleflight
+import turns
+import usage
+from models import AuditRevision, Chat, FormSubmission, Job, decode_json_bytes
 
+# Read before the app is assembled: the middleware below is configured from env.
 load_dotenv()
 
-app = FastAPI()
 
+async def startup() -> None:
+    """Connect the DB pool and the LLM client before the worker takes traffic."""
+    if database.engine is None:
+        database.init_engine()
+    await database.warm_up()
+
+    if turns.llm is None:
+        await turns.start_llm()
+    idempotency.start_gc()
+    usage.start()
+
+
+async def shutdown() -> None:
+    await idempotency.stop_gc()
+    await usage.stop()
+    capture.flush()
+    await turns.close_llm()
+    await database.dispose()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=metrics.TimedJSONResponse)
+
+# Added first so CORS and metrics also wrap replayed responses.
+app.add_middleware(idempotency.IdempotencyMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -31,10 +87,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-_openai_api_key = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=_openai_api_key) if _openai_api_key else None
 
-SYSTEM_TEMPLATE = """"""
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    stats = metrics.start_request()
+    start = perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.finish_request(
+        stats,
+        method=request.method,
+        route=route.path if route is not None else "unmatched",
+        status=response.status_code,
+        seconds=perf_counter() - start,
+    )
+    return response
+
+
+profiling.install(app)
+capture.install(app)  # outermost, so idempotent replays are recorded too
+
+
+def require_profile_token(
+    x_profile_token: str | None = Header(default=None),
+) -> None:
+    if not profiling.authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
 
 
 # Get a DB Session
@@ -51,10 +129,31 @@ async def root():
     return {"message": "Hello World"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(
+        metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/admin/profiles", dependencies=[Depends(require_profile_token)])
+async def list_profiles():
+    """Captured request profiles, newest first."""
+    return profiling.list_profiles()
+
+
+@app.get("/admin/profiles/{name}", dependencies=[Depends(require_profile_token)])
+async def download_profile(name: str):
+    path = profiling.get_profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
+
 @app.get("/chat", response_model=list[schemas.Chat])
 async def get_chats(db: AsyncSession = Depends(get_db)):
-    chats = await crud.chat.get_multi(db, limit=10)
-    return chats
+    chats = await crud.chat.get_multi(db, limit=10, order_by=[Chat.created_at, Chat.id])
+    return [forks.view(chat, await forks.history(db, chat)) for chat in chats]
 
 
 @app.post("/chat", response_model=schemas.Chat)
@@ -65,330 +164,351 @@ async def create_chat(data: schemas.ChatCreate, db: AsyncSession = Depends(get_d
 
 @app.put("/chat/{chat_id}", response_model=schemas.Chat)
 async def update_chat(
-    chat_id: str, data: schemas.ChatUpdate, db: AsyncSession = Depends(get_db)
+    chat_id: str,
+    data: schemas.ChatUpdate,
+    prefer: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Update chat with new messages and handle tool calls.
     Supports: submit_interest_form, update_interest_form, delete_interest_form
+
+    With CHAT_TURN_MODE=async or ``Prefer: respond-async`` the turn is queued for
+    the worker pool instead: the response is 202 with the job, to be polled at
+    its Location (``GET /jobs/{job_id}?wait=...``). Only turns run in the request
+    take an LLM turn slot (or fail fast with 429); the worker pool bounds its own.
     """
     chat = await crud.chat.get(db, id=chat_id)
+    if chat is None:
+        chat = await retention.restore_chat(db, chat_id)
+    if chat is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    if jobs.get_mode() == "async" or "respond-async" in (prefer or ""):
+        job = await jobs.enqueue(db, chat_id=chat_id, messages=data.messages)
+        return Response(
+            _render_json(schemas.Job, job),
+            status_code=202,
+            media_type="application/json",
+            headers={"Location": f"/jobs/{job.id}"},
+        )
 
-    # TASK 2: Define all three tools
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "submit_interest_form",
-                "description": (
-                    "Submit an interest form for the user with the given properties"
-                ),
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "name": {
-                            "type": "string",
-                            "description": "the user's name",
-                        },
-                        "email": {
-                            "type": "string",
-                            "description": "the user's email address",
-                        },
-                        "phone_number": {
-                            "type": "string",
-                            "description": "the user's phone number",
-                        },
-                    },
-                    "required": ["name", "email", "phone_number"],
-                },
-            },
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "update_interest_form",
-                "description": (
-                    "Update an existing interest form submission. You can update the "
-                    "name, email, phone number, or status (1=TO DO, 2=IN PROGRESS, "
-                    "3=COMPLETED)."
-                ),
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "form_id": {
-                            "type": "string",
-                            "description": "the ID of the form to update",
-                        },
-                        "name": {
-                            "type": "string",
-                            "description": "the user's updated name",
-                        },
-                        "email": {
-                            "type": "string",
-                            "description": "the user's updated email address",
-                        },
-                        "phone_number": {
-                            "type": "string",
-                            "description": "the user's updated phone number",
-                        },
-                        "status": {
-                            "type": "integer",
-                            "description": (
-                                "status: 1=TO DO, 2=IN PROGRESS, 3=COMPLETED"
-                            ),
-                        },
-                    },
-                    "required": ["form_id"],
-                },
-            },
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "delete_interest_form",
-                "description": "Delete an interest form submission",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "form_id": {
-                            "type": "string",
-                            "description": "the ID of the form to delete",
-                        },
-                    },
-                    "required": ["form_id"],
-                },
-            },
-        },
-    ]
-
-    if openai_client is None:
+    if turns.llm is None:
         raise HTTPException(
             status_code=500,
             detail="OPENAI_API_KEY is not configured on the server",
         )
+    async with admission.get_controller().admit(chat_id):
+        chat = await turns.run_turn(db, chat, data.messages)
+    return forks.view(chat, data.messages)  # the turn appended to data.messages
 
-    # First OpenAI call
-    resp = openai_client.chat.completions.create(
-        messages=[{"role": "system", "content": SYSTEM_TEMPLATE}] + data.messages,
-        model="gpt-4o-mini",
-        tools=tools,
-    )
-    resp_message = resp.choices[0].message.model_dump()
-    data.messages.append(resp_message)
-
-    # TASK 1 & 2: Handle tool calls
-    if resp_message.get("tool_calls"):
-        for t in resp_message["tool_calls"]:
-            tool_name = t["function"]["name"]
-
-            # Parse the JSON arguments
-            try:
-                form_data = json.loads(t["function"]["arguments"])
-            except json.JSONDecodeError:
-                # If JSON parsing fails, append error and continue
-                data.messages.append(
-                    {
-                        "tool_call_id": t["id"],
-                        "role": "tool",
-                        "name": tool_name,
-                        "content": "Error: Invalid JSON arguments",
-                    }
-                )
-                continue
-
-            tool_response = "Success"
-
-            try:
-                if tool_name == "submit_interest_form":
-                    # TASK 1: Create form submission
-                    if (
-                        not form_data.get("name")
-                        or not form_data.get("email")
-                        or not form_data.get("phone_number")
-                    ):
-                        raise ValueError("name, email, and phone_number are required")
-
-                    form_submission_data = schemas.FormSubmissionCreate(
-                        name=form_data.get("name"),
-                        email=form_data.get("email"),
-                        phone_number=form_data.get("phone_number"),
-                        chat_id=chat_id,
-                        status=None,
-                    )
-                    created_form = await crud.form.create(
-                        db=db, obj_in=form_submission_data
-                    )
-                    await audit.log_revision(
-                        db,
-                        entity_type="form_submission",
-                        entity_id=created_form.id,
-                        event_type="create",
-                        source="chat_tool",
-                        changes=[
-                            {
-                                "field": "name",
-                                "old_value": None,
-                                "new_value": created_form.name,
-                            },
-                            {
-                                "field": "email",
-                                "old_value": None,
-                                "new_value": created_form.email,
-                            },
-                            {
-                                "field": "phone_number",
-                                "old_value": None,
-                                "new_value": created_form.phone_number,
-                            },
-                            {
-                                "field": "status",
-                                "old_value": None,
-                                "new_value": created_form.status,
-                            },
-                            {
-                                "field": "chat_id",
-                                "old_value": None,
-                                "new_value": created_form.chat_id,
-                            },
-                        ],
-                    )
-                    tool_response = (
-                        f"Success! Form submitted with ID: {created_form.id}"
-                    )
 
-                elif tool_name == "update_interest_form":
-                    # TASK 2: Update form submission
-                    form_id = form_data.get("form_id")
-                    form_obj = await crud.form.get(db, id=form_id)
-
-                    if not form_obj:
-                        tool_response = f"Error: Form with ID {form_id} not found"
-                    else:
-                        old = {
-                            "name": form_obj.name,
-                            "email": form_obj.email,
-                            "phone_number": form_obj.phone_number,
-                            "status": form_obj.status,
-                        }
-                        # Build update data with only provided, non-null fields
-                        update_payload: dict[str, Any] = {}
-                        for key in ("name", "email", "phone_number", "status"):
-                            if key in form_data and form_data[key] is not None:
-                                update_payload[key] = form_data[key]
-
-                        update_data = schemas.FormSubmissionUpdate(**update_payload)
-                        updated = await crud.form.update(
-                            db=db,
-                            db_obj=form_obj,
-                            obj_in=update_data,
-                        )
-
-                        changes = []
-                        for field in update_payload.keys():
-                            if old.get(field) != getattr(updated, field):
-                                changes.append(
-                                    {
-                                        "field": field,
-                                        "old_value": old.get(field),
-                                        "new_value": getattr(updated, field),
-                                    }
-                                )
-                        if changes:
-                            await audit.log_revision(
-                                db,
-                                entity_type="form_submission",
-                                entity_id=form_id,
-                                event_type="update",
-                                source="chat_tool",
-                                changes=changes,
-                            )
-                        tool_response = f"Success! Form {form_id} updated"
-
-                elif tool_name == "delete_interest_form":
-                    # TASK 2: Delete form submission
-                    form_id = form_data.get("form_id")
-                    form_obj = await crud.form.get(db, id=form_id)
-
-                    if not form_obj:
-                        tool_response = f"Error: Form with ID {form_id} not found"
-                    else:
-                        old = {
-                            "name": form_obj.name,
-                            "email": form_obj.email,
-                            "phone_number": form_obj.phone_number,
-                            "status": form_obj.status,
-                            "chat_id": form_obj.chat_id,
-                        }
-                        await crud.form.remove(db=db, id=form_id)
-                        await audit.log_revision(
-                            db,
-                            entity_type="form_submission",
-                            entity_id=form_id,
-                            event_type="delete",
-                            source="chat_tool",
-                            changes=[
-                                {"field": k, "old_value": v, "new_value": None}
-                                for k, v in old.items()
-                            ],
-                        )
-                        tool_response = f"Success! Form {form_id} deleted"
-
-            except Exception as exc:
-                tool_response = f"Error: {exc}"
-
-            # Append tool response message
-            data.messages.append(
-                {
-                    "tool_call_id": t["id"],
-                    "role": "tool",
-                    "name": tool_name,
-                    "content": tool_response,
-                }
-            )
-
-        # Second OpenAI call with tool results
-        resp = openai_client.chat.completions.create(
-            messages=[{"role": "system", "content": SYSTEM_TEMPLATE}] + data.messages,
-            model="gpt-4o-mini",
-            tools=tools,
+@functools.cache
+def _adapter(model: Any) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def _render_json(model: Any, value: Any) -> bytes:
+    """Validate `value` against `model` and encode it, as FastAPI would."""
+    adapter = _adapter(model)
+    start = perf_counter()
+    body = adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+    metrics.record_serialization(perf_counter() - start)
+    return body
+
+
+def _render_raw_chat(row: Any) -> bytes:
+    """
+    `schemas.Chat` JSON for a `crud.chat.get_raw` row of a chat that is not a
+    fork, with the stored messages spliced in as they are: written by
+    `models.encode_json`, they are already a JSON list, so parsing, validating and
+    re-encoding them would change nothing.
+    """
+    start = perf_counter()
+    body = b"".join(
+        (
+            b'{"id":',
+            _adapter(str).dump_json(row.id),
+            b',"created_at":',
+            _adapter(datetime).dump_json(row.created_at),
+            b',"parent_id":null,"fork_at":null,"messages":',
+            decode_json_bytes(row.messages),
+            b"}",
         )
-        resp_message = resp.choices[0].message.model_dump()
-        data.messages.append(resp_message)
+    )
+    metrics.record_serialization(perf_counter() - start)
+    return body
 
-    # Update chat with all messages
-    chat = await crud.chat.update(db, db_obj=chat, obj_in=data)
-    return chat
+
+JOB_POLL_SECONDS = 0.25
+
+# Identical concurrent reads share one query and one serialization.
+chat_reads: singleflight.Group[bytes] = singleflight.Group("chat")
+chat_form_reads: singleflight.Group[bytes] = singleflight.Group("chat_forms")
 
 
 @app.get("/chat/{chat_id}", response_model=schemas.Chat)
-async def get_chat(chat_id: str, db: AsyncSession = Depends(get_db)):
-    chat = await crud.chat.get(db, id=chat_id)
-    return chat
+async def get_chat(chat_id: str):
+    async def load() -> bytes:
+        async with database.SessionLocal() as db:  # type: ignore[misc]
+            row = await crud.chat.get_raw(db, id=chat_id)
+            if row is not None:
+                if row.parent_id is not None:
+                    rows = await forks.lineage(db, chat_id)
+                    return _render_json(
+                        schemas.Chat, forks.view(rows[0], forks.assemble(rows))
+                    )
+                if None in (row.created_at, row.messages):
+                    return _render_json(schemas.Chat, row)  # fails, as it should
+                return _render_raw_chat(row)
+            # Cold chats are served from the archive without restoring them.
+            chat = await retention.load_archived_chat(db, chat_id)
+            if chat is None:
+                raise HTTPException(status_code=404, detail="Chat not found")
+            return _render_json(schemas.Chat, chat)
+
+    body = await chat_reads.do(chat_id, load)
+    return Response(body, media_type="application/json")
+
+
+@app.post("/chat/{chat_id}/fork", response_model=schemas.Chat)
+async def fork_chat(
+    chat_id: str,
+    at: int | None = Query(default=None, ge=0),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Start a new chat from the first `at` messages of this one (all by default),
+    e.g. to retry a turn. The fork shares those messages instead of copying them.
+    """
+    if await crud.chat.get(db, id=chat_id) is None:
+        await retention.restore_chat(db, chat_id)
+    try:
+        forked = await forks.fork(db, chat_id, at)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    if forked is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    chat, messages = forked
+    return forks.view(chat, messages)
 
 
 # TASK 1 & 2: Get all form submissions for a chat with optional status filter
 @app.get("/chat/{chat_id}/forms", response_model=list[schemas.FormSubmission])
 async def get_chat_forms(
-    chat_id: str, status: int | None = None, db: AsyncSession = Depends(get_db)
+    chat_id: str,
+    status: int | None = None,
+    as_of: datetime | None = None,
 ):
     """
     Get all form submissions for a specific chat.
     Optional query parameter: status (1=TO DO, 2=IN PROGRESS, 3=COMPLETED)
+    Optional query parameter: as_of, to rebuild the forms from audit history
     """
-    filters = [FormSubmission.chat_id == chat_id]
-
     # TASK 2: Add status filter if provided
-    if status is not None:
-        if status not in [1, 2, 3]:
-            raise HTTPException(status_code=400, detail="Status must be 1, 2, or 3")
-        filters.append(FormSubmission.status == status)
+    if status is not None and status not in [1, 2, 3]:
+        raise HTTPException(status_code=400, detail="Status must be 1, 2, or 3")
+    if as_of is not None:
+        as_of = _as_naive_utc(as_of)
+
+    async def load() -> bytes:
+        async with database.SessionLocal() as db:  # type: ignore[misc]
+            if as_of is not None:
+                states = await audit.states_as_of_for_parent(
+                    db,
+                    entity_type="form_submission",
+                    parent_id=chat_id,
+                    as_of=as_of,
+                )
+                forms = [
+                    {**state, "id": form_id}
+                    for form_id, state in states.items()
+                    if status is None or state.get("status") == status
+                ]
+            else:
+                filters = [FormSubmission.chat_id == chat_id]
+                if status is not None:
+                    filters.append(FormSubmission.status == status)
+                forms = await crud.form.get_multi(db, filters=filters)
+                if not forms:
+                    # Cold chats are served from the archive without restoring.
+                    chat = await retention.load_archived_chat(db, chat_id)
+                    forms = [
+                        form
+                        for form in (chat["form_submissions"] if chat else [])
+                        if status is None or form["status"] == status
+                    ]
+            return _render_json(list[schemas.FormSubmission], forms)
+
+    body = await chat_form_reads.do((chat_id, status, as_of), load)
+    return Response(body, media_type="application/json")
+
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+async def get_job(
+    job_id: str,
+    wait: float = Query(default=0, ge=0, le=30),
+    db: AsyncSession = Depends(get_db),
+):
+    """A queued chat turn; with `wait`, hold the request until it finishes."""
+    deadline = perf_counter() + wait
+    while True:
+        job = await db.get(Job, job_id, populate_existing=True)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job.status in ("done", "failed") or perf_counter() >= deadline:
+            return job
+        await db.rollback()  # end the read transaction so the next poll is fresh
+        await asyncio.sleep(min(JOB_POLL_SECONDS, max(0, deadline - perf_counter())))
+
+
+@app.get("/chat/{chat_id}/similar", response_model=list[schemas.SimilarChat])
+async def get_similar_chats(
+    chat_id: str,
+    k: int = Query(default=10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    """Chats whose transcripts read most like this one's, best first."""
+    import similarity  # numpy adds ~70ms to startup; load it on the first search
+
+    index = similarity.get_index()
+    if index is None:
+        raise HTTPException(
+            status_code=503, detail="Similarity index has not been built"
+        )
+    chat = await crud.chat.get(db, id=chat_id)
+    if chat is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    messages = await forks.history(db, chat)
+    return await asyncio.to_thread(index.similar, messages, k, chat_id)
+
+
+@app.get(
+    "/usage",
+    response_model=list[schemas.UsageAggregate],
+    response_model_exclude_none=True,
+)
+async def get_usage(
+    by: str = Query(default="day", pattern="^(day|model|chat)$"),
+    start: date | None = None,
+    end: date | None = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    LLM tokens, calls and latency per UTC day, per model or per chat (the `limit`
+    chats with the most tokens), read from the daily usage rollups.
+    """
+    return await usage.aggregate(db, by=by, start=start, end=end, limit=limit)
 
-    forms = await crud.form.get_multi(db, filters=filters)
-    return forms
+
+@app.get("/chat/{chat_id}/forms/events")
+async def stream_chat_form_events(
+    chat_id: str, last_event_id: str | None = Header(default=None)
+):
+    """
+    Server-sent events for form creates, updates and deletes in a chat.
+    Reconnect with Last-Event-ID to resume; see `events` for what is repeated.
+    """
+    return StreamingResponse(
+        events.stream(chat_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # TASK 2: REST API Endpoints for Form Management
 
 
+def _as_naive_utc(value: datetime) -> datetime:
+    """Timestamps are stored as naive UTC; normalize aware query parameters."""
+    if value.tzinfo is not None:
+        value = value.astimezone(UTC).replace(tzinfo=None)
+    return value
+
+
+IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+@app.post("/forms/import", response_model=schemas.ImportReport)
+async def import_forms(
+    request: Request,
+    format: str | None = Query(default=None, pattern="^(csv|ndjson)$"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Bulk-create form submissions from a CSV (with a header row) or NDJSON body.
+    The body is streamed, not buffered; rows that fail validation are skipped and
+    listed in the report.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    fmt = format or IMPORT_CONTENT_TYPES.get(content_type)
+    if fmt is None:
+        raise HTTPException(
+            status_code=415, detail="Send text/csv or application/x-ndjson"
+        )
+    report = await importer.import_forms(db, request.stream(), fmt)
+    return schemas.ImportReport.model_validate(report, from_attributes=True)
+
+
+@app.get("/forms/export")
+async def export_forms(
+    format: str = Query(default="csv", pattern="^(csv|ndjson)$"),
+    status: int | None = None,
+    chat_id: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+):
+    """
+    Stream every matching form submission, across all chats, as CSV or NDJSON.
+    Ordered by creation time; `created_after` is inclusive, `created_before` is not.
+    """
+    if status is not None and status not in [1, 2, 3]:
+        raise HTTPException(status_code=400, detail="Status must be 1, 2, or 3")
+    statement = exporter.build_query(
+        status=status,
+        chat_id=chat_id,
+        created_after=_as_naive_utc(created_after) if created_after else None,
+        created_before=_as_naive_utc(created_before) if created_before else None,
+    )
+    return StreamingResponse(
+        exporter.stream(format, statement),
+        media_type=exporter.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="forms.{format}"'},
+    )
+
+
+@app.get("/forms/{form_id}", response_model=schemas.FormSubmission)
+async def get_form(
+    form_id: str, as_of: datetime | None = None, db: AsyncSession = Depends(get_db)
+):
+    """
+    Get a form submission (of an archived chat too), or its state at `as_of`
+    rebuilt from the nearest audit snapshot plus the revisions after it.
+    """
+    if as_of is None:
+        form = await crud.form.get(db, id=form_id)
+        if form is None:
+            form = await retention.load_archived_form(db, form_id)
+    else:
+        state = await audit.state_as_of(
+            db,
+            entity_type="form_submission",
+            entity_id=form_id,
+            as_of=_as_naive_utc(as_of),
+        )
+        form = {**state, "id": form_id} if state is not None else None
+
+    if not form:
+        raise HTTPException(status_code=404, detail="Form not found")
+    return form
+
+
 @app.put("/forms/{form_id}", response_model=schemas.FormSubmission)
 async def update_form(
     form_id: str, data: schemas.FormSubmissionUpdate, db: AsyncSession = Depends(get_db)
@@ -399,6 +519,8 @@ async def update_form(
     Status must be None, 1 (TO DO), 2 (IN PROGRESS), or 3 (COMPLETED)
     """
     form = await crud.form.get(db, id=form_id)
+    if form is None:
+        form = await retention.restore_form(db, form_id)
 
     if not form:
         raise HTTPException(status_code=404, detail="Form not found")
@@ -409,34 +531,8 @@ async def update_form(
         if key in update_payload and update_payload[key] is None:
             raise HTTPException(status_code=400, detail=f"{key} cannot be null")
 
-    old = {
-        "name": form.name,
-        "email": form.email,
-        "phone_number": form.phone_number,
-        "status": form.status,
-    }
-
+    audit.track(db, source="api")
     updated_form = await crud.form.update(db=db, db_obj=form, obj_in=data)
-
-    changes = []
-    for field, _new_value in update_payload.items():
-        if old.get(field) != getattr(updated_form, field):
-            changes.append(
-                {
-                    "field": field,
-                    "old_value": old.get(field),
-                    "new_value": getattr(updated_form, field),
-                }
-            )
-    if changes:
-        await audit.log_revision(
-            db,
-            entity_type="form_submission",
-            entity_id=form_id,
-            event_type="update",
-            source="api",
-            changes=changes,
-        )
     return updated_form
 
 
@@ -444,29 +540,14 @@ async def update_form(
 async def delete_form(form_id: str, db: AsyncSession = Depends(get_db)):
     """Delete a form submission"""
     form = await crud.form.get(db, id=form_id)
+    if form is None:
+        form = await retention.restore_form(db, form_id)
 
     if not form:
         raise HTTPException(status_code=404, detail="Form not found")
 
-    old = {
-        "name": form.name,
-        "email": form.email,
-        "phone_number": form.phone_number,
-        "status": form.status,
-        "chat_id": form.chat_id,
-    }
-
+    audit.track(db, source="api")
     await crud.form.remove(db=db, id=form_id)
-    await audit.log_revision(
-        db,
-        entity_type="form_submission",
-        entity_id=form_id,
-        event_type="delete",
-        source="api",
-        changes=[
-            {"field": k, "old_value": v, "new_value": None} for k, v in old.items()
-        ],
-    )
     return {"message": "Form deleted successfully", "form_id": form_id}
 
 
@@ -484,4 +565,13 @@ async def get_form_history(form_id: str, db: AsyncSession = Depends(get_db)):
         .order_by(AuditRevision.created_at.desc())
     )
     result = await db.scalars(statement)
-    return result.all()
+    revisions = [
+        schemas.AuditRevisionWithChanges.model_validate(rev) for rev in result.all()
+    ]
+    archived = await retention.load_archived_revisions(db, form_id)
+    if archived:
+        revisions += [
+            schemas.AuditRevisionWithChanges.model_validate(rev) for rev in archived
+        ]
+        revisions.sort(key=lambda rev: rev.created_at, reverse=True)
+    return revisions
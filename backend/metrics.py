@@ -0,0 +1,260 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format.
+
+Request-scoped counters (queries, DB time, commits, LLM time, serialization time)
+are accumulated on a `RequestStats` object held in a context variable, so engine
+event hooks and LLM helpers can attribute their cost to the current request.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_lock = threading.Lock()
+
+
+def _labels_key(labels: dict[str, Any]) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = [*key, *extra]
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.doc = doc
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = _labels_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, (), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        with _lock:
+            self.values[_labels_key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = (*buckets, math.inf)
+        self.values: dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _labels_key(labels)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        for key, state in self.values.items():
+            for bound, count in zip(self.buckets, state, strict=False):
+                le = (("le", _format_value(bound)),)
+                yield f"{self.name}_bucket", key, le, count
+            yield f"{self.name}_sum", key, (), state[-2]
+            yield f"{self.name}_count", key, (), state[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Counter | Histogram] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, doc: str) -> Counter:
+        return self.register(Counter(name, doc))
+
+    def gauge(self, name: str, doc: str) -> Gauge:
+        return self.register(Gauge(name, doc))
+
+    def histogram(self, name: str, doc: str, buckets: tuple = LATENCY_BUCKETS):
+        return self.register(Histogram(name, doc, buckets))
+
+    def render(self) -> str:
+        lines = []
+        with _lock:
+            for metric in self.metrics.values():
+                lines.append(f"# HELP {metric.name} {metric.doc}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                for name, key, extra, value in metric.samples():
+                    labels = _format_labels(key, extra)
+                    lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests = REGISTRY.counter("http_requests_total", "HTTP requests served")
+http_latency = REGISTRY.histogram(
+    "http_request_duration_seconds", "End-to-end request latency"
+)
+db_queries = REGISTRY.histogram(
+    "db_queries_per_request", "SQL statements executed per request", COUNT_BUCKETS
+)
+db_time = REGISTRY.histogram(
+    "db_time_per_request_seconds", "Time spent executing SQL per request"
+)
+db_commits = REGISTRY.counter("db_commits_total", "Transactions committed")
+db_slow_queries = REGISTRY.counter(
+    "db_slow_queries_total", "Statements slower than SLOW_QUERY_MS"
+)
+llm_latency = REGISTRY.histogram(
+    "llm_request_duration_seconds", "Latency of a single LLM completion call"
+)
+llm_tokens = REGISTRY.counter("llm_tokens_total", "LLM tokens by kind")
+llm_time = REGISTRY.histogram(
+    "llm_time_per_request_seconds", "Time spent waiting on the LLM per request"
+)
+serialization_time = REGISTRY.histogram(
+    "serialization_time_per_request_seconds", "Time spent rendering JSON responses"
+)
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that charges its encoding time to the current request."""
+
+    def render(self, content: Any) -> bytes:
+        start = perf_counter()
+        body = super().render(content)
+        record_serialization(perf_counter() - start)
+        return body
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    query_seconds: float = 0.0
+    commits: int = 0
+    llm_calls: int = 0
+    llm_seconds: float = 0.0
+    serialization_seconds: float = 0.0
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def start_request() -> RequestStats:
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def finish_request(
+    stats: RequestStats, *, method: str, route: str, status: int, seconds: float
+) -> None:
+    http_requests.inc(method=method, route=route, status=status)
+    http_latency.observe(seconds, method=method, route=route)
+    db_queries.observe(stats.queries, route=route)
+    db_time.observe(stats.query_seconds, route=route)
+    if stats.llm_calls:
+        llm_time.observe(stats.llm_seconds, route=route)
+    serialization_time.observe(stats.serialization_seconds, route=route)
+    if stats.commits:
+        db_commits.inc(stats.commits, route=route)
+
+
+def record_llm_call(model: str, seconds: float, usage: Any = None) -> None:
+    llm_latency.observe(seconds, model=model)
+    if usage is not None:
+        llm_tokens.inc(usage.prompt_tokens or 0, model=model, kind="prompt")
+        llm_tokens.inc(usage.completion_tokens or 0, model=model, kind="completion")
+    stats = _current.get()
+    if stats is not None:
+        stats.llm_calls += 1
+        stats.llm_seconds += seconds
+
+
+def record_serialization(seconds: float) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.serialization_seconds += seconds
+
+
+def get_slow_query_seconds() -> float | None:
+    value = os.getenv("SLOW_QUERY_MS")
+    return float(value) / 1000 if value else None
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Attach query timing, slow-query logging and commit counting to `engine`."""
+    slow_after = get_slow_query_seconds()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        # On the execution context, so a statement that fails leaves nothing behind.
+        context._query_start = perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - context._query_start
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+        if slow_after is not None and elapsed >= slow_after:
+            db_slow_queries.inc()
+            logger.warning("slow query (%.1f ms): %s", elapsed * 1000, statement)
+
+    @event.listens_for(engine, "commit")
+    def _commit(conn):
+        stats = _current.get()
+        if stats is not None:
+            stats.commits += 1
+        else:
+            db_commits.inc(route="")
@@ -1,10 +1,73 @@
+import json
+import os
 import secrets
+import zlib
+from datetime import UTC, datetime
 
-from sqlalchemy import JSON, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import (
+    JSON,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    TypeDecorator,
+)
 from sqlalchemy.orm import relationship
 
 from database import Base
 
+# Leading byte that marks a zlib-compressed payload. JSON documents can never
+# start with it, so plain (legacy or uncompressed) rows stay readable.
+ZLIB_TAG = b"z"
+
+
+def utcnow() -> datetime:
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def get_messages_codec() -> str:
+    return os.getenv("CHAT_MESSAGES_CODEC", "zlib")
+
+
+def encode_json(value, codec: str | None = None) -> bytes:
+    raw = json.dumps(value, separators=(",", ":")).encode()
+    if (codec or get_messages_codec()) == "zlib":
+        return ZLIB_TAG + zlib.compress(raw)
+    return raw
+
+
+def decode_json_bytes(value: bytes | str) -> bytes:
+    """Return the stored value as plain JSON bytes, decompressing if needed."""
+    if isinstance(value, str):
+        return value.encode()
+    if value[:1] == ZLIB_TAG:
+        return zlib.decompress(value[1:])
+    return bytes(value)
+
+
+class CompressedJSON(TypeDecorator):
+    """
+    JSON stored as bytes, zlib-compressed unless CHAT_MESSAGES_CODEC=none.
+
+    Reads accept compressed bytes, plain JSON bytes and legacy JSON text.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return encode_json(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return json.loads(decode_json_bytes(value))
+
 
 class Chat(Base):
     __tablename__ = "chat"
@@ -13,7 +76,12 @@ class Chat(Base):
         String(length=32), primary_key=True, index=True, default=secrets.token_urlsafe
     )
     created_at = Column(DateTime, index=True)
-    messages = Column(JSON)
+    updated_at = Column(DateTime, index=True, onupdate=utcnow)
+    # A fork stores only the messages after the first `fork_at` of its parent's
+    # history, which it shares (see `forks`).
+    parent_id = Column(String(length=32), index=True, nullable=True)
+    fork_at = Column(Integer, nullable=True)
+    messages = Column(CompressedJSON)
     form_submissions = relationship(
         "FormSubmission", cascade="all, delete", back_populates="chat"
     )
@@ -54,10 +122,27 @@ class AuditRevision(Base):
     reason = Column(String, nullable=True)
     request_id = Column(String, nullable=True)
 
+    # Per-entity sequence number; every AUDIT_SNAPSHOT_EVERY-th revision (and every
+    # create) also stores the full field state so point-in-time reads stay bounded.
+    version = Column(Integer, index=True, nullable=True)
+    snapshot = Column(JSON(none_as_null=True), nullable=True)
+    parent_id = Column(String, index=True, nullable=True)  # owning chat id
+
     changes = relationship(
         "AuditChange", cascade="all, delete-orphan", back_populates="revision"
     )
 
+    # Concurrent writers that picked the same version collide here and retry.
+    __table_args__ = (
+        Index(
+            "ix_audit_revision_entity_version",
+            "entity_type",
+            "entity_id",
+            "version",
+            unique=True,
+        ),
+    )
+
 
 class AuditChange(Base):
     __tablename__ = "audit_change"
@@ -75,3 +160,130 @@ class AuditChange(Base):
     field = Column(String, index=True, nullable=False)
     old_value = Column(JSON, nullable=True)
     new_value = Column(JSON, nullable=True)
+
+
+class ArchiveEntry(Base):
+    """Locates one archived record inside a gzip'd JSONL segment file."""
+
+    __tablename__ = "archive_entry"
+
+    id = Column(
+        String(length=32), primary_key=True, index=True, default=secrets.token_urlsafe
+    )
+    created_at = Column(DateTime, index=True)
+
+    kind = Column(String, index=True, nullable=False)  # chat|audit_revision
+    key = Column(String, index=True, nullable=False)  # chat id or audited entity id
+    record_id = Column(String, index=True, nullable=False)
+    segment = Column(String, nullable=False)
+    byte_offset = Column(Integer, nullable=False)
+    byte_length = Column(Integer, nullable=False)
+
+
+class OutboxEvent(Base):
+    """Downstream notification written in the same transaction as the change."""
+
+    __tablename__ = "outbox_event"
+
+    id = Column(
+        String(length=32), primary_key=True, index=True, default=secrets.token_urlsafe
+    )
+    created_at = Column(DateTime, index=True)
+
+    aggregate_type = Column(String, nullable=False)
+    aggregate_id = Column(String, index=True, nullable=False)
+    version = Column(Integer, nullable=True)  # audit revision version
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+
+    status = Column(String, index=True, nullable=False)  # pending|delivered|dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, index=True)
+    last_error = Column(String, nullable=True)
+    delivered_at = Column(DateTime, nullable=True)
+    lease_owner = Column(String, nullable=True)  # relay batch delivering it
+    lease_expires_at = Column(DateTime, index=True, nullable=True)
+
+
+class Job(Base):
+    """Chat turn queued for the worker pool (``python worker.py``)."""
+
+    __tablename__ = "job"
+
+    id = Column(
+        String(length=32), primary_key=True, index=True, default=secrets.token_urlsafe
+    )
+    created_at = Column(DateTime, index=True)
+
+    kind = Column(String, nullable=False)  # chat_turn
+    chat_id = Column(String, index=True, nullable=False)
+    payload = Column(CompressedJSON, nullable=False)
+
+    status = Column(String, index=True, nullable=False)  # queued|running|done|failed
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, index=True, nullable=True)
+
+    result = Column(CompressedJSON, nullable=True)
+    error = Column(String, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class IdempotencyKey(Base):
+    """Stored response of a request sent with an ``Idempotency-Key`` header."""
+
+    __tablename__ = "idempotency_key"
+
+    id = Column(String(length=255), primary_key=True)  # the client's key
+    created_at = Column(DateTime, index=True)
+    expires_at = Column(DateTime, index=True, nullable=False)
+
+    fingerprint = Column(String(length=64), nullable=False)  # method, path, body
+    status = Column(String, nullable=False)  # in_flight|done
+    locked_until = Column(DateTime, nullable=True)  # in_flight lease
+
+    response_status = Column(Integer, nullable=True)
+    response_headers = Column(JSON, nullable=True)
+    response_body = Column(LargeBinary, nullable=True)
+
+
+class UsageTurn(Base):
+    """LLM usage and latency of one chat turn (written in batches by `usage`)."""
+
+    __tablename__ = "usage_turn"
+
+    id = Column(
+        String(length=32), primary_key=True, index=True, default=secrets.token_urlsafe
+    )
+    created_at = Column(DateTime, index=True)
+    chat_id = Column(String, index=True, nullable=False)
+
+    # [{role, model, prompt_tokens, completion_tokens, cached_tokens, ms}]
+    calls = Column(JSON, nullable=False)
+    tools = Column(JSON, nullable=False)  # names of the tool calls executed
+    reply = Column(String, nullable=True)  # template|llm, for tool turns
+    prompt_tokens = Column(Integer, nullable=False)
+    completion_tokens = Column(Integer, nullable=False)
+    cached_tokens = Column(Integer, nullable=False)
+    llm_ms = Column(Integer, nullable=False)  # summed LLM call latency
+    total_ms = Column(Integer, nullable=False)
+
+
+class UsageRollup(Base):
+    """Per-day usage counters by total, model or chat, summed from `UsageTurn`s."""
+
+    __tablename__ = "usage_rollup"
+
+    day = Column(String(length=10), primary_key=True)  # YYYY-MM-DD, UTC
+    dimension = Column(String(length=16), primary_key=True)  # total|model|chat
+    key = Column(String(length=255), primary_key=True)  # model or chat id
+
+    turns = Column(Integer, nullable=False, default=0)
+    calls = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    llm_ms = Column(Integer, nullable=False, default=0)
+    tool_calls = Column(Integer, nullable=False, default=0)
+    template_replies = Column(Integer, nullable=False, default=0)
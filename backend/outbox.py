@@ -0,0 +1,260 @@
+"""
+Transactional outbox for pushing form changes to a downstream system (our CRM).
+
+`enqueue` is called by the audit capture (see `audit.track`), so every event is
+committed together with the form mutation and its audit revision. A separate worker
+(``python outbox.py``) delivers pending events to OUTBOX_URL:
+
+- each batch leases the pending events of up to BATCH_SIZE forms that have
+  nothing waiting for a retry, for OUTBOX_LEASE_SECONDS, so several relays can
+  run side by side without sending the same form's events twice at once;
+- events are POSTed as ``{"events": [...]}``, with up to OUTBOX_CONCURRENCY
+  requests in flight;
+- all pending events of one form travel in the same request, in version order,
+  and nothing newer for that form is sent while an older one waits for a retry;
+- failed requests are retried with exponential backoff, and events that fail
+  OUTBOX_MAX_ATTEMPTS times are marked ``dead`` for manual inspection.
+
+Delivery is at-least-once; receivers should dedupe on the event ``id``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import secrets
+from datetime import datetime, timedelta
+from typing import Any
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import database
+from models import OutboxEvent, utcnow
+
+BATCH_SIZE = 500
+REQUEST_SIZE = 50
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 300.0
+
+
+def get_url() -> str | None:
+    return os.getenv("OUTBOX_URL") or None
+
+
+def get_concurrency() -> int:
+    return int(os.getenv("OUTBOX_CONCURRENCY", "4"))
+
+
+def get_max_attempts() -> int:
+    return int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+
+
+def get_lease_seconds() -> float:
+    return float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+
+
+def enqueue(
+    db: AsyncSession,
+    *,
+    aggregate_type: str,
+    aggregate_id: str,
+    event_type: str,
+    payload: dict[str, Any],
+    version: int | None = None,
+    now: datetime | None = None,
+) -> OutboxEvent:
+    """Add an event to the caller's transaction; it is sent once committed."""
+    now = now or utcnow()
+    event = OutboxEvent(
+        created_at=now,
+        aggregate_type=aggregate_type,
+        aggregate_id=aggregate_id,
+        version=version,
+        event_type=event_type,
+        payload=jsonable_encoder(payload),
+        status="pending",
+        attempts=0,
+        next_attempt_at=now,
+    )
+    db.add(event)
+    return event
+
+
+def _body(event: OutboxEvent) -> dict[str, Any]:
+    return {
+        "id": event.id,
+        "type": f"{event.aggregate_type}.{event.event_type}",
+        "aggregate_id": event.aggregate_id,
+        "version": event.version,
+        "occurred_at": event.created_at.isoformat(),
+        "data": event.payload,
+    }
+
+
+def _blocked(now: datetime):
+    """Aggregates with a pending event that is backing off or leased."""
+    waiting = select(OutboxEvent.aggregate_id).where(
+        OutboxEvent.status == "pending",
+        (OutboxEvent.next_attempt_at > now) | (OutboxEvent.lease_expires_at > now),
+    )
+    return OutboxEvent.aggregate_id.in_(waiting)
+
+
+async def _claim(db: AsyncSession, owner: str, now: datetime, limit: int) -> list:
+    """
+    Lease all pending events of the `limit` aggregates with the oldest due
+    events to `owner`; returns the leased events in delivery order.
+    """
+    # Fans out across shards: merge and cut the per-shard answers here.
+    oldest = func.min(OutboxEvent.created_at).label("oldest")
+    candidates = (
+        await db.execute(
+            select(OutboxEvent.aggregate_id, oldest)
+            .where(
+                OutboxEvent.status == "pending",
+                OutboxEvent.next_attempt_at <= now,
+                ~_blocked(now),
+            )
+            .group_by(OutboxEvent.aggregate_id)
+            .order_by(oldest)
+            .limit(limit)
+        )
+    ).all()
+    candidates = sorted(candidates, key=lambda row: row.oldest)[:limit]
+    if not candidates:
+        return []
+
+    # Conditional, like `jobs.claim`: a group another relay leased in the
+    # meantime is left alone.
+    await db.execute(
+        update(OutboxEvent)
+        .where(
+            OutboxEvent.aggregate_id.in_([row.aggregate_id for row in candidates]),
+            OutboxEvent.status == "pending",
+            ~_blocked(now),
+        )
+        .values(
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=get_lease_seconds()),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    events = (
+        await db.scalars(
+            select(OutboxEvent).where(
+                OutboxEvent.lease_owner == owner, OutboxEvent.status == "pending"
+            )
+        )
+    ).all()
+    return sorted(events, key=lambda e: (e.created_at, e.version or 0, e.id))
+
+
+def _plan(events: list[OutboxEvent]) -> list[list[OutboxEvent]]:
+    """
+    Group events per aggregate and pack whole groups into requests of about
+    REQUEST_SIZE events.
+    """
+    groups: dict[str, list[OutboxEvent]] = {}
+    for event in events:
+        groups.setdefault(event.aggregate_id, []).append(event)
+
+    requests: list[list[OutboxEvent]] = []
+    current: list[OutboxEvent] = []
+    for group in groups.values():
+        if current and len(current) + len(group) > REQUEST_SIZE:
+            requests.append(current)
+            current = []
+        current.extend(group)
+    if current:
+        requests.append(current)
+    return requests
+
+
+async def deliver_batch(
+    client: httpx.AsyncClient,
+    url: str,
+    *,
+    session_factory: async_sessionmaker | None = None,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    Deliver the due events of up to `batch_size` aggregates. Returns how many
+    were attempted.
+    """
+    session_factory = session_factory or database.SessionLocal
+    now = utcnow()
+    async with session_factory() as db:
+        requests = _plan(await _claim(db, secrets.token_hex(8), now, batch_size))
+        if not requests:
+            return 0
+
+        semaphore = asyncio.Semaphore(get_concurrency())
+
+        async def send(events: list[OutboxEvent]) -> str | None:
+            async with semaphore:
+                try:
+                    resp = await client.post(
+                        url, json={"events": [_body(e) for e in events]}
+                    )
+                    resp.raise_for_status()
+                except httpx.HTTPError as exc:
+                    return f"{type(exc).__name__}: {exc}"
+            return None
+
+        errors = await asyncio.gather(*(send(events) for events in requests))
+
+        delivered = [
+            event.id
+            for events, error in zip(requests, errors, strict=True)
+            if error is None
+            for event in events
+        ]
+        if delivered:
+            await db.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(delivered))
+                .values(
+                    status="delivered",
+                    delivered_at=utcnow(),
+                    lease_owner=None,
+                    lease_expires_at=None,
+                )
+            )
+        for events, error in zip(requests, errors, strict=True):
+            if error is None:
+                continue
+            for event in events:
+                event.lease_owner = event.lease_expires_at = None
+                event.attempts += 1
+                event.last_error = error[:500]
+                if event.attempts >= get_max_attempts():
+                    event.status = "dead"
+                else:
+                    delay = min(
+                        BACKOFF_SECONDS * 2 ** (event.attempts - 1), MAX_BACKOFF_SECONDS
+                    )
+                    event.next_attempt_at = now + timedelta(seconds=delay)
+        await db.commit()
+        return sum(len(events) for events in requests)
+
+
+async def run_worker(url: str, poll_seconds: float = 1.0) -> None:
+    database.init_engine()
+    try:
+        async with httpx.AsyncClient(timeout=10) as client:
+            while True:
+                if not await deliver_batch(client, url):
+                    await asyncio.sleep(poll_seconds)
+    finally:
+        await database.dispose()
+
+
+if __name__ == "__main__":
+    url = get_url()
+    if url is None:
+        raise SystemExit("OUTBOX_URL is not set")
+    asyncio.run(run_worker(url))
@@ -0,0 +1,159 @@
+"""
+On-demand sampling profiler for individual requests.
+
+A request is profiled when it carries ``X-Profile-Token: $PROFILE_TOKEN`` or is
+picked by ``PROFILE_SAMPLE_RATE``. While it runs, a background thread samples the
+event-loop thread's stack every ``PROFILE_INTERVAL_MS`` and the folded stacks are
+written to ``PROFILE_DIR`` (flamegraph.pl / speedscope "collapsed" format), which
+keeps only the newest ``PROFILE_KEEP`` files.
+
+The sampler sees the whole loop thread, so concurrent requests show up in each
+other's profiles; time spent waiting on I/O appears under the selector frames.
+
+When neither setting is configured `install` adds nothing to the app.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from time import perf_counter
+
+from fastapi import FastAPI, Request
+
+from models import utcnow
+
+TOKEN_HEADER = "X-Profile-Token"
+# Profile downloads are never profiled themselves, so they cannot evict the file
+# being downloaded.
+ADMIN_PREFIX = "/admin/profiles"
+
+
+def get_token() -> str | None:
+    return os.getenv("PROFILE_TOKEN") or None
+
+
+def get_sample_rate() -> float:
+    return float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+
+def get_profile_dir() -> Path:
+    return Path(os.getenv("PROFILE_DIR", "./profiles"))
+
+
+def get_keep() -> int:
+    return int(os.getenv("PROFILE_KEEP", "50"))
+
+
+def enabled() -> bool:
+    return get_token() is not None or get_sample_rate() > 0
+
+
+def authorized(token: str | None) -> bool:
+    expected = get_token()
+    if expected is None or token is None:
+        return False
+    return secrets.compare_digest(token.encode(), expected.encode())
+
+
+class Sampler(threading.Thread):
+    """Samples one thread's stack at a fixed interval until stopped."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_fold(frame)] += 1
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> Counter[str]:
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def save(stacks: Counter[str], route: str, seconds: float) -> Path:
+    """Write a profile into the ring buffer directory and evict the oldest."""
+    directory = get_profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r"[^\w]+", "_", route).strip("_") or "root"
+    stamp = utcnow().strftime("%Y%m%dT%H%M%S%f")
+    path = directory / f"{stamp}-{slug}-{int(seconds * 1000)}ms-{secrets.token_hex(3)}"
+    path = path.with_suffix(".folded")
+    path.write_text("".join(f"{stack} {n}\n" for stack, n in stacks.items()))
+
+    profiles = list_profiles()
+    for old in profiles[get_keep() :]:
+        (directory / old["name"]).unlink(missing_ok=True)
+    return path
+
+
+def list_profiles() -> list[dict]:
+    """Captured profiles, newest first."""
+    directory = get_profile_dir()
+    if not directory.exists():
+        return []
+    files = sorted(directory.glob("*.folded"), reverse=True)
+    return [{"name": f.name, "size": f.stat().st_size} for f in files]
+
+
+def get_profile_path(name: str) -> Path | None:
+    path = get_profile_dir() / name
+    if "/" in name or not name.endswith(".folded") or not path.is_file():
+        return None
+    return path
+
+
+def install(app: FastAPI) -> None:
+    """Register the profiling middleware, only if profiling is configured."""
+    if not enabled():
+        return
+    interval = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        if request.url.path.startswith(ADMIN_PREFIX) or not (
+            authorized(request.headers.get(TOKEN_HEADER))
+            or random.random() < get_sample_rate()
+        ):
+            return await call_next(request)
+
+        sampler = Sampler(threading.get_ident(), interval)
+        sampler.start()
+        start = perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            stacks = sampler.stop()
+            route = request.scope.get("route")
+            path = save(
+                stacks,
+                route.path if route is not None else request.url.path,
+                perf_counter() - start,
+            )
+        response.headers["X-Profile"] = path.name
+        return response
@@ -0,0 +1,154 @@
+"""
+Move chats to the shard `database.shard_for` picks for them, after shards were
+added to or removed from DATABASE_SHARD_URLS.
+
+Usage: python rebalance.py [--dry-run] [--batch 200]
+
+Each misplaced chat is copied with its forms, audit revisions and changes,
+outbox events, jobs and usage records to its new shard in one transaction, then
+deleted from the old one in a second. A copy left by an interrupted run is
+replaced on the next run, so the tool can simply be re-run. Stop the API and the
+workers first: until a chat has moved, reads routed by its id only look on the
+new shard.
+Archive entries and usage rollups stay where they are; both are read from every
+shard.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from typing import Any
+
+from dotenv import load_dotenv
+from sqlalchemy import Table, delete, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+import database
+from models import (
+    AuditChange,
+    AuditRevision,
+    Chat,
+    FormSubmission,
+    Job,
+    OutboxEvent,
+    UsageTurn,
+)
+
+# Insert order; rows are deleted in reverse.
+TABLES: tuple[Table, ...] = (
+    Chat.__table__,
+    FormSubmission.__table__,
+    AuditRevision.__table__,
+    AuditChange.__table__,
+    OutboxEvent.__table__,
+    Job.__table__,
+    UsageTurn.__table__,
+)
+
+
+async def _fetch(conn: AsyncConnection, statement) -> list[dict[str, Any]]:
+    return [dict(row) for row in (await conn.execute(statement)).mappings()]
+
+
+async def chat_rows(conn: AsyncConnection, chat_id: str) -> dict[Table, list[dict]]:
+    """Every row on this shard that belongs to `chat_id`, by table."""
+    forms = await _fetch(
+        conn, select(FormSubmission).where(FormSubmission.chat_id == chat_id)
+    )
+    revisions = await _fetch(
+        conn, select(AuditRevision).where(AuditRevision.parent_id == chat_id)
+    )
+    revision_ids = [rev["id"] for rev in revisions]
+    aggregates = {chat_id, *(f["id"] for f in forms)}
+    aggregates |= {rev["entity_id"] for rev in revisions}
+    return {
+        Chat.__table__: await _fetch(conn, select(Chat).where(Chat.id == chat_id)),
+        FormSubmission.__table__: forms,
+        AuditRevision.__table__: revisions,
+        AuditChange.__table__: await _fetch(
+            conn, select(AuditChange).where(AuditChange.revision_id.in_(revision_ids))
+        ),
+        OutboxEvent.__table__: await _fetch(
+            conn,
+            select(OutboxEvent).where(
+                or_(
+                    OutboxEvent.aggregate_id.in_(aggregates),
+                    OutboxEvent.payload["parent_id"].as_string() == chat_id,
+                )
+            ),
+        ),
+        Job.__table__: await _fetch(conn, select(Job).where(Job.chat_id == chat_id)),
+        UsageTurn.__table__: await _fetch(
+            conn, select(UsageTurn).where(UsageTurn.chat_id == chat_id)
+        ),
+    }
+
+
+async def _delete(conn: AsyncConnection, rows: dict[Table, list[dict]]) -> None:
+    for table in reversed(TABLES):
+        ids = [row["id"] for row in rows[table]]
+        if ids:
+            await conn.execute(delete(table).where(table.c.id.in_(ids)))
+
+
+async def move_chat(chat_id: str, source: str, target: str) -> int:
+    """Move one chat between shards; returns the number of rows moved."""
+    async with database.engines[source].connect() as conn:
+        rows = await chat_rows(conn, chat_id)
+    async with database.engines[target].begin() as conn:
+        await _delete(conn, rows)  # leftovers of an interrupted earlier move
+        for table in TABLES:
+            if rows[table]:
+                await conn.execute(insert(table), rows[table])
+    async with database.engines[source].begin() as conn:
+        await _delete(conn, rows)
+    return sum(len(table_rows) for table_rows in rows.values())
+
+
+async def misplaced_chats(shard_id: str, batch: int) -> list[str]:
+    """Ids of the chats on `shard_id` that belong on another shard."""
+    misplaced, last = [], ""
+    async with database.engines[shard_id].connect() as conn:
+        while True:
+            ids = (
+                await conn.scalars(
+                    select(Chat.id).where(Chat.id > last).order_by(Chat.id).limit(batch)
+                )
+            ).all()
+            if not ids:
+                return misplaced
+            misplaced += [i for i in ids if database.shard_for(i) != shard_id]
+            last = ids[-1]
+
+
+async def rebalance(*, dry_run: bool = False, batch: int = 200) -> dict[str, Any]:
+    moves: dict[str, int] = {}
+    rows = 0
+    for source in database.engines:
+        for chat_id in await misplaced_chats(source, batch):
+            target = database.shard_for(chat_id)
+            key = f"{source}->{target}"
+            moves[key] = moves.get(key, 0) + 1
+            if not dry_run:
+                rows += await move_chat(chat_id, source, target)
+    return {"chats": sum(moves.values()), "rows": rows, "moves": moves}
+
+
+async def run(dry_run: bool, batch: int) -> None:
+    database.init_engine()
+    try:
+        report = await rebalance(dry_run=dry_run, batch=batch)
+    finally:
+        await database.dispose()
+    print(json.dumps({"dry_run": dry_run, **report}))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Move chats to their hashed shard")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.dry_run, args.batch))
@@ -0,0 +1,367 @@
+"""
+Hot/cold tiering for chats and audit history.
+
+Inactive chats (with their form submissions) and audit revisions older than the
+audit horizon are moved out of the hot tables into append-only segment files.
+Each record is written as its own gzip member, so a segment is a valid
+``.jsonl.gz`` file while single records can still be read back by seeking to the
+offset stored in ``archive_entry``.
+
+Run periodically, e.g. ``python retention.py --chat-days 180 --audit-days 365``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import secrets
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, exists, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, selectinload
+
+import database
+import forks
+from models import (
+    ArchiveEntry,
+    AuditChange,
+    AuditRevision,
+    Chat,
+    FormSubmission,
+    utcnow,
+)
+
+CHUNK_SIZE = 200
+
+
+def get_archive_dir() -> Path:
+    return Path(os.getenv("ARCHIVE_DIR", "./archive"))
+
+
+class SegmentWriter:
+    """Appends gzip members to one segment file and reports their offsets."""
+
+    def __init__(self, kind: str, archive_dir: Path | None = None):
+        archive_dir = archive_dir or get_archive_dir()
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        stamp = utcnow().strftime("%Y%m%dT%H%M%S")
+        self.name = f"{kind}-{stamp}-{secrets.token_hex(4)}.jsonl.gz"
+        self.path = archive_dir / self.name
+
+    def write(self, records: list[dict[str, Any]]) -> list[tuple[int, int]]:
+        """Append records durably and return their (offset, length) pairs."""
+        spans = []
+        with open(self.path, "ab") as fh:
+            offset = fh.tell()
+            for record in records:
+                member = gzip.compress(
+                    (json.dumps(jsonable_encoder(record)) + "\n").encode()
+                )
+                fh.write(member)
+                spans.append((offset, len(member)))
+                offset += len(member)
+            fh.flush()
+            os.fsync(fh.fileno())
+        return spans
+
+
+def read_record(entry: ArchiveEntry, archive_dir: Path | None = None) -> dict:
+    path = (archive_dir or get_archive_dir()) / entry.segment
+    with open(path, "rb") as fh:
+        fh.seek(entry.byte_offset)
+        member = fh.read(entry.byte_length)
+    return json.loads(gzip.decompress(member))
+
+
+def _chat_record(chat: Chat, messages: list) -> dict[str, Any]:
+    return {
+        "id": chat.id,
+        "created_at": chat.created_at,
+        "updated_at": chat.updated_at,
+        "messages": messages,
+        "form_submissions": [
+            {
+                "id": form.id,
+                "created_at": form.created_at,
+                "chat_id": form.chat_id,
+                "name": form.name,
+                "phone_number": form.phone_number,
+                "email": form.email,
+                "status": form.status,
+            }
+            for form in chat.form_submissions
+        ],
+    }
+
+
+def _revision_record(revision: AuditRevision) -> dict[str, Any]:
+    return {
+        "id": revision.id,
+        "created_at": revision.created_at,
+        "entity_type": revision.entity_type,
+        "entity_id": revision.entity_id,
+        "event_type": revision.event_type,
+        "actor_type": revision.actor_type,
+        "actor_id": revision.actor_id,
+        "source": revision.source,
+        "reason": revision.reason,
+        "request_id": revision.request_id,
+        "version": revision.version,
+        "snapshot": revision.snapshot,
+        "parent_id": revision.parent_id,
+        "changes": [
+            {
+                "id": change.id,
+                "created_at": change.created_at,
+                "field": change.field,
+                "old_value": change.old_value,
+                "new_value": change.new_value,
+            }
+            for change in revision.changes
+        ],
+    }
+
+
+async def _add_entries(
+    db: AsyncSession,
+    kind: str,
+    writer: SegmentWriter,
+    records: list[tuple[str, dict[str, Any]]],
+) -> None:
+    spans = writer.write([record for _, record in records])
+    now = utcnow()
+    db.add_all(
+        ArchiveEntry(
+            created_at=now,
+            kind=kind,
+            key=key,
+            record_id=record["id"],
+            segment=writer.name,
+            byte_offset=offset,
+            byte_length=length,
+        )
+        for (key, record), (offset, length) in zip(records, spans, strict=True)
+    )
+
+
+async def archive_chats(
+    db: AsyncSession,
+    *,
+    inactive_before: datetime,
+    chunk_size: int = CHUNK_SIZE,
+    archive_dir: Path | None = None,
+) -> int:
+    """
+    Archive chats not updated since `inactive_before`, one chunk per commit.
+    Chats that have forks stay, since the forks share their messages; archived
+    forks take a copy of the messages they shared and are restored standalone.
+    """
+    writer = SegmentWriter("chat", archive_dir)
+    last_active = func.coalesce(Chat.updated_at, Chat.created_at)
+    archived = 0
+    last = ""
+    while True:
+        statement = (
+            select(Chat)
+            .options(selectinload(Chat.form_submissions))
+            .where(last_active < inactive_before, Chat.id > last)
+            .order_by(Chat.id)
+            .limit(chunk_size)
+        )
+        # Each shard returns its first chunk; the merge keeps the first overall
+        # so the cursor never skips a shard's rows.
+        chats = sorted((await db.scalars(statement)).all(), key=lambda c: c.id)
+        chats = chats[:chunk_size]
+        if not chats:
+            return archived
+        last = chats[-1].id
+        parents = await forks.forked(db, [chat.id for chat in chats])
+        chats = [chat for chat in chats if chat.id not in parents]
+        if not chats:
+            continue
+
+        records = [
+            (chat.id, _chat_record(chat, await forks.history(db, chat)))
+            for chat in chats
+        ]
+        await _add_entries(db, "chat", writer, records)
+        ids = [chat.id for chat in chats]
+        await db.execute(delete(FormSubmission).where(FormSubmission.chat_id.in_(ids)))
+        await db.execute(delete(Chat).where(Chat.id.in_(ids)))
+        await db.commit()
+        db.expunge_all()
+        archived += len(chats)
+
+
+async def archive_audit(
+    db: AsyncSession,
+    *,
+    older_than: datetime,
+    chunk_size: int = CHUNK_SIZE,
+    archive_dir: Path | None = None,
+) -> int:
+    """
+    Archive audit revisions (and their changes) created before `older_than`.
+
+    An entity's latest revision stays hot unless it is a delete, so per-entity
+    version numbers keep counting up from the hot table.
+    """
+    writer = SegmentWriter("audit_revision", archive_dir)
+    newer = aliased(AuditRevision)
+    has_newer = exists().where(
+        newer.entity_type == AuditRevision.entity_type,
+        newer.entity_id == AuditRevision.entity_id,
+        newer.version > AuditRevision.version,
+    )
+    archived = 0
+    while True:
+        statement = (
+            select(AuditRevision)
+            .options(selectinload(AuditRevision.changes))
+            .where(
+                AuditRevision.created_at < older_than,
+                or_(AuditRevision.event_type == "delete", has_newer),
+            )
+            .order_by(AuditRevision.created_at, AuditRevision.id)
+            .limit(chunk_size)
+        )
+        revisions = (await db.scalars(statement)).all()
+        if not revisions:
+            return archived
+
+        await _add_entries(
+            db,
+            "audit_revision",
+            writer,
+            [(rev.entity_id, _revision_record(rev)) for rev in revisions],
+        )
+        ids = [rev.id for rev in revisions]
+        await db.execute(delete(AuditChange).where(AuditChange.revision_id.in_(ids)))
+        await db.execute(delete(AuditRevision).where(AuditRevision.id.in_(ids)))
+        await db.commit()
+        db.expunge_all()
+        archived += len(revisions)
+
+
+async def load_archived_chat(
+    db: AsyncSession, chat_id: str, archive_dir: Path | None = None
+) -> dict[str, Any] | None:
+    statement = (
+        select(ArchiveEntry)
+        .where(ArchiveEntry.kind == "chat", ArchiveEntry.key == chat_id)
+        .order_by(ArchiveEntry.created_at.desc())
+        .limit(1)
+    )
+    entry = (await db.scalars(statement)).first()
+    if entry is None:
+        return None
+    return await asyncio.to_thread(read_record, entry, archive_dir)
+
+
+async def load_archived_revisions(
+    db: AsyncSession, entity_id: str, archive_dir: Path | None = None
+) -> list[dict[str, Any]]:
+    statement = select(ArchiveEntry).where(
+        ArchiveEntry.kind == "audit_revision", ArchiveEntry.key == entity_id
+    )
+    entries = (await db.scalars(statement)).all()
+    if not entries:
+        return []
+    return await asyncio.to_thread(
+        lambda: [read_record(entry, archive_dir) for entry in entries]
+    )
+
+
+async def _form_chat_id(db: AsyncSession, form_id: str) -> str | None:
+    """The chat of a form, from its latest audit revision (kept hot)."""
+    statement = (
+        select(AuditRevision.parent_id)
+        .where(
+            AuditRevision.entity_type == "form_submission",
+            AuditRevision.entity_id == form_id,
+            AuditRevision.parent_id.is_not(None),
+        )
+        .order_by(AuditRevision.created_at.desc())
+        .limit(1)
+    )
+    return next(iter((await db.scalars(statement)).all()), None)
+
+
+async def load_archived_form(db: AsyncSession, form_id: str) -> dict[str, Any] | None:
+    """A form submission of an archived chat, found through its audit history."""
+    chat_id = await _form_chat_id(db, form_id)
+    record = await load_archived_chat(db, chat_id) if chat_id else None
+    forms = record["form_submissions"] if record else []
+    return next((form for form in forms if form["id"] == form_id), None)
+
+
+async def restore_form(db: AsyncSession, form_id: str) -> FormSubmission | None:
+    """Restore the archived chat of a form, e.g. before the form is changed."""
+    chat_id = await _form_chat_id(db, form_id)
+    if chat_id is None or await restore_chat(db, chat_id) is None:
+        return None
+    return await db.get(FormSubmission, form_id)
+
+
+async def restore_chat(db: AsyncSession, chat_id: str) -> Chat | None:
+    """Move an archived chat back into the hot tables, e.g. before a new turn."""
+    record = await load_archived_chat(db, chat_id)
+    if record is None:
+        return None
+
+    chat = Chat(
+        id=record["id"],
+        created_at=datetime.fromisoformat(record["created_at"]),
+        updated_at=utcnow(),
+        messages=record["messages"],
+    )
+    db.add(chat)
+    db.add_all(
+        FormSubmission(
+            **{**form, "created_at": datetime.fromisoformat(form["created_at"])}
+        )
+        for form in record["form_submissions"]
+    )
+    await db.execute(
+        delete(ArchiveEntry).where(
+            ArchiveEntry.kind == "chat", ArchiveEntry.key == chat_id
+        )
+    )
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent restore (say a PUT and a fork of the same chat) won.
+        await db.rollback()
+        return await db.get(Chat, chat_id)
+    return chat
+
+
+async def run(chat_days: int, audit_days: int, chunk_size: int) -> None:
+    database.init_engine()
+    now = utcnow()
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        chats = await archive_chats(
+            db, inactive_before=now - timedelta(days=chat_days), chunk_size=chunk_size
+        )
+        revisions = await archive_audit(
+            db, older_than=now - timedelta(days=audit_days), chunk_size=chunk_size
+        )
+    await database.dispose()
+    print(f"archived {chats} chats and {revisions} audit revisions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive cold chats and audit rows")
+    parser.add_argument("--chat-days", type=int, default=180)
+    parser.add_argument("--audit-days", type=int, default=365)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+    asyncio.run(run(args.chat_days, args.audit_days, args.chunk_size))
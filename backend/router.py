@@ -0,0 +1,268 @@
+"""
+Latency-aware routing of LLM calls across models and endpoints.
+
+Each call has a role: ``tools`` (the first completion, which picks tool calls)
+or ``reply`` (the follow-up that phrases the answer). LLM_ROUTER_CONFIG points at
+a JSON file such as::
+
+    {
+      "endpoints": {
+        "mini": {"model": "gpt-4o-mini"},
+        "backup": {"model": "gpt-4o-mini", "base_url": "https://...",
+                   "api_key_env": "BACKUP_API_KEY", "max_retries": 0}
+      },
+      "roles": {
+        "tools": {"endpoints": ["mini", "backup"], "policy": "priority"},
+        "reply": {"endpoints": ["mini", "backup"], "policy": "fastest"}
+      },
+      "hedge": {"enabled": true, "after_ms": 3000, "min_samples": 20}
+    }
+
+``priority`` keeps the configured order and ``fastest`` orders by the live
+median latency. Endpoints that failed repeatedly sit at the back for a cooldown.
+When the first choice runs past its own p95 (or ``after_ms`` until enough
+samples exist), one hedged duplicate goes to the next candidate and the first
+answer wins. Errors fail over to the next candidate right away.
+
+Without a config file every role uses one endpoint (OPENAI_API_KEY, LLM_MODEL)
+and nothing is hedged.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, Any
+
+import capture
+import metrics
+import usage
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("tools", "reply")
+WINDOW = 200
+FAILURES_BEFORE_COOLDOWN = 3
+COOLDOWN_SECONDS = 30.0
+
+calls = metrics.REGISTRY.counter(
+    "llm_router_calls_total", "Routed LLM calls by role, endpoint and outcome"
+)
+hedges = metrics.REGISTRY.counter("llm_router_hedges_total", "Hedged duplicate calls")
+failovers = metrics.REGISTRY.counter(
+    "llm_router_failovers_total", "Calls retried on another endpoint after an error"
+)
+
+
+@dataclass(eq=False)
+class Endpoint:
+    name: str
+    client: AsyncOpenAI
+    model: str
+    latencies: deque = field(default_factory=lambda: deque(maxlen=WINDOW))
+    failures: int = 0
+    down_until: float = 0.0
+
+    def quantile(self, q: float, min_samples: int = 1) -> float | None:
+        if len(self.latencies) < max(min_samples, 1):
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def healthy(self) -> bool:
+        return monotonic() >= self.down_until
+
+    def succeeded(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+        self.failures = 0
+
+    def failed(self) -> None:
+        self.failures += 1
+        if self.failures >= FAILURES_BEFORE_COOLDOWN:
+            self.down_until = monotonic() + COOLDOWN_SECONDS
+
+
+@dataclass
+class Route:
+    endpoints: list[Endpoint]
+    policy: str = "priority"  # priority|fastest
+
+
+class Router:
+    def __init__(
+        self,
+        routes: dict[str, Route],
+        *,
+        hedge: bool = False,
+        hedge_after: float | None = None,
+        min_samples: int = 20,
+    ):
+        self.routes = routes
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.min_samples = min_samples
+
+    @classmethod
+    def single(cls, client: AsyncOpenAI, model: str) -> Router:
+        endpoint = Endpoint("default", client, model)
+        return cls({role: Route([endpoint]) for role in ROLES})
+
+    @property
+    def endpoints(self) -> list[Endpoint]:
+        unique = {}
+        for route in self.routes.values():
+            for endpoint in route.endpoints:
+                unique[id(endpoint)] = endpoint
+        return list(unique.values())
+
+    def candidates(self, role: str) -> list[Endpoint]:
+        """Endpoints for `role` in the order they should be tried."""
+        route = self.routes[role]
+        ranked = list(route.endpoints)
+        if route.policy == "fastest":
+            # Endpoints without samples go first so they get measured.
+            ranked.sort(key=lambda ep: ep.quantile(0.5) or 0.0)
+        return sorted(ranked, key=lambda ep: not ep.healthy())
+
+    def hedge_delay(self, endpoint: Endpoint) -> float | None:
+        if not self.hedge:
+            return None
+        p95 = endpoint.quantile(0.95, self.min_samples)
+        return p95 if p95 is not None else self.hedge_after
+
+    async def _call(self, role: str, endpoint: Endpoint, kwargs: dict[str, Any]):
+        start = perf_counter()
+        try:
+            resp = await endpoint.client.chat.completions.create(
+                model=endpoint.model, **kwargs
+            )
+        except asyncio.CancelledError:
+            calls.inc(role=role, endpoint=endpoint.name, outcome="cancelled")
+            raise
+        except Exception:
+            endpoint.failed()
+            calls.inc(role=role, endpoint=endpoint.name, outcome="error")
+            raise
+        seconds = perf_counter() - start
+        endpoint.succeeded(seconds)
+        calls.inc(role=role, endpoint=endpoint.name, outcome="ok")
+        metrics.record_llm_call(endpoint.model, seconds, resp.usage)
+        usage.record_call(role, endpoint.model, seconds, resp.usage)
+        return resp
+
+    async def complete(self, role: str, **kwargs: Any):
+        """One chat completion for `role`, hedged and failed over as configured."""
+        candidates = self.candidates(role)
+        primary = candidates[0]
+        backups = iter(candidates[1:])
+        pending: dict[asyncio.Task, Endpoint] = {}
+
+        def launch(endpoint: Endpoint) -> None:
+            task = asyncio.create_task(self._call(role, endpoint, kwargs))
+            pending[task] = endpoint
+
+        started = monotonic()
+        launch(primary)
+        delay = self.hedge_delay(primary)
+        error: BaseException | None = None
+        try:
+            while pending:
+                timeout = None
+                if delay is not None:
+                    timeout = max(0.0, delay - (monotonic() - started))
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Slower than usual: race a duplicate against it.
+                    delay = None
+                    hedges.inc(role=role)
+                    launch(next(backups, primary))
+                    continue
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is None:
+                        capture.record_completion(task.result())
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    backup = next(backups, None)
+                    if backup is None:
+                        break
+                    failovers.inc(role=role)
+                    launch(backup)
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def warm_up(self) -> None:
+        """Open one connection per endpoint so the first turn skips the handshake."""
+        for endpoint in self.endpoints:
+            try:
+                await endpoint.client.models.list()
+            except Exception as exc:
+                logger.warning("LLM pre-warm of %s failed: %s", endpoint.name, exc)
+
+    async def close(self) -> None:
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
+
+
+def get_config_path() -> str | None:
+    return os.getenv("LLM_ROUTER_CONFIG") or None
+
+
+def build(config: dict[str, Any] | None, default_model: str) -> Router | None:
+    """Create the router and its clients; None when no API key is configured."""
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    if config is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            return None
+        client = AsyncOpenAI(api_key=api_key, http_client=DefaultAsyncHttpxClient())
+        return Router.single(client, default_model)
+
+    endpoints = {}
+    for name, spec in config["endpoints"].items():
+        client = AsyncOpenAI(
+            api_key=os.getenv(spec.get("api_key_env", "OPENAI_API_KEY")),
+            base_url=spec.get("base_url"),
+            max_retries=spec.get("max_retries", 2),
+            http_client=DefaultAsyncHttpxClient(),
+        )
+        endpoints[name] = Endpoint(name, client, spec.get("model", default_model))
+    routes = {}
+    for role in ROLES:
+        spec = config["roles"].get(role, {})
+        names = spec.get("endpoints") or list(endpoints)
+        routes[role] = Route(
+            [endpoints[n] for n in names], spec.get("policy", "priority")
+        )
+    hedge = config.get("hedge", {})
+    after_ms = hedge.get("after_ms")
+    return Router(
+        routes,
+        hedge=hedge.get("enabled", False),
+        hedge_after=after_ms / 1000 if after_ms is not None else None,
+        min_samples=hedge.get("min_samples", 20),
+    )
+
+
+def load_config() -> dict[str, Any] | None:
+    path = get_config_path()
+    if path is None:
+        return None
+    with open(path) as f:
+        return json.load(f)
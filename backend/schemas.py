@@ -9,6 +9,8 @@ from pydantic import BaseModel, ConfigDict, Field, field_validator
 class Chat(BaseModel):
     id: str
     created_at: datetime
+    parent_id: str | None = None
+    fork_at: int | None = None
     messages: list
 
     model_config = ConfigDict(from_attributes=True)
@@ -22,6 +24,38 @@ class ChatUpdate(BaseModel):
     messages: list
 
 
+class SimilarChat(BaseModel):
+    chat_id: str
+    score: float
+
+
+class UsageAggregate(BaseModel):
+    day: str | None = None
+    model: str | None = None
+    chat: str | None = None
+    turns: int
+    calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    llm_ms: int
+    tool_calls: int
+    template_replies: int
+
+
+class Job(BaseModel):
+    id: str
+    created_at: datetime
+    chat_id: str
+    status: str
+    attempts: int
+    error: str | None = None
+    result: Chat | None = None
+    finished_at: datetime | None = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class FormSubmission(BaseModel):
     id: str
     created_at: datetime
@@ -59,6 +93,18 @@ class FormSubmissionUpdate(BaseModel):
         return v
 
 
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+
+class ImportReport(BaseModel):
+    imported: int
+    failed: int
+    errors: list[ImportRowError]
+    errors_truncated: bool = False
+
+
 # Task 2
 
 
@@ -0,0 +1,50 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+`Group.do(key, fn)` runs `fn` once for all callers that ask for the same key while
+a call is in flight; everyone gets the same result (or exception). The shared call
+runs in its own task, so a caller that disconnects does not cancel it for the
+others. Results are not cached: a request arriving after the call finished
+starts a new one, so a reader never sees data older than its own arrival minus
+one in-flight query.
+
+``singleflight_requests_total{group, result}`` counts leaders and coalesced
+followers; the coalescing ratio is ``coalesced / (leader + coalesced)``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Generic, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+calls = metrics.REGISTRY.counter(
+    "singleflight_requests_total", "Reads served by a shared single-flight call"
+)
+
+
+class Group(Generic[T]):
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Task[T]] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+            calls.inc(group=self.name, result="leader")
+        else:
+            calls.inc(group=self.name, result="coalesced")
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task[T]) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved even if every caller went away
@@ -5,12 +5,16 @@ from pathlib import Path
 
 import pytest
 from httpx import ASGITransport, AsyncClient
+from openai import AsyncOpenAI
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 import database
 import main
+import turns
+from benchmarks import fake_llm
 from models import Base
+from router import Router
 
 
 @pytest.fixture
@@ -32,3 +36,17 @@ async def client(_test_db: None) -> AsyncClient:
     transport = ASGITransport(app=main.app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         yield ac
+
+
+@pytest.fixture
+def fake_llm_app():
+    return fake_llm.create_app()
+
+
+@pytest.fixture
+def fake_llm_url(fake_llm_app, monkeypatch) -> str:
+    """Point the app's OpenAI client at a local scripted completions server."""
+    with fake_llm.serve(fake_llm_app) as url:
+        client = AsyncOpenAI(base_url=url, api_key="x")
+        monkeypatch.setattr(turns, "llm", Router.single(client, turns.LLM_MODEL))
+        yield url
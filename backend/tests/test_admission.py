@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import admission
+from admission import AdmissionController
+from benchmarks import fake_llm
+
+
+async def _hold(controller: AdmissionController, chat_id: str, release, log: list):
+    async with controller.admit(chat_id):
+        log.append(f"start {chat_id}")
+        await release.wait()
+        log.append(f"end {chat_id}")
+
+
+@pytest.mark.asyncio
+async def test_one_turn_per_chat_and_global_cap():
+    controller = AdmissionController(max_concurrent=2, max_wait=5)
+    release = asyncio.Event()
+    log: list[str] = []
+    tasks = [
+        asyncio.create_task(_hold(controller, chat_id, release, log))
+        for chat_id in ("a", "a", "b", "c")
+    ]
+    await asyncio.sleep(0.05)
+
+    # The second turn of chat "a" waits, but does not hold back chat "b".
+    assert log == ["start a", "start b"]
+    assert controller.active == 2
+    assert len(controller.waiters) == 2
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert sorted(log) == sorted(
+        ["start a", "start b", "start a", "start c"]
+        + ["end a", "end b", "end a", "end c"]
+    )
+    assert controller.active == 0 and not controller.waiters
+
+
+@pytest.mark.asyncio
+async def test_sheds_with_retry_after_when_queue_is_full_or_deadline_too_close():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, max_wait=5)
+    release = asyncio.Event()
+    running = asyncio.create_task(_hold(controller, "a", release, []))
+    await asyncio.sleep(0)
+    queued = asyncio.create_task(_hold(controller, "b", release, []))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc:
+        async with controller.admit("c"):
+            pass
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) >= 1
+
+    # With room in the queue, a turn still cannot wait past its deadline.
+    controller.max_queue = 10
+    controller.avg_turn_seconds = 30
+    with pytest.raises(HTTPException) as exc:
+        async with controller.admit("c"):
+            pass
+    assert exc.value.headers["Retry-After"] == "60"
+
+    release.set()
+    await asyncio.gather(running, queued)
+
+
+@pytest.mark.asyncio
+async def test_queued_turn_times_out_and_leaves_the_queue():
+    controller = AdmissionController(max_concurrent=1, max_wait=0.05)
+    controller.avg_turn_seconds = 0.01
+    release = asyncio.Event()
+    running = asyncio.create_task(_hold(controller, "a", release, []))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc:
+        async with controller.admit("b"):
+            pass
+    assert exc.value.status_code == 429
+    assert not controller.waiters
+
+    release.set()
+    await running
+    assert controller.active == 0
+
+
+@pytest.fixture
+def fake_llm_app():
+    return fake_llm.create_app(latency=0.3)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_turns_on_one_chat_are_shed(client, fake_llm_url, monkeypatch):
+    monkeypatch.setattr(
+        admission, "_controller", AdmissionController(max_concurrent=4, max_wait=0)
+    )
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    body = {"messages": [{"role": "user", "content": "hello"}]}
+
+    first, second = await asyncio.gather(
+        client.put(f"/chat/{chat_id}", json=body),
+        client.put(f"/chat/{chat_id}", json=body),
+    )
+    assert sorted([first.status_code, second.status_code]) == [200, 429]
+    rejected = first if first.status_code == 429 else second
+    assert "Retry-After" in rejected.headers
+
+    text = (await client.get("/metrics")).text
+    assert 'admission_shed_total{reason="deadline"}' in text
+    assert "admission_queue_depth 0" in text
+
+
+@pytest.mark.asyncio
+async def test_queued_turns_take_no_slot(client, fake_llm_url, monkeypatch):
+    controller = AdmissionController(max_concurrent=1, max_queue=0, max_wait=0)
+    monkeypatch.setattr(admission, "_controller", controller)
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    body = {"messages": [{"role": "user", "content": "hello"}]}
+
+    async with controller.admit("busy"):
+        resp = await client.put(
+            f"/chat/{chat_id}", json=body, headers={"Prefer": "respond-async"}
+        )
+        assert resp.status_code == 202
+        assert (await client.put(f"/chat/{chat_id}", json=body)).status_code == 429
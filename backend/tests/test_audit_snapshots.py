@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime
+
+import pytest
+from sqlalchemy import func, select
+
+import audit
+import crud
+import database
+import schemas
+from models import AuditChange, AuditRevision, FormSubmission, OutboxEvent, utcnow
+
+
+async def _create_form(chat_id: str) -> str:
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        audit.track(db, source="api")
+        form = await crud.form.create(
+            db=db,
+            obj_in=schemas.FormSubmissionCreate(
+                name="Ada", email="ada@example.com", phone_number="1", chat_id=chat_id
+            ),
+        )
+        return form.id
+
+
+@pytest.mark.asyncio
+async def test_form_as_of_uses_snapshots(client, monkeypatch):
+    monkeypatch.setenv("AUDIT_SNAPSHOT_EVERY", "3")
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    form_id = await _create_form(chat_id)
+
+    marks = []
+    for i in range(7):
+        resp = await client.put(f"/forms/{form_id}", json={"name": f"Ada {i}"})
+        assert resp.status_code == 200
+        marks.append(datetime.now(UTC).isoformat())
+
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        versions = (
+            await db.scalars(
+                select(AuditRevision.version)
+                .where(AuditRevision.snapshot.is_not(None))
+                .order_by(AuditRevision.version)
+            )
+        ).all()
+    assert versions == [1, 3, 6]
+
+    for i, mark in enumerate(marks):
+        resp = await client.get(f"/forms/{form_id}", params={"as_of": mark})
+        assert resp.status_code == 200
+        assert resp.json()["name"] == f"Ada {i}"
+        assert resp.json()["email"] == "ada@example.com"
+
+    resp = await client.get(f"/forms/{form_id}", params={"as_of": "2000-01-01T00:00"})
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_chat_forms_as_of(client):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    kept = await _create_form(chat_id)
+    deleted = await _create_form(chat_id)
+    await client.put(f"/forms/{kept}", json={"status": 2})
+    before_delete = datetime.now(UTC).isoformat()
+    await client.delete(f"/forms/{deleted}")
+
+    resp = await client.get(f"/chat/{chat_id}/forms", params={"as_of": before_delete})
+    assert sorted(form["id"] for form in resp.json()) == sorted([kept, deleted])
+
+    resp = await client.get(
+        f"/chat/{chat_id}/forms",
+        params={"as_of": datetime.now(UTC).isoformat(), "status": 2},
+    )
+    assert [form["id"] for form in resp.json()] == [kept]
+
+
+@pytest.mark.asyncio
+async def test_tracked_flush_audits_every_row_it_writes(client):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        audit.track(db, source="ui", actor_id="u1")
+        forms = [
+            FormSubmission(name=f"n{i}", email="e", phone_number="p", chat_id=chat_id)
+            for i in range(3)
+        ]
+        db.add_all(forms)
+        await db.commit()
+
+        forms[0].status = 2
+        forms[1].name = "n1"  # unchanged: no revision
+        await db.delete(forms[2])
+        await db.commit()
+
+        revisions = (
+            await db.scalars(
+                select(AuditRevision).order_by(
+                    AuditRevision.entity_id, AuditRevision.version
+                )
+            )
+        ).all()
+        events = await db.scalar(select(func.count()).select_from(OutboxEvent))
+        update = next(rev for rev in revisions if rev.event_type == "update")
+        changes = (
+            await db.scalars(
+                select(AuditChange).where(AuditChange.revision_id == update.id)
+            )
+        ).all()
+
+    by_form = {}
+    for rev in revisions:
+        by_form.setdefault(rev.entity_id, []).append(
+            (rev.event_type, rev.version, rev.source, rev.actor_id)
+        )
+    assert by_form == {
+        forms[0].id: [("create", 1, "ui", "u1"), ("update", 2, "ui", "u1")],
+        forms[1].id: [("create", 1, "ui", "u1")],
+        forms[2].id: [("create", 1, "ui", "u1"), ("delete", 2, "ui", "u1")],
+    }
+    assert events == len(revisions)
+    assert all(rev.parent_id == chat_id for rev in revisions)
+    assert [(ch.field, ch.old_value, ch.new_value) for ch in changes] == [
+        ("status", None, 2)
+    ]
+    created = next(rev for rev in revisions if rev.entity_id == forms[1].id)
+    assert created.snapshot["name"] == "n1" and created.snapshot["chat_id"] == chat_id
+
+
+@pytest.mark.asyncio
+async def test_a_version_taken_concurrently_is_retried(client, monkeypatch):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    form_id = await _create_form(chat_id)
+    await client.put(f"/forms/{form_id}", json={"name": "Ada 1"})
+
+    # The first lookup reads what a racing writer saw before version 2 committed.
+    last_versions = audit._last_versions
+    stale = iter([{form_id: 1}])
+    monkeypatch.setattr(
+        audit,
+        "_last_versions",
+        lambda *args: next(stale, None) or last_versions(*args),
+    )
+    resp = await client.put(f"/forms/{form_id}", json={"name": "Ada 2"})
+    assert resp.status_code == 200
+
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        revisions = (
+            await db.scalars(
+                select(AuditRevision)
+                .where(AuditRevision.entity_id == form_id)
+                .order_by(AuditRevision.version)
+            )
+        ).all()
+        changes = await db.scalar(select(func.count()).select_from(AuditChange))
+        events = (await db.scalars(select(OutboxEvent.version))).all()
+    assert [r.version for r in revisions] == [1, 2, 3]
+    assert changes == 5 + 1 + 1
+    assert sorted(events) == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_one_flush_writes_all_its_revisions(client):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        audit.track(db, source="api")
+        db.add_all(
+            FormSubmission(
+                created_at=utcnow(),
+                name=name,
+                email="e",
+                phone_number="p",
+                chat_id=chat_id,
+            )
+            for name in ("a", "b", "c")
+        )
+        await db.commit()
+
+        revisions = (await db.scalars(select(AuditRevision))).all()
+        changes = await db.scalar(select(func.count()).select_from(AuditChange))
+        events = await db.scalar(select(func.count()).select_from(OutboxEvent))
+    assert sorted((r.event_type, r.version) for r in revisions) == [("create", 1)] * 3
+    assert (changes, events) == (15, 3)
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from openai import AsyncOpenAI
+
+import capture
+import database
+import main
+import turns
+from benchmarks import fake_llm, replay
+from models import Base
+from router import Router
+
+PII = {"name": "Grace Hopper", "email": "grace@navy.mil", "phone_number": "2025550199"}
+
+
+def test_sanitize_replaces_personal_data():
+    arguments = json.dumps(PII)
+    body = {
+        "messages": [
+            {"role": "system", "content": "You are helpful."},
+            {"role": "user", "content": "I'm Grace Hopper, grace@navy.mil"},
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{"function": {"name": "f", "arguments": arguments}}],
+            },
+            {"role": "tool", "name": "f", "content": "Error: no form for Grace"},
+        ],
+        **PII,
+    }
+    clean = capture.sanitize(body, "abc123")
+    assert not any(value in json.dumps(clean) for value in PII.values())
+    assert clean["email"].endswith("@example.com")
+    assert clean == capture.sanitize(body, "abc123")  # stable pseudonyms
+
+    system, user, assistant, tool = clean["messages"]
+    assert system["content"] != body["messages"][0]["content"]
+    assert tool["name"] == "f" and "Grace" not in tool["content"]
+    assert capture.record_id_of(user["content"]) == "abc123"
+    assert len(user["content"]) == len(body["messages"][1]["content"])
+    function = assistant["tool_calls"][0]["function"]
+    assert function["name"] == "f"
+    args = json.loads(function["arguments"])
+    assert args == {key: clean[key] for key in PII}
+
+
+@pytest.fixture
+def captured(tmp_path, monkeypatch):
+    writer = capture.Writer(tmp_path / "captures")
+    monkeypatch.setattr(capture, "_writer", writer)
+    return writer
+
+
+@pytest.mark.asyncio
+async def test_captured_traffic_replays_on_a_fresh_database(
+    _test_db, fake_llm_url, captured, tmp_path, monkeypatch
+):
+    transport = ASGITransport(app=capture.CaptureMiddleware(main.app))
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+        ask = [{"role": "user", "content": "create my form, I'm Grace Hopper"}]
+        resp = await client.put(f"/chat/{chat_id}", json={"messages": ask})
+        assert resp.status_code == 200
+        form_id = (await client.get(f"/chat/{chat_id}/forms")).json()[0]["id"]
+        await client.put(f"/forms/{form_id}", json={**PII, "status": 2})
+        await client.get(f"/forms/{form_id}/history")
+        await client.get("/forms/missing")
+    captured.flush()
+
+    files = list((tmp_path / "captures").glob("capture-*.ndjson.gz"))
+    records = replay.load(files)
+    assert [r["route"] for r in records] == [
+        "/chat",
+        "/chat/{chat_id}",
+        "/chat/{chat_id}/forms",
+        "/forms/{form_id}",
+        "/forms/{form_id}/history",
+        "/forms/{form_id}",
+    ]
+    assert records[1]["llm"] and form_id in records[3]["ids"]
+    text = json.dumps(records)
+    assert "Hopper" not in text and "grace@navy.mil" not in text
+
+    # A fresh database, and a fake LLM that only knows the recorded completions.
+    await database.engine.dispose()
+    database.init_engine(f"sqlite+aiosqlite:///{tmp_path / 'replay.db'}")
+    async with database.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    player = replay.Replay(records)
+    llm_app = fake_llm.create_app(reply=player.reply)
+    with fake_llm.serve(llm_app) as url:
+        client_ = AsyncOpenAI(base_url=url, api_key="x")
+        monkeypatch.setattr(turns, "llm", Router.single(client_, turns.LLM_MODEL))
+        transport = ASGITransport(app=main.app)
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            report = await player.run(client, time_scale=100)
+            assert report["mismatches"] == []
+            assert report["routes"]["GET /forms/{form_id}"]["statuses"] == {"404": 1}
+            new_form_id = player.ids[form_id]
+            assert new_form_id != form_id
+            form = (await client.get(f"/forms/{new_form_id}")).json()
+    assert form["email"] == records[3]["body"]["email"]
+
+    worse = {**report, "statuses": {**report["statuses"], records[2]["r"]: 500}}
+    diff = replay.compare(worse, report)
+    assert diff["changed_statuses"] == [
+        {"r": records[2]["r"], "before": 200, "after": 500}
+    ]
+    assert set(diff["routes"]) == set(report["routes"])
+
+
+@pytest.mark.asyncio
+async def test_streamed_uploads_are_measured_not_buffered(
+    client, captured, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("CAPTURE_FLUSH_EVERY", "1")
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    row = json.dumps(
+        {"name": "n", "email": "e", "phone_number": "p", "chat_id": chat_id}
+    )
+    body = (row + "\n") * 50
+    transport = ASGITransport(app=capture.CaptureMiddleware(main.app))
+    async with AsyncClient(transport=transport, base_url="http://test") as capturing:
+        resp = await capturing.post(
+            "/forms/import",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+    assert resp.json()["imported"] == 50
+    await asyncio.gather(*captured.tasks)  # written in a worker thread
+    [record] = replay.load((tmp_path / "captures").glob("*.ndjson.gz"))
+    assert record["body"] is None and record["body_bytes"] == len(body)
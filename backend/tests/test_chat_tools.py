@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import pytest
+from openai import AsyncOpenAI
+
+import turns
+from benchmarks import fake_llm
+from router import Router
+
+
+async def _turn(client, chat_id: str, messages: list, content: str) -> list:
+    messages = [*messages, {"role": "user", "content": content}]
+    resp = await client.put(f"/chat/{chat_id}", json={"messages": messages})
+    assert resp.status_code == 200
+    return resp.json()["messages"]
+
+
+@pytest.mark.asyncio
+async def test_chat_turns_create_update_and_delete_forms(client, fake_llm_url):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+
+    messages = await _turn(client, chat_id, [], "please create my form")
+    assert [m["role"] for m in messages] == ["user", "assistant", "tool", "assistant"]
+    forms = (await client.get(f"/chat/{chat_id}/forms")).json()
+    assert len(forms) == 1
+    form_id = forms[0]["id"]
+
+    messages = await _turn(client, chat_id, messages, "update it please")
+    assert messages[-2]["content"] == f"Success! Form {form_id} updated"
+    assert (await client.get(f"/forms/{form_id}")).json()["status"] == 2
+
+    messages = await _turn(client, chat_id, messages, "now delete it")
+    assert messages[-2]["content"] == f"Success! Form {form_id} deleted"
+    assert (await client.get(f"/chat/{chat_id}/forms")).json() == []
+
+    history = (await client.get(f"/forms/{form_id}/history")).json()
+    assert [rev["event_type"] for rev in history] == ["delete", "update", "create"]
+
+
+@pytest.mark.asyncio
+async def test_fast_path_answers_successful_tool_turns_from_templates(
+    client, fake_llm_app, fake_llm_url, monkeypatch
+):
+    monkeypatch.setenv("CHAT_FAST_PATH", "1")
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+
+    messages = await _turn(client, chat_id, [], "please create my form")
+    form_id = (await client.get(f"/chat/{chat_id}/forms")).json()[0]["id"]
+    assert messages[-1] == {
+        "role": "assistant",
+        "content": f"Thanks, Ada Lovelace! Your interest form has been submitted "
+        f"(ID: {form_id}).",
+    }
+    assert fake_llm_app.state.calls == 1
+
+    messages = await _turn(client, chat_id, messages, "update it please")
+    assert messages[-1]["content"] == f"Your form {form_id} has been updated."
+    assert fake_llm_app.state.calls == 2
+
+    # A failed tool call still goes back to the model to explain it.
+    messages = await _turn(client, chat_id, [], "delete it")
+    assert messages[-2]["content"].startswith("Error")
+    assert messages[-1]["content"] == "Done! Anything else?"
+    assert fake_llm_app.state.calls == 4
+
+    text = (await client.get("/metrics")).text
+    assert 'chat_reply_path_total{path="template"}' in text
+    assert 'chat_reply_path_total{path="llm"}' in text
+
+
+@pytest.mark.asyncio
+async def test_non_object_tool_arguments_get_an_error_reply(client):
+    def reply(messages: list[dict]) -> dict:
+        if messages[-1]["role"] == "tool":
+            return fake_llm.scripted_reply(messages)
+        call = {"name": "update_interest_form", "arguments": "[]"}
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": "call_0", "type": "function", "function": call}],
+        }
+
+    llm_app = fake_llm.create_app(reply=reply)
+    with fake_llm.serve(llm_app) as url:
+        client_ = AsyncOpenAI(base_url=url, api_key="x")
+        llm = Router.single(client_, turns.LLM_MODEL)
+        with pytest.MonkeyPatch.context() as patch:
+            patch.setattr(turns, "llm", llm)
+            chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+            messages = await _turn(client, chat_id, [], "update it")
+    assert messages[-2]["content"] == "Error: Invalid JSON arguments"
+    assert messages[-1]["content"] == "Done! Anything else?"
+    assert llm_app.state.calls == 2
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+from sqlalchemy import text
+
+import crud
+import database
+import main
+import schemas
+from benchmarks.transcripts import make_transcript
+from models import ZLIB_TAG
+
+
+@pytest.mark.asyncio
+async def test_chat_messages_stored_compressed(client):
+    messages = make_transcript(20)
+    resp = await client.post("/chat", json={"messages": messages})
+    assert resp.status_code == 200
+    chat_id = resp.json()["id"]
+
+    async with database.engine.connect() as conn:
+        stored = await conn.scalar(
+            text("SELECT messages FROM chat WHERE id = :id"), {"id": chat_id}
+        )
+    assert stored.startswith(ZLIB_TAG)
+
+    resp = await client.get(f"/chat/{chat_id}")
+    assert resp.json()["messages"] == messages
+
+
+@pytest.mark.asyncio
+async def test_legacy_json_text_rows_are_readable(client):
+    async with database.engine.begin() as conn:
+        await conn.execute(
+            text(
+                "INSERT INTO chat (id, created_at, messages) "
+                "VALUES ('legacy', '2026-01-01 00:00:00', :messages)"
+            ),
+            {"messages": '[{"role": "user", "content": "hi"}]'},
+        )
+
+    resp = await client.get("/chat/legacy")
+    assert resp.status_code == 200
+    assert resp.json()["messages"] == [{"role": "user", "content": "hi"}]
+
+
+@pytest.mark.parametrize("codec", ["zlib", "none"])
+@pytest.mark.asyncio
+async def test_chat_reads_splice_stored_json(client, monkeypatch, codec):
+    monkeypatch.setenv("CHAT_MESSAGES_CODEC", codec)
+    messages = make_transcript(5) + [{"role": "user", "content": "ça coûte 5 €?"}]
+    chat_id = (await client.post("/chat", json={"messages": messages})).json()["id"]
+
+    resp = await client.get(f"/chat/{chat_id}")
+    async with database.SessionLocal() as db:
+        chat = await crud.chat.get(db, id=chat_id)
+    validated = json.loads(main._render_json(schemas.Chat, chat))
+    assert list(resp.json().items()) == list(validated.items())
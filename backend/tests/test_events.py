@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import crud
+import database
+import events
+import main
+import schemas
+from models import AuditRevision
+
+
+async def _create_form(chat_id: str) -> str:
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        form = await crud.form.create(
+            db=db,
+            obj_in=schemas.FormSubmissionCreate(
+                name="Ada", email="ada@example.com", phone_number="1", chat_id=chat_id
+            ),
+        )
+    return form.id
+
+
+async def _read_events(path: str, count: int, headers=(), on_open=None) -> list:
+    """Drive the ASGI app directly and collect `count` SSE events."""
+    chunks: list[str] = []
+    received = asyncio.Event()
+    disconnect = asyncio.Event()
+
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            chunks.append(message.get("body", b"").decode())
+            if "".join(chunks).count("\n\n") >= count:
+                received.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(k.encode(), v.encode()) for k, v in headers],
+        "server": ("test", 80),
+        "client": ("test", 1),
+    }
+    task = asyncio.create_task(main.app(scope, receive, send))
+    if on_open is not None:
+        await asyncio.sleep(0.05)
+        await on_open()
+    await asyncio.wait_for(received.wait(), 5)
+    disconnect.set()
+    await asyncio.wait_for(task, 5)
+    blocks = [b for b in "".join(chunks).split("\n\n") if b.startswith("id:")]
+    return [dict(line.split(": ", 1) for line in b.splitlines()) for b in blocks]
+
+
+@pytest.mark.asyncio
+async def test_feed_streams_live_revisions_and_resumes(client, monkeypatch):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    form_id = await _create_form(chat_id)
+
+    async def mutate():
+        await client.put(f"/forms/{form_id}", json={"status": 2})
+        await client.put(f"/forms/{form_id}", json={"status": 3})
+
+    live = await _read_events(f"/chat/{chat_id}/forms/events", 2, on_open=mutate)
+    assert [json.loads(e["data"])["changes"][0]["new_value"] for e in live] == [2, 3]
+    assert all(e["event"] == "update" for e in live)
+
+    # Resuming repeats the lag window before the last id, all of it here.
+    await client.delete(f"/forms/{form_id}")
+    resumed = await _read_events(
+        f"/chat/{chat_id}/forms/events", 3, [("last-event-id", live[0]["id"])]
+    )
+    assert [e["event"] for e in resumed] == ["update", "update", "delete"]
+    assert [e["id"] for e in resumed[:2]] == [e["id"] for e in live]
+
+    # An id the server does not know replays the chat from the start.
+    monkeypatch.setenv("EVENTS_LAG_SECONDS", "0")
+    replayed = await _read_events(
+        f"/chat/{chat_id}/forms/events", 3, [("last-event-id", "bogus")]
+    )
+    assert [e["id"] for e in replayed] == [e["id"] for e in resumed]
+
+
+@pytest.mark.asyncio
+async def test_revisions_committed_out_of_order_are_not_skipped(client):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    form_id = await _create_form(chat_id)
+    stream = events.stream(chat_id)
+    first = asyncio.ensure_future(anext(stream))
+    await asyncio.sleep(0.05)
+    await client.put(f"/forms/{form_id}", json={"status": 2})
+    sent = json.loads((await asyncio.wait_for(first, 5)).split("data: ")[1])
+
+    # Stamped before the revision already sent, but committed after it.
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        late = AuditRevision(
+            created_at=datetime.fromisoformat(sent["created_at"])
+            - timedelta(seconds=1),
+            entity_type="form_submission",
+            entity_id="other-form",
+            event_type="create",
+            parent_id=chat_id,
+        )
+        db.add(late)
+        await db.commit()
+    events.notify(chat_id)
+    second = await asyncio.wait_for(anext(stream), 5)
+    assert second.startswith(f"id: {late.id}\n")
+    await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_one_feed_serves_all_subscribers(client, monkeypatch):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    form_id = await _create_form(chat_id)
+    fetches = 0
+    fetch_events = events.fetch_events
+
+    async def counting_fetch(*args):
+        nonlocal fetches
+        fetches += 1
+        return await fetch_events(*args)
+
+    monkeypatch.setattr(events, "fetch_events", counting_fetch)
+    streams = [events.stream(chat_id) for _ in range(5)]
+    pending = [asyncio.ensure_future(anext(s)) for s in streams]
+    await asyncio.sleep(0.05)
+    assert len(events._feeds) == 1
+
+    await client.put(f"/forms/{form_id}", json={"status": 2})
+    first = await asyncio.wait_for(asyncio.gather(*pending), 5)
+    assert len(set(first)) == 1 and first[0].startswith("id: ")
+    assert fetches == 1
+    for s in streams:
+        await s.aclose()
+
+
+@pytest.mark.asyncio
+async def test_overflowed_subscriber_is_closed_at_once(client, monkeypatch):
+    monkeypatch.setattr(events, "QUEUE_SIZE", 2)
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    stream = events.stream(chat_id)
+    first = asyncio.ensure_future(anext(stream))
+    await asyncio.sleep(0.05)
+
+    feed = events._feeds[chat_id]
+    for revision in range(3):
+        feed.publish({"id": revision})
+    assert not feed.subscribers
+    with pytest.raises(StopAsyncIteration):
+        await asyncio.wait_for(first, 1)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import insert
+
+import database
+import exporter
+from models import Chat, FormSubmission, utcnow
+
+
+async def _seed(rows: int) -> tuple[list[str], object]:
+    """Two chats with `rows` forms between them, one minute apart."""
+    start = utcnow()
+    async with database.SessionLocal() as db:
+        chats = [Chat(created_at=start, messages=[]) for _ in range(2)]
+        db.add_all(chats)
+        await db.commit()
+        chat_ids = [chat.id for chat in chats]
+        await db.execute(
+            insert(FormSubmission.__table__),
+            [
+                {
+                    "id": f"form-{i:05d}",
+                    "created_at": start + timedelta(minutes=i),
+                    "chat_id": chat_ids[i % 2],
+                    "name": f"Name {i}",
+                    "email": f"n{i}@example.com",
+                    "phone_number": "555-0100",
+                    "status": i % 3 + 1,
+                }
+                for i in range(rows)
+            ],
+        )
+        await db.commit()
+    return chat_ids, start
+
+
+@pytest.mark.asyncio
+async def test_csv_export_streams_every_row(client, monkeypatch):
+    monkeypatch.setenv("EXPORT_BATCH_SIZE", "7")
+    await _seed(50)
+
+    resp = await client.get("/forms/export")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(resp.text)))
+    assert len(rows) == 50
+    assert [r["id"] for r in rows] == [f"form-{i:05d}" for i in range(50)]
+    assert rows[0]["name"] == "Name 0" and rows[0]["status"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_ndjson_export_filters(client):
+    chat_ids, start = await _seed(30)
+    params = {
+        "format": "ndjson",
+        "status": 2,
+        "chat_id": chat_ids[1],
+        "created_after": (start + timedelta(minutes=5)).isoformat(),
+        "created_before": (start + timedelta(minutes=25)).isoformat(),
+    }
+    resp = await client.get("/forms/export", params=params)
+    rows = [json.loads(line) for line in resp.text.splitlines()]
+    # Odd minutes belong to the second chat; status 2 means i % 3 == 1.
+    assert [r["id"] for r in rows] == ["form-00007", "form-00013", "form-00019"]
+    assert all(r["chat_id"] == chat_ids[1] and r["status"] == 2 for r in rows)
+
+    resp = await client.get("/forms/export", params={"status": 9})
+    assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_disconnect_closes_the_cursor(_test_db, monkeypatch):
+    monkeypatch.setenv("EXPORT_BATCH_SIZE", "10")
+    await _seed(100)
+    before = exporter.aborted.values.get((("format", "ndjson"),), 0)
+
+    chunks = exporter.stream("ndjson", exporter.build_query())
+    first = await chunks.__anext__()
+    assert len(first.splitlines()) == 10
+    await chunks.aclose()  # what a client disconnect does to the response body
+
+    assert exporter.aborted.values[(("format", "ndjson"),)] == before + 1
+    # The read cursor is gone: SQLite accepts a write from another session.
+    async with database.SessionLocal() as db:
+        db.add(Chat(created_at=utcnow(), messages=[]))
+        await db.commit()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+import crud
+import database
+import retention
+import schemas
+from models import Chat, utcnow
+
+
+def _messages(*texts: str) -> list[dict]:
+    return [{"role": "user", "content": text} for text in texts]
+
+
+async def _stored(chat_id: str) -> Chat:
+    async with database.SessionLocal() as db:
+        return await crud.chat.get(db, id=chat_id)
+
+
+@pytest.mark.asyncio
+async def test_forks_share_their_prefix(client, fake_llm_url):
+    history = _messages("a", "b", "c", "d")
+    root = (await client.post("/chat", json={"messages": history})).json()["id"]
+
+    resp = await client.post(f"/chat/{root}/fork", params={"at": 2})
+    assert resp.status_code == 200
+    fork = resp.json()
+    assert fork["parent_id"] == root and fork["fork_at"] == 2
+    assert fork["messages"] == history[:2]
+    assert (await _stored(fork["id"])).messages == []
+
+    # A turn on the fork stores only what the fork added.
+    ask = [*history[:2], {"role": "user", "content": "retry: create my form"}]
+    resp = await client.put(f"/chat/{fork['id']}", json={"messages": ask})
+    assert resp.status_code == 200
+    full = resp.json()["messages"]
+    assert full[:3] == ask and len(full) > 3
+    stored = await _stored(fork["id"])
+    assert stored.parent_id == root and stored.messages == full[2:]
+    assert (await client.get(f"/chat/{fork['id']}")).json()["messages"] == full
+    assert (await client.get(f"/chat/{root}")).json()["messages"] == history
+
+    # Forking inside the shared part points at the chat that stored it.
+    nested = (await client.post(f"/chat/{fork['id']}/fork?at=1")).json()
+    assert nested["parent_id"] == root and nested["messages"] == history[:1]
+    deeper = (await client.post(f"/chat/{fork['id']}/fork?at=4")).json()
+    assert deeper["parent_id"] == fork["id"]
+    assert (await client.get(f"/chat/{deeper['id']}")).json()["messages"] == full[:4]
+    listed = {c["id"]: c for c in (await client.get("/chat")).json()}
+    assert listed[deeper["id"]]["messages"] == full[:4]
+
+    assert (await client.post(f"/chat/{root}/fork?at=5")).status_code == 422
+    assert (await client.post("/chat/missing/fork")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_rewriting_a_parent_copies_the_prefix_into_its_forks(client):
+    history = _messages("a", "b", "c")
+    root = (await client.post("/chat", json={"messages": history})).json()["id"]
+    early = (await client.post(f"/chat/{root}/fork?at=1")).json()["id"]
+    late = (await client.post(f"/chat/{root}/fork?at=3")).json()["id"]
+
+    async with database.SessionLocal() as db:
+        chat = await crud.chat.get(db, id=root)
+        rewritten = schemas.ChatUpdate(messages=_messages("a", "B"))
+        await crud.chat.update(db, db_obj=chat, obj_in=rewritten)
+
+    assert (await _stored(early)).parent_id == root
+    stored = await _stored(late)
+    assert stored.parent_id is None and stored.messages == history
+    assert (await client.get(f"/chat/{late}")).json()["messages"] == history
+    assert (await client.get(f"/chat/{early}")).json()["messages"] == history[:1]
+
+
+@pytest.mark.asyncio
+async def test_chats_with_forks_are_not_archived(client, tmp_path, monkeypatch):
+    monkeypatch.setenv("ARCHIVE_DIR", str(tmp_path))
+    history = _messages("a", "b")
+    root = (await client.post("/chat", json={"messages": history})).json()["id"]
+    fork = (await client.post(f"/chat/{root}/fork?at=1")).json()["id"]
+
+    async with database.SessionLocal() as db:
+        archived = await retention.archive_chats(
+            db, inactive_before=utcnow() + timedelta(days=1)
+        )
+        assert archived == 1
+        assert await db.scalar(select(func.count()).select_from(Chat)) == 1
+        restored = await retention.restore_chat(db, fork)
+    assert restored.messages == history[:1] and restored.parent_id is None
+    assert (await client.get(f"/chat/{fork}")).json()["messages"] == history[:1]
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+import crud
+import database
+import idempotency
+import schemas
+from benchmarks import fake_llm
+from models import AuditRevision, IdempotencyKey, utcnow
+
+
+@pytest.fixture
+def fake_llm_app():
+    return fake_llm.create_app(latency=0.05)
+
+
+async def _add_form(chat_id: str) -> str:
+    async with database.SessionLocal() as db:
+        form = await crud.form.create(
+            db=db,
+            obj_in=schemas.FormSubmissionCreate(
+                name="Ada", email="e", phone_number="p", chat_id=chat_id
+            ),
+        )
+    return form.id
+
+
+async def _count(model) -> int:
+    async with database.SessionLocal() as db:
+        return await db.scalar(select(func.count()).select_from(model))
+
+
+@pytest.mark.asyncio
+async def test_retried_form_update_is_replayed_not_reapplied(client):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    form_id = await _add_form(chat_id)
+    headers = {"Idempotency-Key": "update-1"}
+
+    first = await client.put(f"/forms/{form_id}", json={"status": 2}, headers=headers)
+    again = await client.put(f"/forms/{form_id}", json={"status": 2}, headers=headers)
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+    assert again.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert await _count(AuditRevision) == 1
+
+    # Same key, different request.
+    resp = await client.put(f"/forms/{form_id}", json={"status": 3}, headers=headers)
+    assert resp.status_code == 422
+
+    # Deletes replay their 200 instead of turning into a 404.
+    headers = {"Idempotency-Key": "delete-1"}
+    resp = await client.delete(f"/forms/{form_id}", headers=headers)
+    assert resp.status_code == 200
+    resp = await client.delete(f"/forms/{form_id}", headers=headers)
+    assert resp.status_code == 200 and resp.headers["idempotent-replayed"] == "true"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_chat_turn_waits_for_the_original(
+    client, fake_llm_app, fake_llm_url
+):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    body = {"messages": [{"role": "user", "content": "please create my form"}]}
+    headers = {"Idempotency-Key": "turn-1"}
+
+    first, second = await asyncio.gather(
+        client.put(f"/chat/{chat_id}", json=body, headers=headers),
+        client.put(f"/chat/{chat_id}", json=body, headers=headers),
+    )
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert fake_llm_app.state.calls == 2  # one turn: the tool call and the reply
+    assert len((await client.get(f"/chat/{chat_id}/forms")).json()) == 1
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_kept_and_server_errors_released(client):
+    headers = {"Idempotency-Key": "missing-1"}
+    resp = await client.put("/forms/nope", json={"status": 2}, headers=headers)
+    assert resp.status_code == 404
+    assert await _count(IdempotencyKey) == 1
+
+    await idempotency.finish("missing-1", 503, [], b"")
+    assert await _count(IdempotencyKey) == 0
+
+
+@pytest.mark.asyncio
+async def test_expired_keys_are_collected_and_reusable(client):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    form_id = await _add_form(chat_id)
+    headers = {"Idempotency-Key": "old"}
+    await client.put(f"/forms/{form_id}", json={"status": 2}, headers=headers)
+
+    async with database.SessionLocal() as db:
+        key = await db.get(IdempotencyKey, "old")
+        key.expires_at = utcnow() - timedelta(seconds=1)
+        await db.commit()
+
+    resp = await client.put(f"/forms/{form_id}", json={"status": 3}, headers=headers)
+    assert resp.status_code == 200 and resp.json()["status"] == 3
+
+    async with database.SessionLocal() as db:
+        key = await db.get(IdempotencyKey, "old")
+        key.expires_at = utcnow() - timedelta(seconds=1)
+        await db.commit()
+    assert await idempotency.collect_garbage() == 1
+    assert await _count(IdempotencyKey) == 0
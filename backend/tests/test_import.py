@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+import database
+from models import OutboxEvent
+
+
+async def _chat_id(client) -> str:
+    return (await client.post("/chat", json={"messages": []})).json()["id"]
+
+
+@pytest.mark.asyncio
+async def test_csv_import_reports_bad_rows(client):
+    chat_id = await _chat_id(client)
+    body = (
+        "name,email,phone_number,status,chat_id\n"
+        f'"Doe, Jane",jane@example.com,555-0100,1,{chat_id}\n'
+        f"Bob,bob@example.com,555-0101,,{chat_id}\n"
+        f"Eve,eve@example.com,555-0102,7,{chat_id}\n"
+        f"Mal,mal@example.com,555-0103,2,missing\n"
+        f'"Multi\nline",ml@example.com,555-0104,3,{chat_id}\n'
+        "too,few\n"
+    )
+    resp = await client.post(
+        "/forms/import", content=body, headers={"Content-Type": "text/csv"}
+    )
+    assert resp.status_code == 200
+    report = resp.json()
+    assert (report["imported"], report["failed"]) == (3, 3)
+    assert [e["row"] for e in report["errors"]] == [3, 4, 6]
+    assert "chat missing not found" in report["errors"][1]["error"]
+
+    forms = (await client.get(f"/chat/{chat_id}/forms")).json()
+    assert sorted(f["name"] for f in forms) == ["Bob", "Doe, Jane", "Multi\nline"]
+    history = (await client.get(f"/forms/{forms[0]['id']}/history")).json()
+    assert [(r["event_type"], r["source"]) for r in history] == [("create", "import")]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_import_streams_in_chunks(client, monkeypatch):
+    monkeypatch.setenv("IMPORT_CHUNK_SIZE", "2")
+    chat_id = await _chat_id(client)
+    rows = [
+        {"name": f"n{i}", "email": "e", "phone_number": "p", "chat_id": chat_id}
+        for i in range(5)
+    ]
+    lines = [json.dumps(row) for row in rows] + ["not json", "[1]", '{"name": "x"}']
+
+    async def body():
+        for line in lines:
+            yield (line + "\n").encode()
+
+    resp = await client.post(
+        "/forms/import",
+        content=body(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    report = resp.json()
+    assert (report["imported"], report["failed"]) == (5, 3)
+    assert [e["row"] for e in report["errors"]] == [6, 7, 8]
+
+    async with database.SessionLocal() as db:
+        assert await db.scalar(select(func.count(OutboxEvent.id))) == 5
+
+
+@pytest.mark.asyncio
+async def test_unknown_content_type_is_rejected(client):
+    resp = await client.post("/forms/import", content=b"{}")
+    assert resp.status_code == 415
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+import database
+import jobs
+import worker
+from models import Chat, Job, utcnow
+
+
+async def _chat(db) -> str:
+    chat = Chat(created_at=utcnow(), messages=[])
+    db.add(chat)
+    await db.commit()
+    return chat.id
+
+
+@pytest.mark.asyncio
+async def test_async_turn_runs_in_worker_and_is_polled(client, fake_llm_url):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    messages = [{"role": "user", "content": "please create my form"}]
+
+    resp = await client.put(
+        f"/chat/{chat_id}",
+        json={"messages": messages},
+        headers={"Prefer": "respond-async"},
+    )
+    assert resp.status_code == 202
+    job = resp.json()
+    assert job["status"] == "queued"
+    assert resp.headers["Location"] == f"/jobs/{job['id']}"
+
+    stop = asyncio.Event()
+    pool = asyncio.create_task(worker.work("test:0", poll_seconds=0.01, stop=stop))
+    try:
+        polled = (await client.get(f"/jobs/{job['id']}?wait=10")).json()
+    finally:
+        stop.set()
+        await pool
+
+    assert polled["status"] == "done" and polled["attempts"] == 1
+    roles = [m["role"] for m in polled["result"]["messages"]]
+    assert roles == ["user", "assistant", "tool", "assistant"]
+    chat = (await client.get(f"/chat/{chat_id}")).json()
+    assert chat["messages"] == polled["result"]["messages"]
+    assert len((await client.get(f"/chat/{chat_id}/forms")).json()) == 1
+
+
+@pytest.mark.asyncio
+async def test_turns_of_one_chat_run_in_order(_test_db):
+    async with database.SessionLocal() as db:
+        chat_a, chat_b = await _chat(db), await _chat(db)
+        first = await jobs.enqueue(db, chat_id=chat_a, messages=[])
+        second = await jobs.enqueue(db, chat_id=chat_a, messages=[])
+        other = await jobs.enqueue(db, chat_id=chat_b, messages=[])
+
+        assert (await jobs.claim(db, "w1")).id == first.id
+        # `second` waits for `first`, but chat b is not held up.
+        assert (await jobs.claim(db, "w2")).id == other.id
+        assert await jobs.claim(db, "w3") is None
+
+        claimed = await db.get(Job, first.id)
+        assert await jobs.finish(db, claimed, "w1", result={"ok": True})
+        await db.commit()
+        assert (await jobs.claim(db, "w3")).id == second.id
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_reclaimed_and_the_old_owner_loses(
+    _test_db, monkeypatch
+):
+    monkeypatch.setenv("JOB_MAX_ATTEMPTS", "2")
+    lease = timedelta(seconds=jobs.get_lease_seconds() + 1)
+    later = utcnow() + lease
+    async with database.SessionLocal() as db:
+        queued = await jobs.enqueue(db, chat_id=await _chat(db), messages=[])
+
+        crashed = await jobs.claim(db, "w1")
+        assert await jobs.claim(db, "w2") is None  # lease still held
+
+        retried = await jobs.claim(db, "w2", now=later)
+        assert retried.id == queued.id and retried.attempts == 2
+        assert retried.lease_owner == "w2"
+        assert not await jobs.finish(db, crashed, "w1", result={})
+        assert not await jobs.renew(db, queued.id, "w1")
+
+        # Out of attempts: the next expiry fails the job instead of retrying it.
+        assert await jobs.claim(db, "w3", now=later + lease) is None
+        job = await db.get(Job, queued.id, populate_existing=True)
+        assert job.status == "failed"
+
+
+@pytest.mark.asyncio
+async def test_failed_attempt_is_requeued_until_max_attempts(_test_db, monkeypatch):
+    monkeypatch.setenv("JOB_MAX_ATTEMPTS", "2")
+    async with database.SessionLocal() as db:
+        queued = await jobs.enqueue(db, chat_id=await _chat(db), messages=[])
+
+        job = await jobs.claim(db, "w1")
+        assert await jobs.finish(db, job, "w1", error="boom")
+        await db.commit()
+        job = await jobs.claim(db, "w1")
+        assert job.attempts == 2
+        assert await jobs.finish(db, job, "w1", error="boom")
+        await db.commit()
+
+        job = await db.get(Job, queued.id, populate_existing=True)
+        assert (job.status, job.error) == ("failed", "boom")
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+
+import pytest
+
+import database
+import main
+import turns
+from benchmarks import fake_llm
+
+
+@pytest.mark.asyncio
+async def test_lifespan_warms_up_and_disposes(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "engine", None)
+    monkeypatch.setattr(database, "SessionLocal", None)
+    monkeypatch.setattr(turns, "llm", None)
+    monkeypatch.setenv("DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path}/app.db")
+    monkeypatch.setenv("OPENAI_API_KEY", "x")
+
+    with fake_llm.serve(fake_llm.create_app()) as url:
+        monkeypatch.setenv("OPENAI_BASE_URL", url)
+        async with main.lifespan(main.app):
+            assert database.SessionLocal is not None
+            (endpoint,) = turns.llm.endpoints
+            assert str(endpoint.client.base_url).startswith(url)
+
+    assert database.engine is None
+    assert turns.llm is None
+
+
+def test_importing_main_does_not_connect_or_import_openai():
+    code = (
+        "import sys, main, database, turns; "
+        "assert database.engine is None and turns.llm is None; "
+        "assert 'openai' not in sys.modules"
+    )
+    subprocess.run(
+        [sys.executable, "-c", code], cwd=main.__file__.rsplit("/", 1)[0], check=True
+    )
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import itertools
+import logging
+from contextvars import ContextVar
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import metrics
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_per_route_breakdown(client):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    await client.get(f"/chat/{chat_id}")
+
+    resp = await client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    body = resp.text
+    assert (
+        'http_requests_total{method="GET",route="/chat/{chat_id}",status="200"}' in body
+    )
+    assert 'db_queries_per_request_count{route="/chat/{chat_id}"}' in body
+    assert 'db_commits_total{route="/chat"}' in body
+    assert 'serialization_time_per_request_seconds_sum{route="/chat"}' in body
+
+
+def test_slow_query_log(monkeypatch, caplog):
+    monkeypatch.setenv("SLOW_QUERY_MS", "0")
+    monkeypatch.setattr(metrics, "_current", ContextVar("request_stats", default=None))
+    clock = itertools.count()  # one second per reading
+    monkeypatch.setattr(metrics, "perf_counter", lambda: next(clock))
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+
+    with caplog.at_level(logging.WARNING, logger="metrics"):
+        with engine.connect() as conn:
+            stats = metrics.start_request()
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+            conn.execute(text("SELECT 1"))
+
+    # Timed from its own start, not from the failed statement's.
+    assert (stats.queries, stats.query_seconds) == (1, 1)
+    assert "slow query (1000.0 ms): SELECT 1" in caplog.text
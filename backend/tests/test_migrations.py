@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import zlib
+from argparse import Namespace
+from pathlib import Path
+
+from alembic.config import Config
+
+from alembic import command
+
+ALEMBIC_DIR = Path(__file__).resolve().parents[1] / "alembic"
+
+
+def _migrate(db_path: Path, revision: str, step=command.upgrade) -> None:
+    # No ini file: its logging setup would disable the app's loggers.
+    config = Config()
+    config.set_main_option("script_location", str(ALEMBIC_DIR))
+    config.cmd_opts = Namespace(x=[f"url=sqlite:///{db_path.as_posix()}"])
+    step(config, revision)
+
+
+def _add_revision(db, revision_id, form_id, event_type, at, changes) -> None:
+    db.execute(
+        "INSERT INTO audit_revision (id, created_at, entity_type, entity_id, "
+        "event_type) VALUES (?, ?, 'form_submission', ?, ?)",
+        (revision_id, at, form_id, event_type),
+    )
+    for field, old, new in changes:
+        db.execute(
+            "INSERT INTO audit_change (id, created_at, revision_id, field, "
+            "old_value, new_value) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                f"{revision_id}-{field}",
+                at,
+                revision_id,
+                field,
+                *map(json.dumps, (old, new)),
+            ),
+        )
+
+
+def test_snapshot_migration_finds_the_chat_of_deleted_forms(tmp_path):
+    db_path = tmp_path / "migrate.db"
+    _migrate(db_path, "d5e8f3a1b2c4")
+    with sqlite3.connect(db_path) as db:
+        db.execute(
+            "INSERT INTO form_submission (id, created_at, chat_id, name) "
+            "VALUES ('kept', '2026-01-01 00:00:00', 'chat-a', 'Ada')"
+        )
+        for revision in (
+            ("r1", "kept", "create", "2026-01-01", [("chat_id", None, "chat-a")]),
+            ("r2", "gone", "create", "2026-01-01", [("chat_id", None, "chat-b")]),
+            ("r3", "gone", "update", "2026-01-02", [("chat_id", "chat-b", "chat-c")]),
+            ("r4", "gone", "delete", "2026-01-03", [("chat_id", "chat-c", None)]),
+        ):
+            _add_revision(db, *revision)
+
+    _migrate(db_path, "e7a9c2d4f6b8")
+    with sqlite3.connect(db_path) as db:
+        rows = db.execute(
+            "SELECT id, version, parent_id FROM audit_revision ORDER BY id"
+        ).fetchall()
+    assert rows == [
+        ("r1", 1, "chat-a"),
+        ("r2", 1, "chat-b"),
+        ("r3", 2, "chat-c"),
+        ("r4", 3, "chat-c"),
+    ]
+
+
+def test_compression_migration_round_trips_messages(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHAT_MESSAGES_CODEC", "zlib")
+    db_path = tmp_path / "migrate.db"
+    messages = [{"role": "user", "content": "hello"}]
+    _migrate(db_path, "9b3f1c2d4e6a")
+    with sqlite3.connect(db_path) as db:
+        db.execute(
+            "INSERT INTO chat (id, created_at, messages) VALUES (?, ?, ?)",
+            ("c1", "2026-01-01 00:00:00", json.dumps(messages)),
+        )
+
+    _migrate(db_path, "c41a7e2b9d10")
+    with sqlite3.connect(db_path) as db:
+        [(stored,)] = db.execute("SELECT messages FROM chat").fetchall()
+    assert stored[:1] == b"z" and json.loads(zlib.decompress(stored[1:])) == messages
+
+    _migrate(db_path, "9b3f1c2d4e6a", command.downgrade)
+    with sqlite3.connect(db_path) as db:
+        [(stored,)] = db.execute("SELECT messages FROM chat").fetchall()
+    assert json.loads(stored) == messages
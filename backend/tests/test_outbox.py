@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+from sqlalchemy import select, update
+
+import crud
+import database
+import outbox
+import schemas
+from models import AuditRevision, OutboxEvent, utcnow
+
+
+@pytest.fixture
+def sink():
+    """Local HTTP sink that records batches and can be told to fail."""
+    received: list[list[dict]] = []
+    state = {"fail": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if state["fail"]:
+                state["fail"] -= 1
+                self.send_response(503)
+            else:
+                received.append(body["events"])
+                self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/events", received, state
+    server.shutdown()
+
+
+async def _form(client) -> str:
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        form = await crud.form.create(
+            db=db,
+            obj_in=schemas.FormSubmissionCreate(
+                name="Ada", email="ada@example.com", phone_number="1", chat_id=chat_id
+            ),
+        )
+    return form.id
+
+
+@pytest.mark.asyncio
+async def test_mutation_revision_and_event_commit_together(client):
+    form_id = await _form(client)
+    await client.put(f"/forms/{form_id}", json={"status": 2})
+    await client.delete(f"/forms/{form_id}")
+
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        events = (await db.scalars(select(OutboxEvent))).all()
+        revisions = (await db.scalars(select(AuditRevision))).all()
+    assert [(e.event_type, e.version) for e in events] == [("update", 1), ("delete", 2)]
+    assert {e.payload["revision_id"] for e in events} == {r.id for r in revisions}
+
+
+@pytest.mark.asyncio
+async def test_worker_retries_in_order_and_dead_letters(client, sink, monkeypatch):
+    url, received, state = sink
+    form_id = await _form(client)
+    for status in (1, 2, 3):
+        await client.put(f"/forms/{form_id}", json={"status": status})
+
+    async with httpx.AsyncClient() as http:
+        state["fail"] = 1
+        assert await outbox.deliver_batch(http, url) == 3
+        assert received == []
+        # Backed off: nothing is due yet.
+        assert await outbox.deliver_batch(http, url) == 0
+
+        async with database.SessionLocal() as db:  # type: ignore[misc]
+            await db.execute(update(OutboxEvent).values(next_attempt_at=utcnow()))
+            await db.commit()
+        assert await outbox.deliver_batch(http, url) == 3
+
+    assert len(received) == 1
+    assert [e["version"] for e in received[0]] == [1, 2, 3]
+    assert [e["data"]["changes"][0]["new_value"] for e in received[0]] == [1, 2, 3]
+
+    monkeypatch.setenv("OUTBOX_MAX_ATTEMPTS", "1")
+    await client.delete(f"/forms/{form_id}")
+    state["fail"] = 1
+    async with httpx.AsyncClient() as http:
+        await outbox.deliver_batch(http, url)
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        statuses = (
+            await db.scalars(select(OutboxEvent.status).order_by(OutboxEvent.version))
+        ).all()
+    assert statuses == ["delivered", "delivered", "delivered", "dead"]
+
+
+@pytest.mark.asyncio
+async def test_due_events_are_not_starved_and_leased_groups_are_skipped(client, sink):
+    url, received, state = sink
+    backing_off, due, leased = [await _form(client) for _ in range(3)]
+    for form_id in (backing_off, due, leased):
+        await client.put(f"/forms/{form_id}", json={"status": 1})
+
+    async with httpx.AsyncClient() as http:
+        state["fail"] = 1
+        assert await outbox.deliver_batch(http, url, batch_size=1) == 1
+        # Another relay is in the middle of delivering `leased`.
+        async with database.SessionLocal() as db:  # type: ignore[misc]
+            await db.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.aggregate_id == leased)
+                .values(
+                    lease_owner="other",
+                    lease_expires_at=utcnow() + timedelta(seconds=60),
+                )
+            )
+            await db.commit()
+        # The oldest event is backing off and `leased` is taken: `due` goes next.
+        assert await outbox.deliver_batch(http, url, batch_size=1) == 1
+        assert await outbox.deliver_batch(http, url, batch_size=1) == 0
+
+    assert [[e["aggregate_id"] for e in events] for events in received] == [[due]]
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        statement = select(OutboxEvent).where(OutboxEvent.aggregate_id == due)
+        event = await db.scalar(statement)
+    assert event.status == "delivered" and event.lease_owner is None
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+import main
+import profiling
+
+
+@pytest.fixture
+async def profiled_client(_test_db, tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILE_TOKEN", "secret")
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setenv("PROFILE_KEEP", "2")
+    app = FastAPI()
+    profiling.install(app)
+    app.router.routes.extend(main.app.router.routes)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://t") as ac:
+        yield ac
+
+
+def test_install_is_a_no_op_when_disabled(monkeypatch):
+    monkeypatch.delenv("PROFILE_TOKEN", raising=False)
+    monkeypatch.delenv("PROFILE_SAMPLE_RATE", raising=False)
+    app = FastAPI()
+    profiling.install(app)
+    assert app.user_middleware == []
+
+
+@pytest.mark.asyncio
+async def test_profiles_are_captured_listed_and_bounded(profiled_client):
+    headers = {"X-Profile-Token": "secret"}
+    resp = await profiled_client.get("/chat")
+    assert "X-Profile" not in resp.headers
+
+    names = []
+    for _ in range(3):
+        resp = await profiled_client.get("/chat", headers=headers)
+        assert resp.status_code == 200
+        names.append(resp.headers["X-Profile"])
+
+    resp = await profiled_client.get("/admin/profiles", headers=headers)
+    listed = [p["name"] for p in resp.json()]
+    assert listed == names[:0:-1]
+
+    resp = await profiled_client.get(f"/admin/profiles/{listed[0]}", headers=headers)
+    assert resp.status_code == 200
+
+    resp = await profiled_client.get("/admin/profiles")
+    assert resp.status_code == 403
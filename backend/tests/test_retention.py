@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+import pytest
+
+import crud
+import database
+import retention
+import schemas
+from models import utcnow
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    path = tmp_path / "archive"
+    monkeypatch.setenv("ARCHIVE_DIR", str(path))
+    return path
+
+
+@pytest.mark.asyncio
+async def test_archived_chat_and_history_are_hydrated(client, archive_dir):
+    messages = [{"role": "user", "content": "hello"}]
+    resp = await client.post("/chat", json={"messages": messages})
+    chat_id = resp.json()["id"]
+
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        form = await crud.form.create(
+            db=db,
+            obj_in=schemas.FormSubmissionCreate(
+                name="Ada", email="ada@example.com", phone_number="1", chat_id=chat_id
+            ),
+        )
+    for status in (3, 2):
+        resp = await client.put(f"/forms/{form.id}", json={"status": status})
+        assert resp.status_code == 200
+
+    future = utcnow() + timedelta(days=1)
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        assert await retention.archive_chats(db, inactive_before=future, chunk_size=1)
+        assert await retention.archive_audit(db, older_than=future) == 1
+        assert await crud.chat.get(db, id=chat_id) is None
+
+    assert len(list(archive_dir.iterdir())) == 2
+
+    resp = await client.get(f"/chat/{chat_id}")
+    assert resp.status_code == 200
+    assert resp.json()["messages"] == messages
+
+    resp = await client.get(f"/forms/{form.id}/history")
+    assert resp.status_code == 200
+    history = resp.json()
+    assert [rev["changes"][0]["new_value"] for rev in history] == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_restore_chat_moves_it_back_to_hot_tables(client, archive_dir):
+    resp = await client.post("/chat", json={"messages": []})
+    chat_id = resp.json()["id"]
+
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        await retention.archive_chats(db, inactive_before=utcnow() + timedelta(days=1))
+        chat = await retention.restore_chat(db, chat_id)
+        assert chat is not None
+        assert await retention.load_archived_chat(db, chat_id) is None
+        assert (await crud.chat.get(db, id=chat_id)).messages == []
+
+
+@pytest.mark.asyncio
+async def test_forms_of_archived_chats_are_read_and_restored(client, archive_dir):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        form = await crud.form.create(
+            db=db,
+            obj_in=schemas.FormSubmissionCreate(
+                name="Ada", email="ada@example.com", phone_number="1", chat_id=chat_id
+            ),
+        )
+    await client.put(f"/forms/{form.id}", json={"status": 2})
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        await retention.archive_chats(db, inactive_before=utcnow() + timedelta(days=1))
+
+    forms = (await client.get(f"/chat/{chat_id}/forms")).json()
+    assert [(f["id"], f["status"]) for f in forms] == [(form.id, 2)]
+    resp = await client.get(f"/chat/{chat_id}/forms", params={"status": 3})
+    assert resp.json() == []
+    assert (await client.get(f"/forms/{form.id}")).json()["name"] == "Ada"
+
+    # Changing the form brings its chat back into the hot tables first.
+    resp = await client.put(f"/forms/{form.id}", json={"status": 3})
+    assert resp.status_code == 200 and resp.json()["status"] == 3
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        assert await retention.load_archived_chat(db, chat_id) is None
+        assert await crud.chat.get(db, id=chat_id) is not None
+    assert (await client.get("/forms/missing")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_missing_chat_is_404(client, archive_dir):
+    resp = await client.get("/chat/does-not-exist")
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_concurrent_restores_return_the_restored_chat(
+    client, archive_dir, monkeypatch
+):
+    messages = [{"role": "user", "content": "hello"}]
+    chat_id = (await client.post("/chat", json={"messages": messages})).json()["id"]
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        await retention.archive_chats(db, inactive_before=utcnow() + timedelta(days=1))
+        record = await retention.load_archived_chat(db, chat_id)
+        assert await retention.restore_chat(db, chat_id) is not None
+
+    # The loser read the archive before the winner committed.
+    async def stale(db, key):
+        return record
+
+    monkeypatch.setattr(retention, "load_archived_chat", stale)
+    async with database.SessionLocal() as db:  # type: ignore[misc]
+        chat = await retention.restore_chat(db, chat_id)
+    assert chat.id == chat_id and chat.messages == messages
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from contextlib import ExitStack
+from time import perf_counter
+
+import pytest
+from openai import AsyncOpenAI
+
+import router
+from benchmarks import fake_llm
+from router import Endpoint, Route, Router
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture
+def endpoints():
+    """Three fake completion servers: fast, slow and backup."""
+    apps = {
+        "fast": fake_llm.create_app(),
+        "slow": fake_llm.create_app(latency=0.6),
+        "backup": fake_llm.create_app(),
+    }
+    with ExitStack() as stack:
+        yield {
+            name: (
+                app,
+                Endpoint(
+                    name,
+                    AsyncOpenAI(
+                        base_url=stack.enter_context(fake_llm.serve(app)),
+                        api_key="x",
+                        max_retries=0,
+                    ),
+                    "gpt-4o-mini",
+                ),
+            )
+            for name, app in apps.items()
+        }
+
+
+def _router(endpoints, names, **kwargs) -> Router:
+    route = Route([endpoints[n][1] for n in names], kwargs.pop("policy", "priority"))
+    return Router({"tools": route, "reply": route}, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_after_its_p95(endpoints):
+    llm = _router(endpoints, ["slow", "fast"], hedge=True, min_samples=5)
+    slow = endpoints["slow"][1]
+    slow.latencies.extend([0.05] * 10)  # usually fast, slow right now
+
+    start = perf_counter()
+    resp = await llm.complete("tools", messages=MESSAGES)
+    elapsed = perf_counter() - start
+
+    assert resp.choices[0].message.content == "Done! Anything else?"
+    assert elapsed < 0.4
+    assert endpoints["fast"][0].state.calls == 1
+    assert router.hedges.values[(("role", "tools"),)] >= 1
+
+
+@pytest.mark.asyncio
+async def test_hedge_uses_after_ms_until_enough_samples(endpoints):
+    llm = _router(endpoints, ["slow", "fast"], hedge=True, hedge_after=0.05)
+    start = perf_counter()
+    await llm.complete("reply", messages=MESSAGES)
+    assert perf_counter() - start < 0.4
+
+    # Without hedging the caller waits for the slow endpoint.
+    llm = _router(endpoints, ["slow", "fast"])
+    start = perf_counter()
+    await llm.complete("reply", messages=MESSAGES)
+    assert perf_counter() - start >= 0.6
+
+
+@pytest.mark.asyncio
+async def test_errors_fail_over_and_repeat_offenders_go_last(endpoints):
+    app, broken = endpoints["fast"]
+    app.state.fail_status = 500
+    llm = _router(endpoints, ["fast", "backup"])
+
+    for _ in range(router.FAILURES_BEFORE_COOLDOWN):
+        resp = await llm.complete("tools", messages=MESSAGES)
+        assert resp.choices[0].message.content
+    assert endpoints["backup"][0].state.calls == router.FAILURES_BEFORE_COOLDOWN
+
+    # In cooldown now: the backup is tried first, the broken one is not called.
+    assert llm.candidates("tools")[0].name == "backup"
+    await llm.complete("tools", messages=MESSAGES)
+    assert app.state.calls == router.FAILURES_BEFORE_COOLDOWN
+
+    endpoints["backup"][0].state.fail_status = 503
+    with pytest.raises(Exception, match="injected failure"):
+        await llm.complete("tools", messages=MESSAGES)
+
+
+@pytest.mark.asyncio
+async def test_fastest_policy_follows_live_latency(endpoints):
+    llm = _router(endpoints, ["slow", "fast"], policy="fastest")
+    endpoints["slow"][1].latencies.extend([0.9] * 5)
+    endpoints["fast"][1].latencies.extend([0.1] * 5)
+    assert [ep.name for ep in llm.candidates("tools")] == ["fast", "slow"]
+
+    endpoints["fast"][1].latencies.extend([2.0] * 10)
+    assert [ep.name for ep in llm.candidates("tools")] == ["slow", "fast"]
+
+
+def test_build_reads_roles_and_hedging_from_config(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "a")
+    monkeypatch.setenv("BACKUP_KEY", "b")
+    llm = router.build(
+        {
+            "endpoints": {
+                "mini": {"model": "gpt-4o-mini"},
+                "big": {
+                    "model": "gpt-4o",
+                    "base_url": "http://backup.invalid/v1",
+                    "api_key_env": "BACKUP_KEY",
+                },
+            },
+            "roles": {
+                "tools": {"endpoints": ["mini", "big"]},
+                "reply": {"endpoints": ["big"], "policy": "fastest"},
+            },
+            "hedge": {"enabled": True, "after_ms": 1500},
+        },
+        "gpt-4o-mini",
+    )
+    assert [ep.model for ep in llm.routes["tools"].endpoints] == [
+        "gpt-4o-mini",
+        "gpt-4o",
+    ]
+    assert llm.routes["reply"].policy == "fastest"
+    assert llm.routes["reply"].endpoints[0] is llm.routes["tools"].endpoints[1]
+    assert llm.hedge and llm.hedge_after == 1.5
+    assert len(llm.endpoints) == 2
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import csv
+import io
+from pathlib import Path
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import func, select
+
+import crud
+import database
+import main
+import rebalance
+import schemas
+from models import AuditRevision, Base, Chat, FormSubmission, OutboxEvent
+
+
+def _urls(tmp_path: Path, count: int) -> list[str]:
+    return [
+        f"sqlite+aiosqlite:///{(tmp_path / f'shard{i}.db').as_posix()}"
+        for i in range(count)
+    ]
+
+
+async def _create_all() -> None:
+    for engine in database.engines.values():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+
+@pytest.fixture
+async def shards(tmp_path: Path):
+    database.init_engine(shard_urls=_urls(tmp_path, 3))
+    await _create_all()
+    yield tmp_path
+    await database.dispose()
+
+
+@pytest.fixture
+async def client(shards) -> AsyncClient:
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        yield ac
+
+
+async def _count(shard_id: str, model) -> int:
+    async with database.engines[shard_id].connect() as conn:
+        return await conn.scalar(select(func.count()).select_from(model))
+
+
+async def _create_chats(client, count: int) -> list[str]:
+    return [
+        (await client.post("/chat", json={"messages": []})).json()["id"]
+        for _ in range(count)
+    ]
+
+
+async def _add_form(chat_id: str, name: str) -> str:
+    async with database.SessionLocal() as db:
+        form = await crud.form.create(
+            db=db,
+            obj_in=schemas.FormSubmissionCreate(
+                name=name, email="e", phone_number="p", chat_id=chat_id
+            ),
+        )
+    return form.id
+
+
+def test_placement_is_stable_and_spreads_chats():
+    shard_ids = ["0", "1", "2"]
+    placed = [database.shard_for(f"chat-{i}", shard_ids) for i in range(3000)]
+    assert all(800 < placed.count(s) < 1200 for s in shard_ids)
+    assert placed == [database.shard_for(f"chat-{i}", shard_ids) for i in range(3000)]
+
+    # A fourth shard takes about a quarter of the chats and moves no others.
+    grown = [database.shard_for(f"chat-{i}", [*shard_ids, "3"]) for i in range(3000)]
+    moved = [(a, b) for a, b in zip(placed, grown, strict=True) if a != b]
+    assert all(b == "3" for _, b in moved)
+    assert 600 < len(moved) < 900
+
+
+@pytest.mark.asyncio
+async def test_chat_rows_live_on_the_chats_shard(client):
+    chat_ids = await _create_chats(client, 12)
+    for chat_id in chat_ids:
+        form_id = await _add_form(chat_id, "Ada")
+        resp = await client.put(f"/forms/{form_id}", json={"status": 2})
+        assert resp.status_code == 200
+
+    for shard_id in database.engines:
+        mine = [c for c in chat_ids if database.shard_for(c) == shard_id]
+        assert await _count(shard_id, Chat) == len(mine)
+        assert await _count(shard_id, FormSubmission) == len(mine)
+        assert await _count(shard_id, AuditRevision) == len(mine)
+    assert len({database.shard_for(c) for c in chat_ids}) > 1
+
+    # Reads routed by chat id and by form id (fanned out) both find them.
+    forms = (await client.get(f"/chat/{chat_ids[5]}/forms")).json()
+    assert [f["status"] for f in forms] == [2]
+    history = (await client.get(f"/forms/{forms[0]['id']}/history")).json()
+    assert [rev["event_type"] for rev in history] == ["update"]
+
+
+@pytest.mark.asyncio
+async def test_list_endpoints_fan_out_and_merge(client):
+    chat_ids = await _create_chats(client, 15)
+    resp = await client.get("/chat")
+    assert [c["id"] for c in resp.json()] == chat_ids[:10]
+
+    body = "name,email,phone_number,chat_id\n" + "".join(
+        f"n{i},e,p,{chat_id}\n" for i, chat_id in enumerate(chat_ids)
+    )
+    resp = await client.post(
+        "/forms/import", content=body, headers={"Content-Type": "text/csv"}
+    )
+    assert resp.json()["imported"] == 15
+
+    resp = await client.get("/forms/export", params={"format": "csv"})
+    rows = list(csv.DictReader(io.StringIO(resp.text)))
+    assert len(rows) == 15
+    keys = [(r["created_at"], r["id"]) for r in rows]
+    assert keys == sorted(keys)
+
+
+@pytest.mark.asyncio
+async def test_rebalance_moves_chats_to_an_added_shard(client, shards):
+    chat_ids = await _create_chats(client, 20)
+    for chat_id in chat_ids:
+        form_id = await _add_form(chat_id, "Ada")
+        await client.put(f"/forms/{form_id}", json={"status": 1})
+    await database.dispose()
+
+    database.init_engine(shard_urls=_urls(shards, 4))
+    await _create_all()
+    expected = {c: database.shard_for(c) for c in chat_ids}
+    assert "3" in expected.values()
+
+    plan = await rebalance.rebalance(dry_run=True)
+    assert plan["chats"] == list(expected.values()).count("3") and plan["rows"] == 0
+
+    report = await rebalance.rebalance()
+    assert report["chats"] == plan["chats"]
+    assert (await rebalance.rebalance())["chats"] == 0
+    for shard_id in database.engines:
+        mine = [c for c, s in expected.items() if s == shard_id]
+        assert await _count(shard_id, Chat) == len(mine)
+        assert await _count(shard_id, FormSubmission) == len(mine)
+        assert await _count(shard_id, OutboxEvent) == len(mine)
+
+    moved = next(c for c, s in expected.items() if s == "3")
+    forms = (await client.get(f"/chat/{moved}/forms")).json()
+    assert len(forms) == 1
+    history = (await client.get(f"/forms/{forms[0]['id']}/history")).json()
+    assert len(history) == 1
+
+
+@pytest.mark.asyncio
+async def test_fork_chains_are_read_across_shards(client, shards):
+    messages = [{"role": "user", "content": "0"}]
+    chat_id = (await client.post("/chat", json={"messages": messages})).json()["id"]
+    chain = [chat_id]
+    for i in range(1, 20):
+        fork = (await client.post(f"/chat/{chain[-1]}/fork")).json()
+        assert database.shard_for(fork["id"]) == database.shard_for(chat_id)
+        messages = [*messages, {"role": "user", "content": str(i)}]
+        async with database.SessionLocal() as db:
+            chat = await crud.chat.get(db, id=fork["id"])
+            update = schemas.ChatUpdate(messages=messages)
+            await crud.chat.update(db, db_obj=chat, obj_in=update)
+        chain.append(fork["id"])
+    await database.dispose()
+
+    database.init_engine(shard_urls=_urls(shards, 4))
+    await _create_all()
+    assert "3" in {database.shard_for(c) for c in chain}
+    await rebalance.rebalance()
+
+    assert (await client.get(f"/chat/{chain[-1]}")).json()["messages"] == messages
+    middle = (await client.get(f"/chat/{chain[10]}")).json()
+    assert middle["parent_id"] == chain[9] and middle["messages"] == messages[:11]
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+import crud
+import database
+import schemas
+import similarity
+
+
+def _transcript(*texts: str) -> list[dict]:
+    return [{"role": "user", "content": text} for text in texts]
+
+
+@pytest.fixture
+def index_path(tmp_path, monkeypatch):
+    path = tmp_path / "index"
+    monkeypatch.setenv("SIMILARITY_INDEX_PATH", str(path))
+    return path
+
+
+async def _create(client, *texts: str) -> str:
+    resp = await client.post("/chat", json={"messages": _transcript(*texts)})
+    return resp.json()["id"]
+
+
+@pytest.mark.asyncio
+async def test_similar_chats_are_ranked_by_transcript(client, index_path):
+    chat_id = await _create(client, "how much does the team plan cost per seat")
+    assert (await client.get(f"/chat/{chat_id}/similar")).status_code == 503
+
+    pricing = await _create(client, "what does the team plan cost per seat monthly")
+    email = await _create(client, "please change my email address, I mistyped it")
+    await _create(client, "delete my form, I no longer need it")
+    index = similarity.Index.create()
+    assert await similarity.sync(index) == 4
+
+    resp = await client.get(f"/chat/{chat_id}/similar", params={"k": 2})
+    assert resp.status_code == 200
+    results = resp.json()
+    assert results[0]["chat_id"] == pricing
+    assert all(r["chat_id"] != chat_id for r in results)
+    assert (await client.get("/chat/nope/similar")).status_code == 404
+
+    # Only changed chats are re-indexed, and readers see the new version.
+    async with database.SessionLocal() as db:
+        chat = await crud.chat.get(db, id=email)
+        await crud.chat.update(
+            db,
+            db_obj=chat,
+            obj_in=schemas.ChatUpdate(
+                messages=_transcript("how much is the team plan per seat")
+            ),
+        )
+    assert await similarity.sync(index) == 1
+    assert await similarity.sync(index) == 0
+    results = (await client.get(f"/chat/{chat_id}/similar")).json()
+    assert {r["chat_id"] for r in results[:2]} == {pricing, email}
+
+
+def test_index_grows_and_is_replaced_on_rebuild(index_path):
+    index = similarity.Index.create(dim=64)
+    for i in range(similarity.MIN_CAPACITY + 10):
+        index.upsert(f"chat-{i}", _transcript(f"topic{i % 7} question"))
+    index.publish()
+    assert len(list(index_path.glob("vectors-*.npy"))) == 1
+
+    reader = similarity.get_index()
+    assert reader.count == similarity.MIN_CAPACITY + 10
+    query = reader.weigh(similarity.term_vector(_transcript("topic3 question"), 64))
+    found = reader.search(query, 5)
+    assert all(int(chat_id.split("-")[1]) % 7 == 3 for chat_id, _ in found)
+    assert np.isclose(found[0][1], 1.0, atol=1e-5)
+
+    similarity.Index.create(dim=64)
+    assert similarity.get_index().count == 0
+    assert len(list(index_path.glob("*.npy"))) == 4
+
+
+def test_updates_never_touch_published_rows(index_path):
+    index = similarity.Index.create(dim=64)
+    for i in range(similarity.MIN_CAPACITY):
+        index.upsert(f"chat-{i}", _transcript(f"topic{i % 7} question"))
+    index.publish()
+    reader = similarity.get_index()
+    published = np.array(reader.vectors[: reader.count])
+
+    # The update lands past the published rows, and forces a grow that drops
+    # the superseded row.
+    index.upsert("chat-0", _transcript("billing address change"))
+    assert np.array_equal(reader.vectors[: reader.count], published)
+    query = reader.weigh(similarity.term_vector(_transcript("billing address"), 64))
+    assert reader.search(query, 5) == []
+
+    index.upsert("chat-1", _transcript("billing address change"))
+    index.publish()
+    reader = similarity.get_index()
+    assert reader.count == similarity.MIN_CAPACITY + 1
+    assert {chat_id for chat_id, _ in reader.search(query, 5)} == {"chat-0", "chat-1"}
+    query = reader.weigh(similarity.term_vector(_transcript("topic1 question"), 64))
+    found = [chat_id for chat_id, _ in reader.search(query, 200)]
+    assert "chat-1" not in found and len(found) == len(set(found))
+
+
+@pytest.mark.asyncio
+async def test_forks_are_indexed_by_their_whole_history(client, index_path):
+    root = await _create(client, "how much does the team plan cost", "per seat?")
+    await _create(client, "please change my email address, I mistyped it")
+    fork = (await client.post(f"/chat/{root}/fork")).json()["id"]
+    index = similarity.Index.create()
+    assert await similarity.sync(index) == 3
+
+    results = (await client.get(f"/chat/{root}/similar")).json()
+    assert results[0]["chat_id"] == fork and results[0]["score"] > 0.99
+
+    # Saving the parent re-indexes its forks too.
+    async with database.SessionLocal() as db:
+        chat = await crud.chat.get(db, id=root)
+        update = schemas.ChatUpdate(messages=_transcript("annual billing instead"))
+        await crud.chat.update(db, db_obj=chat, obj_in=update)
+    assert await similarity.sync(index) == 2
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+import crud
+import database
+import schemas
+import singleflight
+
+
+def _count(group: str, result: str) -> float:
+    key = (("group", group), ("result", result))
+    return singleflight.calls.values.get(key, 0)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    group: singleflight.Group[int] = singleflight.Group("test")
+    runs = 0
+    release = asyncio.Event()
+
+    async def load() -> int:
+        nonlocal runs
+        runs += 1
+        await release.wait()
+        return runs
+
+    waiters = [asyncio.create_task(group.do("k", load)) for _ in range(5)]
+    other = asyncio.create_task(group.do("other", load))
+    await asyncio.sleep(0)
+    # A caller going away does not cancel the shared call for the rest.
+    waiters[0].cancel()
+    release.set()
+
+    assert await asyncio.gather(*waiters[1:]) == [1, 1, 1, 1]
+    await other
+    assert runs == 2
+
+    # Nothing is cached once the call has finished.
+    assert await group.do("k", load) == 3
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_not_remembered():
+    group: singleflight.Group[int] = singleflight.Group("test")
+
+    async def fail() -> int:
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        group.do("k", fail), group.do("k", fail), return_exceptions=True
+    )
+    assert all(isinstance(r, ValueError) for r in results)
+    assert not group._calls
+
+
+@pytest.mark.asyncio
+async def test_identical_chat_reads_are_coalesced(client):
+    chat = (
+        await client.post(
+            "/chat", json={"messages": [{"role": "user", "content": "hi"}]}
+        )
+    ).json()
+    async with database.SessionLocal() as db:
+        await crud.form.create(
+            db,
+            obj_in=schemas.FormSubmissionCreate(
+                name="Ada",
+                email="ada@example.com",
+                phone_number="1",
+                chat_id=chat["id"],
+            ),
+        )
+    leaders = _count("chat", "leader")
+    coalesced = _count("chat", "coalesced")
+
+    responses = await asyncio.gather(
+        *(client.get(f"/chat/{chat['id']}") for _ in range(5))
+    )
+    assert all(r.json() == chat for r in responses)
+    assert _count("chat", "leader") - leaders < 5
+    assert _count("chat", "coalesced") > coalesced
+
+    forms = await asyncio.gather(
+        client.get(f"/chat/{chat['id']}/forms"),
+        client.get(f"/chat/{chat['id']}/forms?status=3"),
+    )
+    assert [len(r.json()) for r in forms] == [1, 0]
+
+    missing = await asyncio.gather(client.get("/chat/nope"), client.get("/chat/nope"))
+    assert [r.status_code for r in missing] == [404, 404]
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import select
+
+import database
+import usage
+from models import UsageTurn, utcnow
+
+
+@pytest.fixture(autouse=True)
+def _empty_buffer():
+    usage._buffer.clear()
+    yield
+    usage._buffer.clear()
+
+
+async def _turn(client, chat_id: str, content: str) -> None:
+    messages = [{"role": "user", "content": content}]
+    resp = await client.put(f"/chat/{chat_id}", json={"messages": messages})
+    assert resp.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_turns_are_written_in_batches_and_rolled_up(
+    client, fake_llm_url, monkeypatch
+):
+    chat_id = (await client.post("/chat", json={"messages": []})).json()["id"]
+    await _turn(client, chat_id, "please create my form")
+    monkeypatch.setenv("CHAT_FAST_PATH", "1")
+    await _turn(client, chat_id, "please create my form")
+
+    async with database.SessionLocal() as db:
+        assert (await db.scalars(select(UsageTurn))).all() == []
+    assert await usage.flush() == 2
+    assert await usage.flush() == 0
+
+    async with database.SessionLocal() as db:
+        turns = (await db.scalars(select(UsageTurn))).all()
+    by_reply = {turn.reply: turn for turn in turns}
+    full = by_reply["llm"]
+    assert full.chat_id == chat_id
+    assert [call["role"] for call in full.calls] == ["tools", "reply"]
+    assert (full.prompt_tokens, full.completion_tokens, full.cached_tokens) == (
+        200,
+        40,
+        128,
+    )
+    assert full.tools == ["submit_interest_form"]
+    assert len(by_reply["template"].calls) == 1
+
+    monkeypatch.setenv("CHAT_FAST_PATH", "0")
+    other = (await client.post("/chat", json={"messages": []})).json()["id"]
+    await _turn(client, other, "please create my form")
+    await usage.flush()
+
+    today = utcnow().date().isoformat()
+    days = (await client.get("/usage")).json()
+    assert days == [
+        {
+            "day": today,
+            "turns": 3,
+            "calls": 5,
+            "prompt_tokens": 500,
+            "completion_tokens": 100,
+            "cached_tokens": 320,
+            "llm_ms": days[0]["llm_ms"],
+            "tool_calls": 3,
+            "template_replies": 1,
+        }
+    ]
+    models = (await client.get("/usage", params={"by": "model"})).json()
+    assert [(m["model"], m["calls"], m["turns"]) for m in models] == [
+        ("gpt-4o-mini", 5, 3)
+    ]
+    chats = (await client.get("/usage", params={"by": "chat", "limit": 1})).json()
+    assert [(c["chat"], c["turns"]) for c in chats] == [(chat_id, 2)]
+
+    resp = await client.get(
+        "/usage", params={"start": "2000-01-01", "end": "2000-01-02"}
+    )
+    assert resp.json() == []
+    assert (await client.get("/usage", params={"by": "week"})).status_code == 422
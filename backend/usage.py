@@ -0,0 +1,311 @@
+"""
+Per-turn LLM usage and latency ledger.
+
+Every chat turn leaves one ``usage_turn`` row: each LLM call it made (role, model,
+prompt, completion and cached prompt tokens, latency), the tools it ran and
+whether the reply came from a template. `router` reports calls to the turn held
+in a context variable by `track_turn`; finished turns wait in an in-process
+buffer that a background task writes every USAGE_FLUSH_SECONDS, or as soon as
+USAGE_BATCH_SIZE turns are waiting. Each flush is one INSERT of the turns and one
+upsert adding them to the ``usage_rollup`` counters per UTC day for the total,
+each model and each chat, which is all `GET /usage` reads.
+
+A crash loses at most one flush interval of records; shutdown flushes the rest.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from time import perf_counter
+from typing import Any
+
+from sqlalchemy import func, insert, select
+
+import database
+import metrics
+from models import UsageRollup, UsageTurn, utcnow
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = (
+    "turns",
+    "calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+    "llm_ms",
+    "tool_calls",
+    "template_replies",
+)
+
+written = metrics.REGISTRY.counter("usage_turns_written_total", "Usage rows written")
+dropped = metrics.REGISTRY.counter(
+    "usage_turns_dropped_total", "Usage rows dropped because the buffer was full"
+)
+
+
+def get_flush_seconds() -> float:
+    return float(os.getenv("USAGE_FLUSH_SECONDS", "5"))
+
+
+def get_batch_size() -> int:
+    return int(os.getenv("USAGE_BATCH_SIZE", "500"))
+
+
+def get_max_buffer() -> int:
+    return int(os.getenv("USAGE_MAX_BUFFER", "50000"))
+
+
+@dataclass
+class Turn:
+    chat_id: str
+    created_at: datetime = field(default_factory=utcnow)
+    started: float = field(default_factory=perf_counter)
+    calls: list[dict[str, Any]] = field(default_factory=list)
+    tools: list[str] = field(default_factory=list)
+    reply: str | None = None
+
+    def row(self) -> dict[str, Any]:
+        return {
+            "created_at": self.created_at,
+            "chat_id": self.chat_id,
+            "calls": self.calls,
+            "tools": self.tools,
+            "reply": self.reply,
+            "prompt_tokens": sum(c["prompt_tokens"] for c in self.calls),
+            "completion_tokens": sum(c["completion_tokens"] for c in self.calls),
+            "cached_tokens": sum(c["cached_tokens"] for c in self.calls),
+            "llm_ms": sum(c["ms"] for c in self.calls),
+            "total_ms": round((perf_counter() - self.started) * 1000),
+        }
+
+
+_turn: ContextVar[Turn | None] = ContextVar("usage_turn", default=None)
+_buffer: list[dict[str, Any]] = []
+_wake: asyncio.Event | None = None  # set when a batch is ready
+_task: asyncio.Task | None = None
+
+
+@contextmanager
+def track_turn(chat_id: str) -> Iterator[Turn]:
+    """Collect the usage of the turn run inside the block and buffer it on exit."""
+    turn = Turn(chat_id)
+    token = _turn.set(turn)
+    try:
+        yield turn
+    finally:
+        _turn.reset(token)
+        _enqueue(turn.row())
+
+
+def _cached_tokens(usage: Any) -> int:
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", None) or 0
+
+
+def record_call(role: str, model: str, seconds: float, usage: Any = None) -> None:
+    """Add a finished LLM call to the current turn, if one is being tracked."""
+    turn = _turn.get()
+    if turn is None:
+        return
+    turn.calls.append(
+        {
+            "role": role,
+            "model": model,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+            "cached_tokens": _cached_tokens(usage),
+            "ms": round(seconds * 1000),
+        }
+    )
+
+
+def record_tool(name: str) -> None:
+    turn = _turn.get()
+    if turn is not None:
+        turn.tools.append(name)
+
+
+def record_reply(path: str) -> None:
+    turn = _turn.get()
+    if turn is not None:
+        turn.reply = path
+
+
+def _enqueue(row: dict[str, Any]) -> None:
+    if len(_buffer) >= get_max_buffer():
+        dropped.inc()
+        return
+    _buffer.append(row)
+    if _wake is not None and len(_buffer) >= get_batch_size():
+        _wake.set()
+
+
+def _increments(row: dict[str, Any]) -> Iterator[tuple[tuple[str, str, str], dict]]:
+    day = row["created_at"].date().isoformat()
+    turn = {
+        "turns": 1,
+        "calls": len(row["calls"]),
+        "prompt_tokens": row["prompt_tokens"],
+        "completion_tokens": row["completion_tokens"],
+        "cached_tokens": row["cached_tokens"],
+        "llm_ms": row["llm_ms"],
+        "tool_calls": len(row["tools"]),
+        "template_replies": int(row["reply"] == "template"),
+    }
+    yield (day, "total", ""), turn
+    yield (day, "chat", row["chat_id"]), turn
+    by_model: dict[str, dict[str, int]] = {}
+    for call in row["calls"]:
+        counts = by_model.setdefault(call["model"], dict.fromkeys(COUNTERS, 0))
+        counts["turns"] = 1
+        counts["calls"] += 1
+        for name in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            counts[name] += call[name]
+        counts["llm_ms"] += call["ms"]
+    for model, counts in by_model.items():
+        yield (day, "model", model), counts
+
+
+def _upsert():
+    if database.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    table = UsageRollup.__table__
+    statement = dialect_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=["day", "dimension", "key"],
+        set_={name: table.c[name] + statement.excluded[name] for name in COUNTERS},
+    )
+
+
+async def flush() -> int:
+    """Write the buffered turns and their rollups; returns how many turns."""
+    global _buffer
+    rows, _buffer = _buffer, []
+    if _wake is not None:
+        _wake.clear()
+    if not rows:
+        return 0
+
+    # Turns and chat rollups live on the chat's shard; each shard keeps its own
+    # total and model rollups, summed by `aggregate`.
+    by_shard: dict[str, tuple[list, dict]] = {}
+    for row in rows:
+        turns, rollups = by_shard.setdefault(
+            database.shard_for(row["chat_id"]), ([], {})
+        )
+        turns.append(row)
+        for key, counts in _increments(row):
+            total = rollups.setdefault(key, dict.fromkeys(COUNTERS, 0))
+            for name, value in counts.items():
+                total[name] += value
+    try:
+        async with database.SessionLocal() as db:  # type: ignore[misc]
+            for shard_id, (turns, rollups) in by_shard.items():
+                bind = {"shard_id": shard_id}
+                await db.execute(
+                    insert(UsageTurn.__table__), turns, bind_arguments=bind
+                )
+                await db.execute(
+                    _upsert(),
+                    [
+                        {"day": day, "dimension": dim, "key": key, **counts}
+                        for (day, dim, key), counts in rollups.items()
+                    ],
+                    bind_arguments=bind,
+                )
+            await db.commit()
+    except Exception:
+        _buffer[:0] = rows  # keep them for the next attempt
+        raise
+    written.inc(len(rows))
+    return len(rows)
+
+
+async def _flush_forever(wake: asyncio.Event) -> None:
+    while True:
+        try:
+            await asyncio.wait_for(wake.wait(), get_flush_seconds())
+        except TimeoutError:
+            pass
+        try:
+            await flush()
+        except Exception:
+            logger.exception("usage flush failed")
+            await asyncio.sleep(get_flush_seconds())
+
+
+def start() -> None:
+    global _task, _wake
+    if _task is None:
+        _wake = asyncio.Event()
+        _task = asyncio.create_task(_flush_forever(_wake))
+
+
+async def stop() -> None:
+    """Stop the background writer and flush what is still buffered."""
+    global _task, _wake
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = _wake = None
+    try:
+        await flush()
+    except Exception:
+        logger.exception("final usage flush failed")
+
+
+async def aggregate(
+    db,
+    *,
+    by: str,
+    start: date | None = None,
+    end: date | None = None,
+    limit: int = 100,
+) -> list[dict[str, Any]]:
+    """
+    Usage summed per day (``by="day"``), per model or per chat (the `limit` chats
+    with the most tokens), from the rollups between `start` and `end` inclusive.
+    """
+    dimension = "total" if by == "day" else by
+    group = UsageRollup.day if by == "day" else UsageRollup.key
+    filters = [UsageRollup.dimension == dimension]
+    if start is not None:
+        filters.append(UsageRollup.day >= start.isoformat())
+    if end is not None:
+        filters.append(UsageRollup.day <= end.isoformat())
+    statement = (
+        select(
+            group.label("key"),
+            *(func.sum(UsageRollup.__table__.c[n]).label(n) for n in COUNTERS),
+        )
+        .where(*filters)
+        .group_by(group)
+    )
+    if by == "chat":
+        # A chat's rollups all live on its shard, so each shard's top chats
+        # contain the overall top chats.
+        tokens = func.sum(UsageRollup.prompt_tokens + UsageRollup.completion_tokens)
+        statement = statement.order_by(tokens.desc()).limit(limit)
+
+    merged: dict[str, dict[str, Any]] = {}
+    for row in (await db.execute(statement)).mappings():
+        total = merged.setdefault(row["key"], dict.fromkeys(COUNTERS, 0))
+        for name in COUNTERS:
+            total[name] += row[name] or 0
+    results = [{by: key, **counts} for key, counts in merged.items()]
+    if by == "chat":
+        results.sort(key=lambda r: -(r["prompt_tokens"] + r["completion_tokens"]))
+        return results[:limit]
+    return sorted(results, key=lambda r: r[by])
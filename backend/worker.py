@@ -0,0 +1,137 @@
+"""
+Worker pool for queued chat turns (see `jobs`).
+
+Usage: python worker.py [--processes 2] [--concurrency 8]
+
+Each process runs `--concurrency` job loops on one event loop; scale out by
+running more processes, on this host or others, against the same database.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+from contextlib import suppress
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import crud
+import database
+import forks
+import jobs
+import retention
+import schemas
+import turns
+import usage
+from models import Job
+
+logger = logging.getLogger("worker")
+
+
+async def _keep_lease(
+    job_id: str, owner: str, session_factory: async_sessionmaker
+) -> None:
+    while True:
+        await asyncio.sleep(jobs.get_lease_seconds() / 3)
+        async with session_factory() as db:
+            if not await jobs.renew(db, job_id, owner):
+                logger.warning("lost the lease on job %s", job_id)
+                return
+
+
+async def run_job(
+    job: Job, owner: str, session_factory: async_sessionmaker | None = None
+) -> None:
+    """Run a claimed turn and record its outcome with the chat update."""
+    session_factory = session_factory or database.SessionLocal
+    heartbeat = asyncio.create_task(_keep_lease(job.id, owner, session_factory))
+    try:
+        async with session_factory() as db:
+            try:
+                chat = await crud.chat.get(db, id=job.chat_id)
+                if chat is None:
+                    chat = await retention.restore_chat(db, job.chat_id)
+                if chat is None:
+                    raise LookupError(f"Chat {job.chat_id} not found")
+                messages = job.payload["messages"]
+                chat = await turns.run_turn(db, chat, messages, commit=False)
+                view = forks.view(chat, messages)  # the turn appended to messages
+                result = schemas.Chat.model_validate(view).model_dump(mode="json")
+                # The transcript is only saved if we still hold the lease.
+                if await jobs.finish(db, job, owner, result=result):
+                    await db.commit()
+                else:
+                    await db.rollback()
+            except Exception as exc:
+                logger.exception("job %s failed", job.id)
+                await db.rollback()
+                await jobs.finish(db, job, owner, error=f"{type(exc).__name__}: {exc}")
+                await db.commit()
+    finally:
+        heartbeat.cancel()
+        with suppress(asyncio.CancelledError):
+            await heartbeat
+
+
+async def work(
+    owner: str,
+    *,
+    session_factory: async_sessionmaker | None = None,
+    poll_seconds: float = 0.5,
+    stop: asyncio.Event | None = None,
+) -> None:
+    session_factory = session_factory or database.SessionLocal
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        async with session_factory() as db:
+            job = await jobs.claim(db, owner)
+        if job is None:
+            with suppress(TimeoutError):
+                await asyncio.wait_for(stop.wait(), poll_seconds)
+            continue
+        await run_job(job, owner, session_factory)
+
+
+async def run_worker(concurrency: int) -> None:
+    database.init_engine()
+    await turns.start_llm()
+    if turns.llm is None:
+        raise SystemExit("OPENAI_API_KEY is not set")
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    usage.start()
+    try:
+        await asyncio.gather(*(work(f"{prefix}:{i}") for i in range(concurrency)))
+    finally:
+        await usage.stop()
+        await turns.close_llm()
+        await database.dispose()
+
+
+def _process_main(concurrency: int) -> None:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker(concurrency))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued chat turns")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        _process_main(args.concurrency)
+    else:
+        procs = [
+            multiprocessing.Process(target=_process_main, args=(args.concurrency,))
+            for _ in range(args.processes)
+        ]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()